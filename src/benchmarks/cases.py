@@ -0,0 +1,594 @@
+import os
+import shutil
+import tempfile
+from functools import cached_property
+import numpy as np
+import pandas as pd
+
+from modules import chart_functions, table_functions, utility_functions
+from modules import count_cube as cc
+from modules import exports
+from modules import columnar_store as cs
+from modules import date_time_functions as dt
+from modules import manifest as mf
+from modules import narrative_index as ni
+from modules import query_backend as qb
+from modules import bitmap_index as bi
+from modules import row_index as ri
+from modules.downsampling import MAX_CHART_POINTS, lttb_indices
+from modules.excel_ingest import read_workbook
+from modules.figure_cache import FigureCache
+from modules.schema import CONSULTATION_SCHEMA, PRODUCT_SCHEMA, apply_schema
+from modules.search_index import SearchIndex
+from modules.term_frequencies import TermFrequencies
+from etl import data_cleaning, inventory_cleaning
+from .synthetic_data import ABBREVIATIONS_FILE, generate_consultations, generate_products
+
+# Rows shown on one page of the consultations page, for the card rendering cases
+PAGE_ROWS = 500
+
+# Every benchmark, in the order they run
+CASES = []
+
+
+class BenchmarkCase:
+    """
+    One timed operation.
+
+    Args:
+        name (str): Unique name, e.g. 'count_cube.build_count_cube'.
+        prepare (callable): Takes a Workload and returns the zero-argument callable to time.
+                            It is called again before every repeat, so anything it does is
+                            left out of the timing and stateful steps start from scratch.
+        max_rows (int, optional): Largest workload the case runs on, for steps such as
+                                  Excel I/O that are impractical at millions of rows.
+    """
+
+    def __init__(self, name, prepare, max_rows=None):
+        self.name = name
+        self.prepare = prepare
+        self.max_rows = max_rows
+
+    def runs_at(self, rows):
+        return self.max_rows is None or rows <= self.max_rows
+
+
+def benchmark(name, max_rows=None):
+    """Registers the decorated prepare function as a benchmark case."""
+    def register(prepare):
+        CASES.append(BenchmarkCase(name, prepare, max_rows))
+        return prepare
+    return register
+
+
+class Workload:
+    """
+    Synthetic data of one size, plus the files and structures built from it.
+
+    Everything is generated on first use and kept for the remaining cases, under a
+    scratch directory that close() removes.
+
+    Args:
+        rows (int): Number of consultations, and of products across the VMD sheets.
+        seed (int): Seed of the synthetic data generator.
+    """
+
+    def __init__(self, rows, seed=0):
+        self.rows = rows
+        self.seed = seed
+        self.directory = tempfile.mkdtemp(prefix=f"benchmark_{rows}_")
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def scratch(self):
+        """Returns a new empty directory for a case that writes files."""
+        return tempfile.mkdtemp(dir=self.directory)
+
+    @cached_property
+    def consultations(self):
+        return data_cleaning.clean_data(generate_consultations(self.rows, self.seed))
+
+    @cached_property
+    def products(self):
+        return generate_products(self.rows, self.seed)
+
+    @cached_property
+    def current_products(self):
+        return self.products["CurrentAuthorisedProducts"]
+
+    @cached_property
+    def page(self):
+        return self.consultations.head(PAGE_ROWS)
+
+    @cached_property
+    def cube(self):
+        return cc.build_count_cube(self.consultations)
+
+    @cached_property
+    def daily_counts(self):
+        return cc.build_daily_counts(self.consultations)
+
+    @cached_property
+    def abbreviations(self):
+        return utility_functions.get_abbreviations_dict(ABBREVIATIONS_FILE)
+
+    @cached_property
+    def consultation_csv(self):
+        filepath = self.path("consultations.csv")
+        self.consultations.to_csv(filepath, index=False)
+        return filepath
+
+    @cached_property
+    def row_index_dir(self):
+        index_dir = self.path("row_index")
+        ri.build_row_index(self.consultation_csv, index_dir=index_dir)
+        return index_dir
+
+    @cached_property
+    def sql_database(self):
+        filepath = self.path(os.path.basename(qb.SQL_DATABASE_FILE))
+        qb.write_sql_database(self.consultations, filepath)
+        return filepath
+
+    @cached_property
+    def consultation_store(self):
+        root = self.path("consultations")
+        cs.write_consultation_store(self.consultations, root)
+        return root
+
+    @cached_property
+    def consultations_xlsx(self):
+        filepath = self.path("savsnet_data.xlsx")
+        generate_consultations(self.rows, self.seed).to_excel(filepath, index=False)
+        return filepath
+
+    @cached_property
+    def products_xlsx(self):
+        filepath = self.path("vmd_database.xlsx")
+        with pd.ExcelWriter(filepath) as writer:
+            for sheet_name, df in self.products.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+        return filepath
+
+    @cached_property
+    def search_index(self):
+        return SearchIndex(self.current_products, ["Name", "ActiveSubstances", "TargetSpecies"])
+
+    @cached_property
+    def term_frequencies(self):
+        return TermFrequencies(self.current_products["ActiveSubstances"])
+
+
+# Largest workload for cases that read or write Excel workbooks
+EXCEL_MAX_ROWS = 100_000
+
+# Largest workload for cases that build per-row Python structures
+INDEX_MAX_ROWS = 1_000_000
+
+
+## chart_functions
+
+@benchmark("chart_functions.create_mpc_bar_chart")
+def _(workload):
+    return lambda: chart_functions.create_mpc_bar_chart(workload.consultations, "MPC")
+
+
+@benchmark("chart_functions.create_mpc_bar_chart[cube]")
+def _(workload):
+    return lambda: chart_functions.create_mpc_bar_chart(workload.cube, "MPC", count_column="Counts")
+
+
+@benchmark("chart_functions.plot_consultation_heatmap")
+def _(workload):
+    return lambda: chart_functions.plot_consultation_heatmap(workload.consultations)
+
+
+@benchmark("chart_functions.plot_consultation_heatmap[cube]")
+def _(workload):
+    return lambda: chart_functions.plot_consultation_heatmap(workload.cube, count_column="Counts")
+
+
+@benchmark("chart_functions.plot_consultation_frequency")
+def _(workload):
+    return lambda: chart_functions.plot_consultation_frequency(workload.consultations)
+
+
+@benchmark("chart_functions.plot_consultation_frequency[cube]")
+def _(workload):
+    return lambda: chart_functions.plot_consultation_frequency(workload.cube, count_column="Counts")
+
+
+@benchmark("chart_functions.plot_consultation_frequency[daily rollup]")
+def _(workload):
+    rollup = cc.rollup_counts(workload.daily_counts, "Daily")
+    return lambda: chart_functions.plot_consultation_frequency(
+        rollup, count_column="Counts", granularity="Daily", period_column="Period_end"
+    )
+
+
+@benchmark("chart_functions.plot_time_series")
+def _(workload):
+    products = apply_schema(workload.current_products, PRODUCT_SCHEMA)
+    return lambda: chart_functions.plot_time_series(products, "DateOfIssue", "Trend")
+
+
+## exports
+
+@benchmark("exports.write_export[CSV]")
+def _(workload):
+    filepath = workload.path("export.csv")
+    return lambda: exports.write_export(exports.frame_chunks(workload.consultations), "CSV", filepath)
+
+
+@benchmark("exports.write_export[Parquet]")
+def _(workload):
+    filepath = workload.path("export.parquet")
+    return lambda: exports.write_export(exports.frame_chunks(workload.consultations), "Parquet", filepath)
+
+
+@benchmark("exports.write_export[JSON lines]")
+def _(workload):
+    filepath = workload.path("export.jsonl")
+    return lambda: exports.write_export(exports.frame_chunks(workload.consultations), "JSON lines", filepath)
+
+
+## figure_cache
+
+@benchmark("FigureCache.get_or_build[hit]")
+def _(workload):
+    figures = FigureCache()
+    filters = {"species": "Dogs", "years": [2018], "mpc_types": ["vaccination"]}
+    figures.get_or_build("v1", filters, chart_functions.plot_consultation_heatmap, workload.cube, count_column="Counts")
+    return lambda: figures.get_or_build(
+        "v1", filters, chart_functions.plot_consultation_heatmap, workload.cube, count_column="Counts"
+    )
+
+
+## table_functions
+
+@benchmark("table_functions.create_mpc_counts_table")
+def _(workload):
+    return lambda: table_functions.create_mpc_counts_table(workload.consultations).to_html()
+
+
+@benchmark("table_functions.escape_html")
+def _(workload):
+    return lambda: table_functions.escape_html(workload.consultations["Narrative"])
+
+
+@benchmark("table_functions.build_consult_cards_html")
+def _(workload):
+    cards = workload.page.rename(
+        columns={
+            "SAVSNET_consult_id": "Patient Consultation ID",
+            "Narrative": "Consultation Notes",
+            "SAVSNET MPC": "Consultation Type",
+            "Consult_date": "Consultation Date",
+        }
+    )
+    return lambda: table_functions.build_consult_cards_html(cards)
+
+
+@benchmark("table_functions.prepare_and_display_consult_data")
+def _(workload):
+    # A fresh annotator each time, so the narrative cache starts cold
+    annotator = utility_functions.AbbreviationAnnotator(workload.abbreviations)
+    return lambda: table_functions.prepare_and_display_consult_data(workload.page, abbreviations=annotator)
+
+
+## utility_functions
+
+@benchmark("utility_functions.to_pascal_case")
+def _(workload):
+    return lambda: workload.consultations["SAVSNET MPC"].map(utility_functions.to_pascal_case)
+
+
+@benchmark("utility_functions.pascal_to_space_pascal")
+def _(workload):
+    return lambda: workload.current_products["TherapeuticGroup"].map(utility_functions.pascal_to_space_pascal)
+
+
+@benchmark("utility_functions.get_abbreviations_dict")
+def _(workload):
+    return lambda: utility_functions.get_abbreviations_dict(ABBREVIATIONS_FILE)
+
+
+@benchmark("utility_functions.AbbreviationAnnotator")
+def _(workload):
+    return lambda: utility_functions.AbbreviationAnnotator(workload.abbreviations)
+
+
+@benchmark("utility_functions.annotate_abbreviations", max_rows=INDEX_MAX_ROWS)
+def _(workload):
+    narratives = workload.consultations["Narrative"].tolist()
+    return lambda: [utility_functions.annotate_abbreviations(text, workload.abbreviations) for text in narratives]
+
+
+@benchmark("utility_functions.AbbreviationAnnotator.annotate_series", max_rows=INDEX_MAX_ROWS)
+def _(workload):
+    annotator = utility_functions.AbbreviationAnnotator(workload.abbreviations)
+    return lambda: annotator.annotate_series(workload.consultations["Narrative"])
+
+
+@benchmark("utility_functions.load_xlsx", max_rows=EXCEL_MAX_ROWS)
+def _(workload):
+    return lambda: utility_functions.load_xlsx(workload.products_xlsx)
+
+
+## date_time_functions
+
+@benchmark("date_time_functions.day_hour_components")
+def _(workload):
+    return lambda: dt.day_hour_components(workload.consultations["Consult_date"])
+
+
+@benchmark("date_time_functions.day_hour_matrix")
+def _(workload):
+    weekdays, hours = dt.day_hour_components(workload.consultations["Consult_date"])
+    return lambda: dt.day_hour_matrix(weekdays, hours)
+
+
+@benchmark("date_time_functions.extract_day_time")
+def _(workload):
+    return lambda: dt.extract_day_time(workload.consultations)
+
+
+@benchmark("date_time_functions.prepare_time_series_data")
+def _(workload):
+    return lambda: dt.prepare_time_series_data(workload.consultations)
+
+
+## count_cube
+
+@benchmark("count_cube.build_count_cube")
+def _(workload):
+    return lambda: cc.build_count_cube(workload.consultations)
+
+
+@benchmark("count_cube.merge_count_cubes")
+def _(workload):
+    return lambda: cc.merge_count_cubes(workload.cube, workload.cube)
+
+
+@benchmark("count_cube.mpc_counts")
+def _(workload):
+    return lambda: cc.mpc_counts(workload.consultations)
+
+
+@benchmark("count_cube.quarterly_counts")
+def _(workload):
+    return lambda: cc.quarterly_counts(workload.consultations)
+
+
+@benchmark("count_cube.build_daily_counts")
+def _(workload):
+    return lambda: cc.build_daily_counts(workload.consultations)
+
+
+@benchmark("count_cube.rollup_counts[Weekly]")
+def _(workload):
+    return lambda: cc.rollup_counts(workload.daily_counts, "Weekly")
+
+
+@benchmark("count_cube.select_counts")
+def _(workload):
+    # The pandas path of a dashboard selection: one species, one year, two types
+    return lambda: cc.select_counts(workload.cube, species=["cat"], years=[2018], mpc_types=["trauma", "vaccination"])
+
+
+## query_backend
+
+@benchmark("query_backend.write_sql_database")
+def _(workload):
+    filepath = os.path.join(workload.scratch(), os.path.basename(qb.SQL_DATABASE_FILE))
+    return lambda: qb.write_sql_database(workload.consultations, filepath)
+
+
+@benchmark("query_backend.SqlQueryBackend.count_cube")
+def _(workload):
+    backend = qb.SqlQueryBackend(workload.sql_database)
+    return lambda: backend.count_cube(species=["cat"], years=[2018], mpc_types=["trauma", "vaccination"])
+
+
+@benchmark("query_backend.SqlQueryBackend.count_rollup[Weekly]")
+def _(workload):
+    backend = qb.SqlQueryBackend(workload.sql_database)
+    return lambda: backend.count_rollup("Weekly", species=["cat"], years=[2018], mpc_types=["trauma", "vaccination"])
+
+
+## downsampling
+
+@benchmark("downsampling.lttb_indices")
+def _(workload):
+    x = np.arange(workload.rows)
+    y = np.random.default_rng(workload.seed).normal(size=workload.rows).cumsum()
+    return lambda: lttb_indices(x, y, MAX_CHART_POINTS)
+
+
+@benchmark("count_cube.write_count_cube")
+def _(workload):
+    filepath = os.path.join(workload.scratch(), "count_cube.parquet")
+    return lambda: cc.write_count_cube(workload.cube, filepath)
+
+
+## columnar_store
+
+@benchmark("columnar_store.write_consultation_store")
+def _(workload):
+    root = os.path.join(workload.scratch(), "consultations")
+    return lambda: cs.write_consultation_store(workload.consultations, root)
+
+
+@benchmark("columnar_store.read_consultation_store")
+def _(workload):
+    return lambda: cs.read_consultation_store(workload.consultation_store)
+
+
+@benchmark("columnar_store.read_consultation_store[filtered]")
+def _(workload):
+    filter = cs.consultation_filter(species=["cat"], years=[2018], mpc_types=["vaccination", "trauma"])
+    return lambda: cs.read_consultation_store(workload.consultation_store, filter=filter)
+
+
+@benchmark("columnar_store.consultation_partition_years")
+def _(workload):
+    return lambda: cs.consultation_partition_years(workload.consultation_store)
+
+
+@benchmark("columnar_store.write_product_store")
+def _(workload):
+    root = os.path.join(workload.scratch(), "products")
+    return lambda: cs.write_product_store(workload.products, root)
+
+
+## row_index
+
+@benchmark("row_index.build_row_index")
+def _(workload):
+    index_dir = workload.scratch()
+    return lambda: ri.build_row_index(workload.consultation_csv, index_dir=index_dir, rebuild=True)
+
+
+@benchmark("row_index.RowOffsetReader.read_rows")
+def _(workload):
+    reader = ri.RowOffsetReader(workload.consultation_csv, index_dir=workload.row_index_dir)
+    positions = reader.positions(["trauma", "pruritus"])
+    # The last page, the one furthest into the file
+    return lambda: reader.read_rows(positions[-PAGE_ROWS:])
+
+
+## bitmap_index
+
+@benchmark("bitmap_index.build_bitmap_index")
+def _(workload):
+    index_dir = workload.scratch()
+    return lambda: bi.build_bitmap_index(
+        workload.consultation_csv, index_dir=index_dir, row_index_dir=workload.row_index_dir, rebuild=True
+    )
+
+
+@benchmark("bitmap_index.BitmapIndex.positions")
+def _(workload):
+    index = bi.BitmapIndex.from_frame(workload.consultations)
+    years = index.values("Consult_year")
+    # Two types in the last two years, as picked on the consultations page
+    spec = bi.where({"SAVSNET MPC": ["trauma", "pruritus"], "Consult_year": years[-2:]})
+    return lambda: index.positions(spec)
+
+
+## narrative_index
+
+@benchmark("narrative_index.build_narrative_index")
+def _(workload):
+    index_dir = workload.scratch()
+    return lambda: ni.build_narrative_index(
+        workload.consultation_csv, index_dir=index_dir, row_index_dir=workload.row_index_dir, rebuild=True
+    )
+
+
+@benchmark("narrative_index.NarrativeIndex.search")
+def _(workload):
+    index_dir = workload.scratch()
+    ni.build_narrative_index(workload.consultation_csv, index_dir=index_dir, row_index_dir=workload.row_index_dir)
+    index = ni.NarrativeIndex(
+        workload.consultation_csv, ni.synonyms_from_abbreviations(workload.abbreviations), index_dir
+    )
+    # A word, an abbreviation with its synonym phrase, and a prefix
+    return lambda: index.search("lame RF vomit*")
+
+
+## manifest
+
+@benchmark("manifest.build_dataset_manifest")
+def _(workload):
+    return lambda: mf.build_dataset_manifest(workload.consultations, "Consult_date", "SAVSNET MPC")
+
+
+## schema
+
+@benchmark("schema.apply_schema[consultations csv]")
+def _(workload):
+    untyped = pd.read_csv(workload.consultation_csv)
+    return lambda: apply_schema(untyped, CONSULTATION_SCHEMA)
+
+
+## search_index
+
+@benchmark("search_index.SearchIndex", max_rows=INDEX_MAX_ROWS)
+def _(workload):
+    return lambda: SearchIndex(workload.current_products, ["Name", "ActiveSubstances", "TargetSpecies"])
+
+
+@benchmark("search_index.SearchIndex.search", max_rows=INDEX_MAX_ROWS)
+def _(workload):
+    queries = {"Name": "tab", "ActiveSubstances": "meloxicam", "TargetSpecies": "dogs"}
+    return lambda: workload.search_index.search(queries)
+
+
+## term_frequencies
+
+@benchmark("term_frequencies.TermFrequencies", max_rows=INDEX_MAX_ROWS)
+def _(workload):
+    return lambda: TermFrequencies(workload.current_products["ActiveSubstances"])
+
+
+@benchmark("term_frequencies.TermFrequencies.frequencies", max_rows=INDEX_MAX_ROWS)
+def _(workload):
+    positions = np.arange(0, len(workload.current_products), 2)
+    return lambda: workload.term_frequencies.frequencies(positions)
+
+
+## ETL
+
+@benchmark("etl.read_raw_extract", max_rows=EXCEL_MAX_ROWS)
+def _(workload):
+    return lambda: read_workbook(workload.consultations_xlsx, sheet_names=[0])
+
+
+@benchmark("excel_ingest.read_workbook[serial]", max_rows=EXCEL_MAX_ROWS)
+def _(workload):
+    return lambda: read_workbook(workload.products_xlsx, workers=1)
+
+
+@benchmark("excel_ingest.read_workbook[parallel]", max_rows=EXCEL_MAX_ROWS)
+def _(workload):
+    return lambda: read_workbook(workload.products_xlsx)
+
+
+@benchmark("etl.clean_data")
+def _(workload):
+    raw = generate_consultations(workload.rows, workload.seed)
+    return lambda: data_cleaning.clean_data(raw)
+
+
+@benchmark("etl.full_rebuild")
+def _(workload):
+    output_dir = workload.scratch()
+    return lambda: data_cleaning.full_rebuild(workload.consultations, output_dir, os.path.join(output_dir, "store"))
+
+
+@benchmark("etl.incremental_update")
+def _(workload):
+    # Replays the newest 1% of consultations onto a copy of a rebuild made without them
+    consultations = workload.consultations
+    cutoff = len(consultations) - max(1, len(consultations) // 100)
+    output_dir = os.path.join(workload.scratch(), "etl")
+    if not os.path.isdir(workload.path("older")):
+        os.makedirs(workload.path("older"))
+        data_cleaning.full_rebuild(
+            consultations.iloc[:cutoff], workload.path("older"), workload.path("older", "store")
+        )
+    shutil.copytree(workload.path("older"), output_dir)
+    return lambda: data_cleaning.incremental_update(consultations, output_dir, os.path.join(output_dir, "store"))
+
+
+@benchmark("etl.split_excel_to_csv", max_rows=EXCEL_MAX_ROWS)
+def _(workload):
+    output_dir = workload.scratch()
+    return lambda: inventory_cleaning.split_excel_to_csv(
+        workload.products_xlsx, output_dir, os.path.join(output_dir, "store")
+    )
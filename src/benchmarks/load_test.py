@@ -0,0 +1,382 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import numpy as np
+from streamlit.logger import set_log_level
+from streamlit.runtime.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, local_script_runner
+from streamlit.testing.v1.util import patch_config_options
+from modules.figure_cache import FIGURES
+from modules.view_store import VIEWS
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pages")
+RESULTS_FILE = "data/store/benchmarks/load_test.json"
+
+# Seconds a single rerun may take before it counts as failed
+RERUN_TIMEOUT = 120
+
+# Typical words typed into the inventory search boxes
+SEARCH_TERMS = {
+    "Search by Target Species": ["dogs", "cats", "cattle", "horses", "pig", "sheep"],
+    "Search by Active Substances": ["amox", "meloxicam", "fipronil", "ivermectin", "prazi", "enro"],
+    "Search by Therapeutic Group": ["antimicrobial", "vaccine", "nsaid", "anthel", "ecto"],
+}
+
+# Narrative searches typed on the consultations page
+NARRATIVE_QUERIES = ["vomiting", "melox", "lame RF", "D+", '"right fore"', "itch*"]
+
+
+def _widget(widgets, label):
+    # First widget of a kind with the given label
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"No widget labelled '{label}' on the page.")
+
+
+def _pick_option(widgets, label, rng):
+    selectbox = _widget(widgets, label)
+    choices = [index for index in range(len(selectbox.options)) if index != selectbox.index]
+    if choices:
+        selectbox.select_index(rng.choice(choices))
+
+
+def _toggle_option(widgets, label, rng):
+    # Adds or removes one option, always leaving at least one selected
+    multiselect = _widget(widgets, label)
+    option = rng.choice(multiselect.options)
+    if option in multiselect.value and len(multiselect.value) > 1:
+        multiselect.unselect(option)
+    else:
+        multiselect.select(option)
+
+
+def select_dashboard_species(at, rng):
+    radio = _widget(at.radio, "Species")
+    radio.set_value(rng.choice([option for option in radio.options if option != radio.value]))
+
+
+def change_year(at, rng):
+    _pick_option(at.selectbox, "Select Year", rng)
+
+
+def toggle_dashboard_types(at, rng):
+    _toggle_option(at.multiselect, "Select Consultation Types", rng)
+
+
+def select_species(at, rng):
+    _pick_option(at.sidebar.selectbox, "Select Species", rng)
+
+
+def toggle_consult_types(at, rng):
+    _toggle_option(at.sidebar.multiselect, "Filter by Consultation Type:", rng)
+
+
+def search_narratives(at, rng):
+    search = _widget(at.sidebar.text_input, "Search Narratives:")
+    search.input(rng.choice(NARRATIVE_QUERIES + [""]))
+
+
+def change_page_size(at, rng):
+    _pick_option(at.sidebar.selectbox, "Consultations per page", rng)
+
+
+def next_page(at, rng):
+    page = _widget(at.sidebar.number_input, "Page")
+    if page.max is not None and page.value >= page.max:
+        page.set_value(1)
+    else:
+        page.increment()
+
+
+def select_sheet(at, rng):
+    _pick_option(at.selectbox, "Product Inventory", rng)
+
+
+def toggle_controlled_drugs(at, rng):
+    _toggle_option(at.multiselect, "Filter by Controlled Drug", rng)
+
+
+def type_search(at, rng):
+    label = rng.choice(list(SEARCH_TERMS))
+    search = _widget(at.text_input, label)
+    # Either a new term or clearing the box, as users do between searches
+    search.input(rng.choice(SEARCH_TERMS[label] + [""]))
+
+
+# Interactions each simulated user performs on a page, picked at random after the first load
+SCENARIOS = {
+    "01_dashboards": [select_dashboard_species, change_year, toggle_dashboard_types],
+    "02_consultations": [select_species, toggle_consult_types, search_narratives, change_page_size, next_page],
+    "03_inventory": [select_sheet, toggle_controlled_drugs, type_search],
+}
+
+
+def current_rss_mb():
+    """Resident memory of this process in MB, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def page_path(page):
+    return os.path.join(PAGES_DIR, f"{page}.py")
+
+
+@contextmanager
+def shared_runtime():
+    """
+    Lets several AppTest sessions run at the same time in this process.
+
+    AppTest installs a mock runtime and its testing config for each run and removes them
+    when the run ends, which would pull them from under any other session still running.
+    While this is active, both stay in place until every session is done, and the pages
+    are compiled once into a script cache shared by every session, as on a server.
+    """
+    installed = []
+    original_instance = Runtime.instance
+
+    def instance():
+        if Runtime._instance is not None:
+            installed[:] = [Runtime._instance]
+            return Runtime._instance
+        return installed[0] if installed else original_instance()
+
+    def exists():
+        return Runtime._instance is not None or bool(installed)
+
+    script_cache = ScriptCache()
+    with patch.object(Runtime, "instance", staticmethod(instance)), patch.object(
+        Runtime, "exists", staticmethod(exists)
+    ), patch.object(local_script_runner, "ScriptCache", lambda: script_cache), patch_config_options(
+        {"global.appTest": True}
+    ):
+        yield
+
+
+def run_session(page, steps, seed, think_time=0.0, timeout=RERUN_TIMEOUT):
+    """
+    Simulates one user: a first load of the page followed by scripted interactions.
+
+    Args:
+        page (str): Page name, a key of SCENARIOS.
+        steps (int): Number of interactions after the first load.
+        seed (int): Seed of the user's choices.
+        think_time (float): Seconds to wait between interactions.
+        timeout (int): Seconds a single rerun may take before it fails.
+
+    Returns:
+        list: One dict per rerun with the interaction name, its latency in seconds and
+              any exception the page raised.
+    """
+    rng = random.Random(seed)
+    at = AppTest.from_file(page_path(page), default_timeout=timeout)
+    reruns = []
+
+    def timed_run(interaction):
+        start = time.perf_counter()
+        at.run()
+        reruns.append(
+            {
+                "page": page,
+                "interaction": interaction,
+                "latency_s": time.perf_counter() - start,
+                "error": str(at.exception[0].value) if len(at.exception) else None,
+            }
+        )
+
+    timed_run("load")
+    for _ in range(steps):
+        if reruns[-1]["error"]:
+            break
+        interaction = rng.choice(SCENARIOS[page])
+        try:
+            interaction(at, rng)
+        except LookupError as error:
+            reruns.append({"page": page, "interaction": interaction.__name__, "latency_s": 0.0, "error": str(error)})
+            break
+        timed_run(interaction.__name__)
+        if think_time:
+            time.sleep(think_time)
+    return reruns
+
+
+def summarize(reruns, wall_time):
+    """
+    Reduces rerun records to latency percentiles and throughput.
+
+    Args:
+        reruns (list): Records returned by run_session.
+        wall_time (float): Seconds the whole load test took.
+
+    Returns:
+        dict: Rerun count, errors, p50/p95/p99/max latency in ms and reruns per second.
+    """
+    latencies = np.array([rerun["latency_s"] for rerun in reruns if not rerun["error"]])
+    summary = {
+        "reruns": len(reruns),
+        "errors": sum(1 for rerun in reruns if rerun["error"]),
+        "throughput_per_s": len(latencies) / wall_time if wall_time else None,
+    }
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        summary.update(p50_ms=p50, p95_ms=p95, p99_ms=p99, max_ms=latencies.max() * 1000)
+    return summary
+
+
+def load_test(page, sessions, steps, seed=0, think_time=0.0, trace_memory=False):
+    """
+    Runs concurrent simulated sessions against one page in this process.
+
+    Sessions share the process-wide caches, as they do on a Streamlit server, so the
+    numbers show how one server process behaves as users are added. The page is run once
+    before timing starts.
+
+    Args:
+        page (str): Page name, a key of SCENARIOS.
+        sessions (int): Number of concurrent users.
+        steps (int): Interactions per user after the first load.
+        seed (int): Seed of the users' choices; user i gets seed + i.
+        think_time (float): Seconds each user waits between interactions.
+        trace_memory (bool): Also report the peak Python heap with tracemalloc, which
+                             slows the reruns down.
+
+    Returns:
+        dict: The page, the settings, the summary of every rerun, a summary per
+              interaction, memory before and after, and the counters of the shared view
+              store and figure cache.
+    """
+    with shared_runtime():
+        # One untimed run first, so the sessions do not race each other through the first
+        # imports and cache fills, as on a server that has already served the page once
+        AppTest.from_file(page_path(page), default_timeout=RERUN_TIMEOUT).run()
+        # AppTest resets Streamlit's log level on its first run
+        set_log_level("error")
+
+        rss_before = current_rss_mb()
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            futures = [
+                executor.submit(run_session, page, steps, seed + session, think_time)
+                for session in range(sessions)
+            ]
+            reruns = [rerun for future in futures for rerun in future.result()]
+    wall_time = time.perf_counter() - start
+    heap_peak = None
+    if trace_memory:
+        heap_peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    by_interaction = {}
+    for rerun in reruns:
+        by_interaction.setdefault(rerun["interaction"], []).append(rerun)
+    return {
+        "page": page,
+        "sessions": sessions,
+        "steps": steps,
+        "wall_time_s": wall_time,
+        "summary": summarize(reruns, wall_time),
+        "interactions": {
+            interaction: summarize(records, wall_time) for interaction, records in by_interaction.items()
+        },
+        "errors": sorted({rerun["error"] for rerun in reruns if rerun["error"]}),
+        "rss_before_mb": rss_before,
+        "rss_after_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_heap_mb": heap_peak,
+        "view_store": VIEWS.stats(),
+        "figure_cache": FIGURES.stats(),
+    }
+
+
+def _format_ms(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def print_report(report):
+    summary = report["summary"]
+    print(
+        f"{report['page']:<18} {report['sessions']:>4} sessions "
+        f"p50 {_format_ms(summary.get('p50_ms'))} ms  p95 {_format_ms(summary.get('p95_ms'))} ms  "
+        f"p99 {_format_ms(summary.get('p99_ms'))} ms  {summary['throughput_per_s']:.1f} reruns/s  "
+        f"errors {summary['errors']}  peak RSS {_format_ms(report['peak_rss_mb'])} MB",
+        flush=True,
+    )
+    for interaction, stats in report["interactions"].items():
+        print(
+            f"    {interaction:<24} {stats['reruns']:>5} reruns  "
+            f"p50 {_format_ms(stats.get('p50_ms'))} ms  p95 {_format_ms(stats.get('p95_ms'))} ms"
+        )
+    for label, key in [("view store", "view_store"), ("figure cache", "figure_cache")]:
+        views = report[key]
+        print(
+            f"    {label}: {views['hits']} hits, {views['misses']} misses, {views['evictions']} evictions, "
+            f"{views['bytes'] / 2**20:.1f} of {views['budget_bytes'] / 2**20:.0f} MB"
+        )
+    for error in report["errors"]:
+        print(f"    error: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure rerun latency of the pages under concurrent sessions.")
+    parser.add_argument("--pages", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16],
+        help="numbers of concurrent users to try, e.g. 1 4 16 64",
+    )
+    parser.add_argument("--steps", type=int, default=10, help="interactions per user after the first load")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between a user's interactions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="also report the peak Python heap")
+    parser.add_argument("--output", default=RESULTS_FILE, help="where to write the reports")
+    args = parser.parse_args(argv)
+
+    # AppTest runs the pages in this process and never opens a socket, so this stays offline
+    os.environ.setdefault("STREAMLIT_BROWSER_GATHER_USAGE_STATS", "false")
+
+    reports = []
+    for page in args.pages:
+        for sessions in args.sessions:
+            report = load_test(page, sessions, args.steps, args.seed, args.think_time, args.trace_memory)
+            print_report(report)
+            reports.append(report)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(reports, file, indent=4)
+    print(f"Reports written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import numpy as np
+import pandas as pd
+from streamlit.logger import set_log_level
+from benchmarks.cases import CASES, Workload
+
+# Baseline committed with the suite, recorded with the default rows, seed and repeat below;
+# re-record it with --update-baseline on the machine the comparisons run on
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+RESULTS_FILE = "data/store/benchmarks/latest.json"
+
+DEFAULT_ROWS = [10_000, 100_000]
+DEFAULT_SEED = 0
+DEFAULT_REPEAT = 5
+
+# A case regresses when it is this much slower, or uses this much more memory, than the baseline
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.20
+
+
+def measure(case, workload, repeat):
+    """
+    Times one case on one workload.
+
+    Wall time is measured without tracing; peak memory comes from one extra traced run,
+    since tracemalloc slows allocation-heavy code down considerably.
+
+    Args:
+        case (BenchmarkCase): The case to run.
+        workload (Workload): The data to run it on.
+        repeat (int): Number of timed runs.
+
+    Returns:
+        dict: Median and minimum wall time in seconds, and peak traced memory in MB.
+    """
+    timings = []
+    for _ in range(repeat):
+        run = case.prepare(workload)
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    run = case.prepare(workload)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "case": case.name,
+        "rows": workload.rows,
+        "repeat": repeat,
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "peak_mb": peak / 2**20,
+    }
+
+
+def run_benchmarks(rows=DEFAULT_ROWS, repeat=DEFAULT_REPEAT, only=None, seed=DEFAULT_SEED):
+    """
+    Runs every registered case at every workload size.
+
+    Args:
+        rows (list): Workload sizes, in consultations.
+        repeat (int): Number of timed runs per case.
+        only (list, optional): Substrings of the case names to run; all cases when None.
+        seed (int): Seed of the synthetic data.
+
+    Returns:
+        list: One result dict per case and size, as returned by measure().
+    """
+    results = []
+    for size in rows:
+        workload = Workload(size, seed)
+        try:
+            for case in CASES:
+                if only and not any(pattern in case.name for pattern in only):
+                    continue
+                if not case.runs_at(size):
+                    continue
+                result = measure(case, workload, repeat)
+                print(
+                    f"{result['case']:<60} {size:>10,} rows "
+                    f"{result['median_s'] * 1000:>10.1f} ms {result['peak_mb']:>9.1f} MB",
+                    flush=True,
+                )
+                results.append(result)
+        finally:
+            workload.close()
+    return results
+
+
+def environment():
+    """Describes the machine and library versions the results were recorded with."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def write_results(results, filepath, settings):
+    """
+    Writes a results file.
+
+    Args:
+        results (list): Results of a run, as returned by run_benchmarks.
+        filepath (str): File to write.
+        settings (dict): Rows, seed and repeat the run was made with.
+    """
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w") as file:
+        json.dump({"environment": environment(), "settings": settings, "results": results}, file, indent=4)
+
+
+def read_results(filepath):
+    with open(filepath, "r") as file:
+        return json.load(file)
+
+
+def compare_with_baseline(results, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """
+    Compares results with a stored baseline, case by case and size by size.
+
+    Args:
+        results (list): Results of the current run.
+        baseline (dict): A results file written by a previous run.
+        time_tolerance (float): Allowed relative increase of the median wall time.
+        memory_tolerance (float): Allowed relative increase of the peak memory.
+
+    Returns:
+        list: One dict per case and size found in both runs, with the time and memory
+              ratios and whether either exceeds its tolerance.
+    """
+    previous = {(result["case"], result["rows"]): result for result in baseline["results"]}
+    comparisons = []
+    for result in results:
+        reference = previous.get((result["case"], result["rows"]))
+        if reference is None:
+            continue
+        time_ratio = result["median_s"] / max(reference["median_s"], 1e-9)
+        memory_ratio = result["peak_mb"] / max(reference["peak_mb"], 1e-6)
+        comparisons.append(
+            {
+                "case": result["case"],
+                "rows": result["rows"],
+                "time_ratio": time_ratio,
+                "memory_ratio": memory_ratio,
+                "regressed": time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance,
+            }
+        )
+    return comparisons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the modules and ETL steps on synthetic data.")
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=DEFAULT_ROWS,
+        help="workload sizes in consultations, e.g. 10000 100000 1000000 10000000",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs per case")
+    parser.add_argument("--only", nargs="+", help="run only the cases whose name contains one of these")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="seed of the synthetic data")
+    parser.add_argument("--output", default=RESULTS_FILE, help="where to write the results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline results to compare with")
+    parser.add_argument(
+        "--update-baseline",
+        "--save-baseline",
+        dest="update_baseline",
+        action="store_true",
+        help="store these results as the new baseline instead of comparing with it",
+    )
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    # The chart and table functions write to Streamlit, which warns when no app is running
+    set_log_level("error")
+
+    results = run_benchmarks(args.rows, args.repeat, args.only, args.seed)
+    settings = {"rows": args.rows, "seed": args.seed, "repeat": args.repeat}
+    write_results(results, args.output, settings)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        if args.only and os.path.exists(args.baseline):
+            # Only the cases that ran are replaced; the rest of the baseline is kept
+            baseline = read_results(args.baseline)
+            ran = {(result["case"], result["rows"]) for result in results}
+            results = [result for result in baseline["results"] if (result["case"], result["rows"]) not in ran] + results
+        write_results(results, args.baseline, settings)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with; run with --update-baseline to record one.")
+        return
+
+    baseline = read_results(args.baseline)
+    if baseline.get("settings", {}).get("seed", args.seed) != args.seed:
+        print(f"The baseline was recorded with seed {baseline['settings']['seed']}; its data differs from this run's.")
+    comparisons = compare_with_baseline(results, baseline, args.time_tolerance, args.memory_tolerance)
+    regressions = [comparison for comparison in comparisons if comparison["regressed"]]
+    for comparison in comparisons:
+        flag = "REGRESSED" if comparison["regressed"] else ""
+        print(
+            f"{comparison['case']:<60} {comparison['rows']:>10,} rows "
+            f"time x{comparison['time_ratio']:.2f} memory x{comparison['memory_ratio']:.2f} {flag}"
+        )
+    if regressions:
+        print(f"{len(regressions)} of {len(comparisons)} cases regressed against the baseline.")
+        sys.exit(1)
+    print(f"No regressions in {len(comparisons)} cases.")
+
+
+if __name__ == "__main__":
+    main()
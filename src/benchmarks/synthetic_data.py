@@ -0,0 +1,244 @@
+import json
+import numpy as np
+import pandas as pd
+
+ABBREVIATIONS_FILE = "data/raw/commonly_used_terms.json"
+
+# Mix of the real SAVSNET extract, used so group sizes and filters behave like production
+MPC_WEIGHTS = {
+    "vaccination": 0.327,
+    "other_healthy": 0.245,
+    "other_unwell": 0.186,
+    "post_op": 0.086,
+    "trauma": 0.046,
+    "pruritus": 0.045,
+    "gastroenteric": 0.032,
+    "tumour": 0.016,
+    "respiratory": 0.012,
+    "kidney_disease": 0.005,
+}
+SPECIES_WEIGHTS = {
+    "dog": 0.658,
+    "cat": 0.265,
+    "unknown": 0.054,
+    "rabbit": 0.016,
+    "guinea pig": 0.003,
+    "hamster": 0.002,
+    "ferret": 0.002,
+}
+# Monday first, as in pandas' weekday
+WEEKDAY_WEIGHTS = [0.193, 0.186, 0.177, 0.173, 0.185, 0.080, 0.006]
+HOUR_WEIGHTS = {
+    8: 0.020, 9: 0.155, 10: 0.151, 11: 0.091, 12: 0.050, 13: 0.021, 14: 0.087,
+    15: 0.090, 16: 0.108, 17: 0.139, 18: 0.077, 19: 0.010, 20: 0.001,
+}
+
+NARRATIVE_WORDS = (
+    "owner reports eating drinking normally vomiting diarrhoea lethargic bright alert "
+    "weight stable temperature heart lungs clear abdomen soft comfortable palpation "
+    "skin coat ears eyes teeth tartar mild moderate severe wound sutures removed healing "
+    "well discharge lame left right hind fore limb pain meds given advised recheck days "
+    "weeks booster vaccine due next year flea worm treatment applied prescribed tablets "
+    "injection dental scale polish bloods taken results normal kidney liver values "
+    "itchy scratching licking lump mass noted monitor size fine needle aspirate"
+).split()
+
+VMD_SPECIES = ["Dogs", "Cats", "Cats, Dogs", "Cattle", "Pigs", "Horses", "Sheep", "Chickens", "Rabbits"]
+VMD_FORMS = [
+    "Solution for injection",
+    "Spot-on solution",
+    "Tablet",
+    "Chewable tablet",
+    "Suspension for injection",
+    "Oral suspension",
+]
+VMD_GROUPS = [
+    "Antimicrobial",
+    "Ectoparasiticide",
+    "Endectocide",
+    "Anti Inflammatory NSAID",
+    "Anthelmintic",
+    "Live Viral Vaccine",
+]
+VMD_SUBSTANCES = [
+    "Amoxicillin", "Clavulanic Acid", "Meloxicam", "Fipronil", "Ivermectin", "Praziquantel",
+    "Milbemycin Oxime", "Selamectin", "Carprofen", "Enrofloxacin", "Apramycin", "Fluralaner",
+]
+VMD_HOLDERS = [
+    "Elanco Europe Ltd", "Zoetis UK Limited", "Boehringer Ingelheim Animal Health UK Ltd",
+    "Virbac", "Ceva Animal Health Ltd", "Norbrook Laboratories Limited", "Bob Martin (UK) Ltd",
+]
+VMD_ROUTES = {"National": 0.55, "Mutually Recognised": 0.28, "Centralised": 0.11, "National (Informed Consent)": 0.06}
+VMD_TERRITORIES = {"Northern Ireland": 0.40, "Great Britain": 0.39, "United Kingdom": 0.21}
+VMD_CONTROLLED = {"N": 0.971, "3": 0.018, "2": 0.006, "4": 0.005}
+VMD_CATEGORIES = {"POM-V": 0.755, "AVM-GSL": 0.103, "POM-VPS": 0.082, "NFA-VPS": 0.060}
+
+# Share of the product rows each sheet gets, roughly as in the real VMD download
+PRODUCT_SHEET_SHARES = {
+    "CurrentAuthorisedProducts": 0.889,
+    "SuspendedProducts": 0.002,
+    "ExpiredProducts": 0.108,
+    "HomeopathicProducts": 0.001,
+}
+PRODUCT_SHEET_COLUMNS = {
+    "CurrentAuthorisedProducts": [
+        "VMDProductNo", "Name", "MAHolder", "Distributors", "VMNo", "DateOfIssue",
+        "AuthorisationRoute", "Territory", "ActiveSubstances", "ControlledDrug", "TargetSpecies",
+        "DistributionCategory", "PharmaceuticalForm", "TherapeuticGroup", "SPC_Link", "UKPAR_Link",
+        "PAAR_Link",
+    ],
+    "SuspendedProducts": [
+        "VMDProductNo", "Name", "MAHolder", "VMNo", "DateOfIssue", "AuthorisationRoute",
+        "Territory", "ActiveSubstances", "ControlledDrug", "TargetSpecies", "DistributionCategory",
+        "DateOfSuspension", "PharmaceuticalForm", "TherapeuticGroup", "SPC_Link", "UKPAR_Link",
+        "PAAR_Link",
+    ],
+    "ExpiredProducts": [
+        "VMDProductNo", "Name", "MAHolder", "VMNo", "DateOfExpiration", "AuthorisationRoute",
+        "Territory", "ActiveSubstances", "SPC_Link",
+    ],
+    "HomeopathicProducts": [
+        "VMDProductNo", "Name", "MAHolder", "VMNo", "DateOfIssue", "AuthorisationRoute",
+        "Territory", "ActiveSubstances", "ControlledDrug", "TargetSpecies", "DistributionCategory",
+        "PharmaceuticalForm", "TherapeuticGroup",
+    ],
+}
+
+
+def _choice(rng, weights, size):
+    values = list(weights)
+    probabilities = np.asarray(list(weights.values()), dtype="float64")
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=probabilities / probabilities.sum())]
+
+
+def _sentence_pool(rng, abbreviations, size=2000):
+    # Narratives are stitched from a pool of sentences, which keeps 10M rows cheap to
+    # generate while still giving every row its own mix of words and abbreviations
+    vocabulary = NARRATIVE_WORDS + list(abbreviations)
+    sentences = []
+    for _ in range(size):
+        words = rng.choice(vocabulary, size=rng.integers(4, 14)).tolist()
+        sentences.append(" ".join(words).capitalize() + ".")
+    return np.asarray(sentences, dtype=object)
+
+
+def _narratives(rng, n_rows, abbreviations):
+    pool = _sentence_pool(rng, abbreviations)
+    # Long-tailed lengths, around 300 characters on average like the real narratives
+    lengths = np.clip(rng.lognormal(mean=1.6, sigma=0.7, size=n_rows).astype("int64"), 1, 40)
+    picks = rng.integers(0, len(pool), size=int(lengths.sum()))
+    ends = np.cumsum(lengths)
+    sentences = pool[picks]
+    return [" ".join(sentences[end - length : end]) for end, length in zip(ends.tolist(), lengths.tolist())]
+
+
+def _consult_dates(rng, n_rows, start, end):
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    first_monday = start - pd.Timedelta(days=start.weekday())
+    n_weeks = max(1, (end - first_monday).days // 7 + 1)
+    weekdays = rng.choice(7, size=n_rows, p=np.asarray(WEEKDAY_WEIGHTS) / sum(WEEKDAY_WEIGHTS))
+    hour_weights = np.asarray(list(HOUR_WEIGHTS.values()))
+    hours = np.asarray(list(HOUR_WEIGHTS))[rng.choice(len(HOUR_WEIGHTS), size=n_rows, p=hour_weights / hour_weights.sum())]
+    seconds = (
+        rng.integers(0, n_weeks, size=n_rows) * 7 * 86400
+        + weekdays * 86400
+        + hours * 3600
+        + rng.integers(0, 3600, size=n_rows)
+    )
+    dates = first_monday + pd.to_timedelta(seconds, unit="s")
+    # Wrap the few dates that fall outside the range back into it
+    span = (end - start).total_seconds()
+    outside = (dates < start) | (dates > end)
+    offsets = (dates[outside] - start).total_seconds() % span
+    return dates.where(~outside, start + pd.to_timedelta(offsets, unit="s"))
+
+
+def generate_consultations(n_rows, seed=0, start="2014-01-01", end="2019-12-31", abbreviations_file=ABBREVIATIONS_FILE):
+    """
+    Generates SAVSNET-shaped consultations.
+
+    Species, MPC types, weekdays and clinic hours follow the mix of the real extract,
+    and narratives are free text sprinkled with the abbreviations the pages annotate.
+
+    Args:
+        n_rows (int): Number of consultations to generate.
+        seed (int): Seed of the random generator; the same seed gives the same frame.
+        start (str): Earliest consultation date.
+        end (str): Latest consultation date.
+        abbreviations_file (str): JSON file of abbreviations mixed into the narratives.
+
+    Returns:
+        pandas.DataFrame: Columns of the cleaned consultation outputs, ordered by date.
+    """
+    rng = np.random.default_rng(seed)
+    with open(abbreviations_file, "r") as file:
+        abbreviations = [item["Abbreviation"] for item in json.load(file)]
+
+    dates = np.sort(_consult_dates(rng, n_rows, start, end).to_numpy())
+    return pd.DataFrame(
+        {
+            "index": np.arange(n_rows),
+            # Ids rise with the date, as they do in the extract
+            "SAVSNET_consult_id": 9664 + np.arange(n_rows) * 3 + rng.integers(0, 3, size=n_rows),
+            "Narrative": _narratives(rng, n_rows, abbreviations),
+            "SAVSNET MPC": _choice(rng, MPC_WEIGHTS, n_rows),
+            "Consult_date": dates,
+            "Species": _choice(rng, SPECIES_WEIGHTS, n_rows),
+        }
+    )
+
+
+def _product_sheet(rng, sheet_name, n_rows, first_number):
+    numbers = first_number + np.arange(n_rows)
+    substances = np.asarray(VMD_SUBSTANCES, dtype=object)
+    first = substances[rng.integers(0, len(substances), size=n_rows)]
+    second = substances[rng.integers(0, len(substances), size=n_rows)]
+    paired = rng.random(n_rows) < 0.3
+    active = np.where(paired, first + ", " + second, first)
+    forms = np.asarray(VMD_FORMS, dtype=object)[rng.integers(0, len(VMD_FORMS), size=n_rows)]
+    holders = np.asarray(VMD_HOLDERS, dtype=object)[rng.integers(0, len(VMD_HOLDERS), size=n_rows)]
+    dates = pd.Timestamp("1990-01-01") + pd.to_timedelta(rng.integers(0, 12500, size=n_rows), unit="D")
+    documents = "https://www.vmd.defra.gov.uk/productinformationdatabase/files/SPC_Documents/SPC_"
+    columns = {
+        "VMDProductNo": [f"A{number:06d}" for number in numbers.tolist()],
+        "Name": [f"{substance} {form}" for substance, form in zip(first.tolist(), forms.tolist())],
+        "MAHolder": holders,
+        "Distributors": ["<span>" + holder + "</span>" for holder in holders.tolist()],
+        "VMNo": [f"{number % 100000:05d}/{4000 + number % 999}" for number in numbers.tolist()],
+        "DateOfIssue": dates.strftime("%Y-%m-%d"),
+        "DateOfSuspension": dates.strftime("%Y-%m-%d"),
+        "DateOfExpiration": dates.strftime("%Y-%m-%d"),
+        "AuthorisationRoute": _choice(rng, VMD_ROUTES, n_rows),
+        "Territory": _choice(rng, VMD_TERRITORIES, n_rows),
+        "ActiveSubstances": active,
+        "ControlledDrug": _choice(rng, VMD_CONTROLLED, n_rows),
+        "TargetSpecies": np.asarray(VMD_SPECIES, dtype=object)[rng.integers(0, len(VMD_SPECIES), size=n_rows)],
+        "DistributionCategory": _choice(rng, VMD_CATEGORIES, n_rows),
+        "PharmaceuticalForm": forms,
+        "TherapeuticGroup": np.asarray(VMD_GROUPS, dtype=object)[rng.integers(0, len(VMD_GROUPS), size=n_rows)],
+        "SPC_Link": [f"{documents}{number}.PDF" for number in numbers.tolist()],
+        "UKPAR_Link": np.where(rng.random(n_rows) < 0.2, "https://www.vmd.defra.gov.uk/ukpar.pdf", None),
+        "PAAR_Link": np.where(rng.random(n_rows) < 0.1, "https://www.vmd.defra.gov.uk/paar.pdf", None),
+    }
+    return pd.DataFrame({column: columns[column] for column in PRODUCT_SHEET_COLUMNS[sheet_name]})
+
+
+def generate_products(n_rows, seed=0):
+    """
+    Generates VMD-shaped product sheets.
+
+    Args:
+        n_rows (int): Total number of products, shared between the sheets like the real download.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        dict: Sheet name mapped to its pandas.DataFrame, with the columns of that sheet.
+    """
+    rng = np.random.default_rng(seed)
+    sheets = {}
+    first_number = 0
+    for sheet_name, share in PRODUCT_SHEET_SHARES.items():
+        sheet_rows = max(1, int(n_rows * share))
+        sheets[sheet_name] = _product_sheet(rng, sheet_name, sheet_rows, first_number)
+        first_number += sheet_rows
+    return sheets
@@ -1,37 +1,438 @@
 import pandas as pd
 import os
+import sys
+import json
+import argparse
+import tempfile
+from datetime import datetime
 
-# Load the Excel dataset
-data = pd.read_excel("./data/raw/savsnet_data.xlsx")
-output_dir = "./data/cleaned"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from modules.columnar_store import (
+    CONSULTATION_STORE,
+    STORE_DIR,
+    append_consultation_store,
+    read_consultation_store,
+    write_consultation_store,
+)
+from modules.count_cube import (
+    COUNT_CUBE_FILE,
+    DAILY_COUNTS_FILE,
+    DAILY_DIMENSIONS,
+    build_count_cube,
+    GRANULARITIES,
+    build_daily_counts,
+    merge_count_cubes,
+    read_count_cube,
+    rollup_counts,
+    select_counts,
+    write_count_cube,
+)
+from modules.excel_ingest import print_timings, read_workbook
+from modules.bitmap_index import BITMAP_INDEX_DIR, build_bitmap_index
+from modules.narrative_index import NARRATIVE_INDEX_DIR, build_narrative_index
+from modules.query_backend import SQL_DATABASE_FILE, SqlQueryBackend, append_sql_database, write_sql_database
+from modules.row_index import ROW_INDEX_DIR, build_row_index
+from modules.schema import CONSULTATION_SCHEMA, apply_schema, memory_report
+from modules.manifest import (
+    MANIFEST_FILE,
+    build_dataset_manifest,
+    merge_dataset_manifests,
+    read_manifest,
+    write_manifest,
+)
 
-# Data Cleaning
+RAW_FILE = "./data/raw/savsnet_data.xlsx"
+OUTPUT_DIR = "./data/cleaned"
 
-## 0. Handle Missing Values
-data.fillna("Unknown", inplace=True)
+# High-water mark of the last ingested consultation, used by incremental runs
+WATERMARK_FILE = os.path.join(STORE_DIR, "consultations_watermark.json")
 
-## 1. Convert Consult_date to Datetime
-data["Consult_date"] = pd.to_datetime(data["Consult_date"])
+# Written before an incremental run appends anything and removed once its watermark is
+# stored; finding it means the previous run stopped with the outputs half-appended
+PENDING_FILE = os.path.join(STORE_DIR, "consultations_pending.json")
 
-## 2. Standardize Species Names (make lowercase)
-data["Species"] = data["Species"].str.lower()
+SPECIES_OUTPUTS = {
+    "Cats": "cats_consultations.csv",
+    "Dogs": "dogs_consultations.csv",
+    "Other Species": "other_species_consultations.csv",
+}
 
-# Splitting into DataFrames
-df_cats = data[data["Species"] == "cat"]
-df_dogs = data[data["Species"] == "dog"]
-df_other = data[~data["Species"].isin(["cat", "dog"])]  # Catch-all for other species
 
-# Optional: Save the Cleaned DataFrames
-df_cats.to_csv(os.path.join(output_dir, "cats_consultations.csv"), index=False)
-df_dogs.to_csv(os.path.join(output_dir, "dogs_consultations.csv"), index=False)
-df_other.to_csv(
-    os.path.join(output_dir, "other_species_consultations.csv"), index=False
-)
+def clean_data(data):
+    """
+    Cleans raw SAVSNET consultations.
+
+    Args:
+        data (pandas.DataFrame): Rows read from the raw extract.
+
+    Returns:
+        pandas.DataFrame: The cleaned consultations, de-duplicated on consult id and
+                          typed according to CONSULTATION_SCHEMA.
+    """
+    data = data.copy()
+
+    ## 0. Handle Missing Values
+    data.fillna("Unknown", inplace=True)
+
+    ## 1. Standardize Species Names (make lowercase)
+    data["Species"] = data["Species"].str.lower()
+
+    ## 2. Keep the first row seen for each consultation
+    data = data.drop_duplicates("SAVSNET_consult_id")
+
+    ## 3. Parse Consult_date, make the text columns categorical and drop the redundant ones
+    return apply_schema(data, CONSULTATION_SCHEMA)
+
+
+def split_by_species(data):
+    """
+    Splits cleaned consultations into the cats, dogs and other species outputs.
+
+    Args:
+        data (pandas.DataFrame): Cleaned consultations.
+
+    Returns:
+        dict: Output file name mapped to its pandas.DataFrame.
+    """
+    return {
+        SPECIES_OUTPUTS["Cats"]: data[data["Species"] == "cat"],
+        SPECIES_OUTPUTS["Dogs"]: data[data["Species"] == "dog"],
+        # Catch-all for other species
+        SPECIES_OUTPUTS["Other Species"]: data[~data["Species"].isin(["cat", "dog"])],
+    }
+
+
+def store_path(store_dir, default_path):
+    """Locates one of the store's files or directories below another store root."""
+    return os.path.join(store_dir, os.path.relpath(default_path, STORE_DIR))
+
+
+def build_species_manifests(outputs):
+    """Summarizes each species output, keyed by its species label."""
+    return {
+        species: build_dataset_manifest(outputs[filename], "Consult_date", "SAVSNET MPC")
+        for species, filename in SPECIES_OUTPUTS.items()
+    }
+
+
+def outputs_match_columns(columns, output_dir=OUTPUT_DIR):
+    """Whether every species CSV exists and has exactly the given columns, in order."""
+    for filename in SPECIES_OUTPUTS.values():
+        output_file = os.path.join(output_dir, filename)
+        if not os.path.exists(output_file) or list(pd.read_csv(output_file, nrows=0).columns) != list(columns):
+            return False
+    return True
+
+
+def compute_watermark(data):
+    """Returns the latest (Consult_date, SAVSNET_consult_id) pair in the data."""
+    latest = data.sort_values(["Consult_date", "SAVSNET_consult_id"]).iloc[-1]
+    return {
+        "Consult_date": latest["Consult_date"].isoformat(),
+        "SAVSNET_consult_id": int(latest["SAVSNET_consult_id"]),
+    }
+
+
+def read_watermark(filepath=WATERMARK_FILE):
+    """Returns the stored watermark, or None if no run has recorded one yet."""
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, "r") as file:
+        return json.load(file)
+
+
+def write_watermark(watermark, filepath=WATERMARK_FILE):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(f"{filepath}.tmp", "w") as file:
+        json.dump(watermark, file, indent=4)
+    os.replace(f"{filepath}.tmp", filepath)
+
+
+def clear_pending(filepath=PENDING_FILE):
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+
+def rows_after_watermark(data, watermark):
+    """
+    Selects rows strictly after the watermark, ordered on (Consult_date, SAVSNET_consult_id).
+
+    Args:
+        data (pandas.DataFrame): Cleaned consultations.
+        watermark (dict): The stored watermark.
+
+    Returns:
+        pandas.DataFrame: The rows newer than the watermark.
+    """
+    mark_date = pd.Timestamp(watermark["Consult_date"])
+    mark_id = watermark["SAVSNET_consult_id"]
+    newer = (data["Consult_date"] > mark_date) | (
+        (data["Consult_date"] == mark_date) & (data["SAVSNET_consult_id"] > mark_id)
+    )
+    return data[newer]
+
+
+def full_rebuild(data, output_dir=OUTPUT_DIR, store_dir=STORE_DIR):
+    """
+    Rewrites every species output and the columnar store from the cleaned data.
+
+    Args:
+        data (pandas.DataFrame): All cleaned consultations.
+        output_dir (str): Directory for the species CSV files.
+        store_dir (str): Root of the columnar store, watermark and count cube.
+
+    Returns:
+        dict: Output file name mapped to the rows written.
+    """
+    outputs = split_by_species(data)
+    for filename, df in outputs.items():
+        # Replace rather than overwrite, so readers holding the old file keep a consistent copy
+        output_file = os.path.join(output_dir, filename)
+        df.to_csv(f"{output_file}.tmp", index=False)
+        os.replace(f"{output_file}.tmp", output_file)
+        # Byte offset of every row, for page reads that skip the rest of the file
+        build_row_index(output_file, index_dir=store_path(store_dir, ROW_INDEX_DIR), rebuild=True)
+        # Row bitmaps of every year, MPC type and species, for compound page filters
+        build_bitmap_index(
+            output_file,
+            index_dir=store_path(store_dir, BITMAP_INDEX_DIR),
+            row_index_dir=store_path(store_dir, ROW_INDEX_DIR),
+            rebuild=True,
+        )
+        # Inverted index of the narratives, for ranked full-text search
+        build_narrative_index(
+            output_file,
+            index_dir=store_path(store_dir, NARRATIVE_INDEX_DIR),
+            row_index_dir=store_path(store_dir, ROW_INDEX_DIR),
+            rebuild=True,
+        )
+
+    # Typed columnar store partitioned by species and consult year, read by the pages
+    write_consultation_store(data, root=store_path(store_dir, CONSULTATION_STORE))
+    # Precomputed counts behind the dashboard charts
+    write_count_cube(build_count_cube(data), store_path(store_dir, COUNT_CUBE_FILE))
+    # Daily counts the time series granularities are rolled up from
+    write_count_cube(build_daily_counts(data), store_path(store_dir, DAILY_COUNTS_FILE))
+    # Embedded database behind the optional SQL query backend
+    write_sql_database(data, store_path(store_dir, SQL_DATABASE_FILE))
+    # Distinct values, years, row counts and hashes the pages build their widgets from
+    manifest = read_manifest(store_path(store_dir, MANIFEST_FILE))
+    manifest.update(build_species_manifests(outputs))
+    write_manifest(manifest, store_path(store_dir, MANIFEST_FILE))
+    write_watermark(compute_watermark(data), store_path(store_dir, WATERMARK_FILE))
+    clear_pending(store_path(store_dir, PENDING_FILE))
+    return outputs
+
+
+def incremental_update(data, output_dir=OUTPUT_DIR, store_dir=STORE_DIR):
+    """
+    Appends only the consultations newer than the stored watermark.
+
+    Rows already present in the store are skipped, so re-running on the same extract
+    is a no-op. Falls back to a full rebuild when no watermark has been recorded, or
+    when the previous run stopped part way through appending its batch: the CSVs, the
+    store and the aggregates may then each hold a different part of it.
+
+    Args:
+        data (pandas.DataFrame): All cleaned consultations from the raw extract.
+        output_dir (str): Directory for the species CSV files.
+        store_dir (str): Root of the columnar store, watermark and count cube.
+
+    Returns:
+        dict: Output file name mapped to the rows appended.
+    """
+    store_root = store_path(store_dir, CONSULTATION_STORE)
+    cube_file = store_path(store_dir, COUNT_CUBE_FILE)
+    daily_file = store_path(store_dir, DAILY_COUNTS_FILE)
+    database_file = store_path(store_dir, SQL_DATABASE_FILE)
+    manifest_file = store_path(store_dir, MANIFEST_FILE)
+    watermark_file = store_path(store_dir, WATERMARK_FILE)
+    pending_file = store_path(store_dir, PENDING_FILE)
+
+    watermark = read_watermark(watermark_file)
+    manifest = read_manifest(manifest_file)
+    if (
+        watermark is None
+        or not os.path.isdir(store_root)
+        or not os.path.exists(cube_file)
+        or not os.path.exists(daily_file)
+        or not os.path.exists(database_file)
+        or not all(species in manifest for species in SPECIES_OUTPUTS)
+    ):
+        print("No watermark found, running a full rebuild.")
+        return full_rebuild(data, output_dir, store_dir)
+    if os.path.exists(pending_file):
+        print("The previous incremental run did not finish, running a full rebuild.")
+        return full_rebuild(data, output_dir, store_dir)
+    if not outputs_match_columns(data.columns, output_dir):
+        # Appending rows of another shape would corrupt the CSVs and their row index
+        print("Species outputs were written with other columns, running a full rebuild.")
+        return full_rebuild(data, output_dir, store_dir)
+
+    new_rows = rows_after_watermark(data, watermark)
+    existing_ids = read_consultation_store(store_root, columns=["SAVSNET_consult_id"])
+    new_rows = new_rows[~new_rows["SAVSNET_consult_id"].isin(existing_ids["SAVSNET_consult_id"])]
+    outputs = split_by_species(new_rows)
+    if new_rows.empty:
+        return outputs
+
+    # Marks the batch as in progress until its watermark is written
+    write_watermark(compute_watermark(new_rows), pending_file)
+    for filename, df in outputs.items():
+        output_file = os.path.join(output_dir, filename)
+        df.to_csv(output_file, mode="a", header=False, index=False)
+        # Only the appended bytes are scanned, and only the appended rows parsed for the other indexes
+        build_row_index(output_file, index_dir=store_path(store_dir, ROW_INDEX_DIR))
+        build_bitmap_index(
+            output_file,
+            index_dir=store_path(store_dir, BITMAP_INDEX_DIR),
+            row_index_dir=store_path(store_dir, ROW_INDEX_DIR),
+        )
+        build_narrative_index(
+            output_file,
+            index_dir=store_path(store_dir, NARRATIVE_INDEX_DIR),
+            row_index_dir=store_path(store_dir, ROW_INDEX_DIR),
+        )
+
+    append_consultation_store(new_rows, datetime.now().strftime("%Y%m%d%H%M%S%f"), root=store_root)
+    write_count_cube(merge_count_cubes(read_count_cube(cube_file), build_count_cube(new_rows)), cube_file)
+    write_count_cube(
+        merge_count_cubes(read_count_cube(daily_file), build_daily_counts(new_rows), dimensions=DAILY_DIMENSIONS),
+        daily_file,
+    )
+    append_sql_database(new_rows, database_file)
+    for species, batch_manifest in build_species_manifests(outputs).items():
+        manifest[species] = merge_dataset_manifests(manifest[species], batch_manifest)
+    write_manifest(manifest, manifest_file)
+    # Every appended row is past the old watermark, so the new one comes from this batch alone
+    write_watermark(compute_watermark(new_rows), watermark_file)
+    clear_pending(pending_file)
+    return outputs
+
+
+def check_consistency(data, output_dir=OUTPUT_DIR):
+    """
+    Compares the current species outputs with a full rebuild made in a scratch directory.
+
+    Args:
+        data (pandas.DataFrame): All cleaned consultations from the raw extract.
+        output_dir (str): Directory holding the incrementally maintained CSV files.
+
+    Returns:
+        list: Names of the outputs that differ from a full rebuild; empty if consistent.
+    """
+    mismatches = []
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        full_rebuild(data, scratch_dir, os.path.join(scratch_dir, "store"))
+        for filename in SPECIES_OUTPUTS.values():
+            expected = pd.read_csv(os.path.join(scratch_dir, filename))
+            actual = pd.read_csv(os.path.join(output_dir, filename))
+            expected = expected.sort_values("SAVSNET_consult_id").reset_index(drop=True)
+            actual = actual.sort_values("SAVSNET_consult_id").reset_index(drop=True)
+            if not expected.equals(actual):
+                mismatches.append(filename)
+    return mismatches
+
+
+def _same_counts(expected, actual):
+    # Count frames from the two query paths hold the same rows, whatever their order and dtypes
+    dimensions = [column for column in expected.columns if column != "Counts"]
+    frames = []
+    for frame in (expected, actual):
+        frame = frame.astype({column: str for column in ["Species", "SAVSNET MPC"]})
+        frames.append(frame.sort_values(dimensions).reset_index(drop=True))
+    try:
+        pd.testing.assert_frame_equal(frames[0], frames[1], check_dtype=False)
+    except AssertionError:
+        return False
+    return True
+
+
+def check_query_backend(data):
+    """
+    Compares the aggregates of the SQL query backend with those of the pandas path.
+
+    Args:
+        data (pandas.DataFrame): All cleaned consultations.
+
+    Returns:
+        list: Descriptions of the selections whose counts differ; empty if both agree.
+    """
+    cube = build_count_cube(data)
+    rollups = {granularity: rollup_counts(build_daily_counts(data), granularity) for granularity in GRANULARITIES}
+    species = sorted(data["Species"].dropna().astype(str).unique())
+    years = sorted(data["Consult_date"].dt.year.dropna().astype(int).unique())
+    mpc_types = sorted(data["SAVSNET MPC"].dropna().astype(str).unique())
+    selections = [{}, {"species": species[:1]}, {"exclude_species": species[:1]}]
+    selections += [{"species": species[:1], "years": years[-1:], "mpc_types": mpc_types[:2]}]
+
+    mismatches = []
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        database_file = os.path.join(scratch_dir, os.path.basename(SQL_DATABASE_FILE))
+        write_sql_database(data, database_file)
+        backend = SqlQueryBackend(database_file)
+        for selection in selections:
+            if not _same_counts(select_counts(cube, **selection), backend.count_cube(**selection)):
+                mismatches.append(f"count cube {selection}")
+            for granularity, rollup in rollups.items():
+                if not _same_counts(
+                    select_counts(rollup, **selection), backend.count_rollup(granularity, **selection)
+                ):
+                    mismatches.append(f"{granularity} rollup {selection}")
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean the SAVSNET extract into per-species outputs.")
+    parser.add_argument("--full", action="store_true", help="rebuild every output from scratch")
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="compare the memory of each species output as typed and as pandas infers it from the CSV",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="compare the current outputs with a full rebuild, and the SQL backend with pandas, after running",
+    )
+    args = parser.parse_args(argv)
+
+    # Load the Excel dataset; the consultations are on its first sheet
+    sheets, timings = read_workbook(RAW_FILE, sheet_names=[0])
+    print_timings(sheets, timings)
+    data = clean_data(next(iter(sheets.values())))
+
+    if args.full:
+        outputs = full_rebuild(data)
+    else:
+        outputs = incremental_update(data)
+
+    # Print a Summary for Verification
+    for filename, df in outputs.items():
+        print(f"{filename}: {len(df)} rows written")
+        print(df.head())
+
+    if args.memory_report:
+        species_outputs = split_by_species(data)
+        typed = {species: species_outputs[filename] for species, filename in SPECIES_OUTPUTS.items()}
+        untyped = {
+            species: pd.read_csv(os.path.join(OUTPUT_DIR, filename))
+            for species, filename in SPECIES_OUTPUTS.items()
+        }
+        print(memory_report(untyped, typed).to_string())
+
+    if args.check:
+        mismatches = check_consistency(data)
+        if mismatches:
+            print(f"Incremental outputs differ from a full rebuild: {', '.join(mismatches)}")
+            sys.exit(1)
+        print("Incremental outputs match a full rebuild.")
+        mismatches = check_query_backend(data)
+        if mismatches:
+            print(f"SQL query backend differs from pandas: {'; '.join(mismatches)}")
+            sys.exit(1)
+        print("SQL query backend matches pandas.")
+
 
-# Print a Summary for Verification
-print("Cats:")
-print(df_cats.head())
-print("Dogs:")
-print(df_dogs.head())
-print("Other Species:")
-print(df_other.head())
+if __name__ == "__main__":
+    main()
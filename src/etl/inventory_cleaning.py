@@ -1,18 +1,56 @@
-import pandas as pd
+import os
+import sys
 
-def split_excel_to_csv(filepath, output_dir="data/cleaned"):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from modules.columnar_store import PRODUCT_STORE, STORE_DIR, write_product_store
+from modules.excel_ingest import print_timings, read_workbook
+from modules.manifest import MANIFEST_FILE, build_dataset_manifest, read_manifest, write_manifest
+from modules.schema import PRODUCT_SCHEMA, apply_schema, memory_report
+
+def split_excel_to_csv(filepath, output_dir="data/cleaned", store_dir=STORE_DIR, workers=None, report=False):
     """
-    Splits an Excel file into separate CSV files based on sheet names.
+    Splits an Excel file into separate CSV files based on sheet names, and writes
+    the same sheets to the typed columnar store.
 
     Args:
         filepath (str): Path to the input Excel file.
         output_dir (str, optional): Directory to save the output CSV files. 
                                     Defaults to "outputs".
+        store_dir (str, optional): Root of the columnar store and manifest.
+        workers (int, optional): Processes parsing the sheets in parallel; one per sheet,
+                                 up to the number of cores, by default.
+        report (bool): Print the parse time and memory of each sheet once written.
+
+    Returns:
+        dict: Sheet name mapped to the seconds it took to parse.
     """
-    sheets = pd.read_excel(filepath, sheet_name=None)
+    parsed_sheets, timings = read_workbook(filepath, workers=workers)
+    # Dates parsed once here, low-cardinality columns made categorical
+    sheets = {sheet_name: apply_schema(df, PRODUCT_SCHEMA) for sheet_name, df in parsed_sheets.items()}
 
     for sheet_name, df in sheets.items():
+        # Replace rather than overwrite, so pages reading the old file keep a consistent copy
         output_file = f"{output_dir}/{sheet_name}.csv"
-        df.to_csv(output_file, index=False)
-        
-split_excel_to_csv('data/raw/vmd_database.xlsx')
\ No newline at end of file
+        df.to_csv(f"{output_file}.tmp", index=False)
+        os.replace(f"{output_file}.tmp", output_file)
+
+    write_product_store(sheets, root=os.path.join(store_dir, os.path.relpath(PRODUCT_STORE, STORE_DIR)))
+
+    # Row counts, schema and hashes of each sheet, next to the consultation manifests
+    manifest_file = os.path.join(store_dir, os.path.relpath(MANIFEST_FILE, STORE_DIR))
+    manifest = read_manifest(manifest_file)
+    for sheet_name, df in sheets.items():
+        manifest[sheet_name] = build_dataset_manifest(
+            df,
+            "DateOfIssue" if "DateOfIssue" in df.columns else None,
+            "ControlledDrug" if "ControlledDrug" in df.columns else None,
+        )
+    write_manifest(manifest, manifest_file)
+    if report:
+        print_timings(sheets, timings)
+        print(memory_report(parsed_sheets, sheets).to_string())
+    return timings
+
+
+if __name__ == "__main__":
+    split_excel_to_csv('data/raw/vmd_database.xlsx', report=True)
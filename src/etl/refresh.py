@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import traceback
+from datetime import datetime
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from modules.excel_ingest import read_workbook
+from modules.snapshots import (
+    SNAPSHOT_DIR,
+    SNAPSHOT_META,
+    current_snapshot,
+    prune_snapshots,
+    read_snapshot_meta,
+    snapshot_named,
+    swap_current,
+)
+from data_cleaning import RAW_FILE, clean_data, full_rebuild
+from inventory_cleaning import split_excel_to_csv
+
+# Raw workbooks the snapshot is built from, by the outputs they feed
+RAW_FILES = {
+    "consultations": RAW_FILE,
+    "products": "./data/raw/vmd_database.xlsx",
+}
+
+# Seconds between two polls of the raw files
+POLL_INTERVAL = 10.0
+
+# Completed snapshots kept on disk; older ones are deleted after each swap
+KEEP_SNAPSHOTS = 3
+
+# Niceness of the build process, so page reruns keep the CPU while a refresh runs
+WORKER_NICENESS = 10
+
+# Store files a snapshot does not inherit from the one it is built from
+IGNORED_STORE_FILES = shutil.ignore_patterns("profiling", "exports", "*.tmp", "*.tmp.*", "*.old")
+
+
+def stat_fingerprint(filepath):
+    """Cheap fingerprint of a file, compared between polls to see whether it is still being written."""
+    stat = os.stat(filepath)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def content_hash(filepath):
+    """SHA-256 of a file's content, so a raw file touched without changes does not trigger a build."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def changed_sources(fingerprints, recorded):
+    """
+    Finds the raw files that differ from the ones a snapshot was built from.
+
+    Args:
+        fingerprints (dict): Source name mapped to the stat fingerprint of its raw file now.
+        recorded (dict): The snapshot's "sources" metadata; empty for the legacy layout.
+
+    Returns:
+        dict: Changed source name mapped to its new {"stat", "sha256"} record.
+    """
+    changed = {}
+    for source, fingerprint in fingerprints.items():
+        previous = recorded.get(source)
+        if previous is not None and previous["stat"] == fingerprint:
+            continue
+        sha256 = content_hash(RAW_FILES[source])
+        if previous is not None and previous["sha256"] == sha256:
+            continue
+        changed[source] = {"stat": fingerprint, "sha256": sha256}
+    return changed
+
+
+def _copy_snapshot(base, staging):
+    # The new snapshot starts as a copy of the current one; outputs of changed sources are then replaced
+    shutil.copytree(base.data_dir, os.path.join(staging, "cleaned"), ignore=IGNORED_STORE_FILES)
+    if os.path.isdir(base.store_dir):
+        shutil.copytree(base.store_dir, os.path.join(staging, "store"), ignore=IGNORED_STORE_FILES)
+    else:
+        os.makedirs(os.path.join(staging, "store"))
+
+
+def build_snapshot(changed, root=SNAPSHOT_DIR):
+    """
+    Builds a new snapshot from the current one and the changed raw files.
+
+    Runs in the watcher's worker process. Everything is written to a staging directory
+    that is renamed into place once complete, so a half-built snapshot is never visible;
+    if the build fails the staging directory is removed.
+
+    Args:
+        changed (dict): Output of changed_sources for the sources to rebuild.
+        root (str): Directory holding the snapshots.
+
+    Returns:
+        str: Name of the new snapshot, not yet current.
+    """
+    base = current_snapshot(root)
+    name = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    staging = os.path.join(root, f"{name}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        _copy_snapshot(base, staging)
+        snapshot = snapshot_named(f"{name}.tmp", root)
+
+        if "consultations" in changed:
+            sheets, _ = read_workbook(RAW_FILES["consultations"], sheet_names=[0], workers=1)
+            full_rebuild(clean_data(next(iter(sheets.values()))), snapshot.data_dir, snapshot.store_dir)
+        if "products" in changed:
+            split_excel_to_csv(RAW_FILES["products"], snapshot.data_dir, snapshot.store_dir, workers=1)
+
+        sources = {**read_snapshot_meta(base).get("sources", {}), **changed}
+        meta = {"created": time.time(), "base": base.name, "rebuilt": sorted(changed), "sources": sources}
+        with open(os.path.join(staging, SNAPSHOT_META), "w") as meta_file:
+            json.dump(meta, meta_file, indent=4)
+        os.replace(staging, os.path.join(root, name))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return name
+
+
+def remove_staging(root=SNAPSHOT_DIR):
+    """
+    Deletes the staging directories of unfinished builds.
+
+    Only called while no build is running, e.g. after the worker process died in the
+    middle of one and could not clean up after itself.
+
+    Args:
+        root (str): Directory holding the snapshots.
+    """
+    if not os.path.isdir(root):
+        return
+    for entry in os.listdir(root):
+        if entry.endswith(".tmp") and os.path.isdir(os.path.join(root, entry)):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def build_executor():
+    """One low-priority worker process: builds never overlap and never compete with the app for the GIL."""
+    return ProcessPoolExecutor(max_workers=1, initializer=os.nice, initargs=(WORKER_NICENESS,))
+
+
+def refresh_once(executor, force=False, keep=KEEP_SNAPSHOTS, root=SNAPSHOT_DIR):
+    """
+    Builds and swaps in a new snapshot if any raw file changed since the current one.
+
+    Args:
+        executor (concurrent.futures.Executor): Runs the build off the watcher's process.
+        force (bool): Rebuild every source even if none changed.
+        keep (int): Completed snapshots to keep after the swap.
+        root (str): Directory holding the snapshots.
+
+    Returns:
+        str: Name of the new current snapshot, or None if nothing changed.
+    """
+    os.makedirs(root, exist_ok=True)
+    fingerprints = {source: stat_fingerprint(filepath) for source, filepath in RAW_FILES.items()}
+    recorded = {} if force else read_snapshot_meta(current_snapshot(root)).get("sources", {})
+    changed = changed_sources(fingerprints, recorded)
+    if not changed:
+        return None
+    name = executor.submit(build_snapshot, changed, root).result()
+    swap_current(name, root)
+    prune_snapshots(keep, root)
+    return name
+
+
+def watch(interval=POLL_INTERVAL, keep=KEEP_SNAPSHOTS, root=SNAPSHOT_DIR, make_executor=build_executor):
+    """
+    Polls the raw files and refreshes the snapshot whenever one of them changes.
+
+    A file is only picked up once two consecutive polls see the same size and
+    modification time, so a workbook still being copied in is not read half-written.
+    A failed refresh is logged and its staging directory removed; the raw files it
+    failed on are not built again until one of them changes.
+
+    Args:
+        interval (float): Seconds between polls.
+        keep (int): Completed snapshots to keep after each swap.
+        root (str): Directory holding the snapshots.
+        make_executor (callable): Returns the executor the builds run on; called again
+                                  if its worker process dies.
+    """
+    executor = make_executor()
+    previous, failed = None, None
+    try:
+        while True:
+            try:
+                fingerprints = {source: stat_fingerprint(filepath) for source, filepath in RAW_FILES.items()}
+            except OSError:
+                # A raw file is being replaced; wait until it is back and stable
+                fingerprints = None
+            if fingerprints is not None and fingerprints == previous and fingerprints != failed:
+                try:
+                    name = refresh_once(executor, keep=keep, root=root)
+                except Exception as error:
+                    failed = fingerprints
+                    remove_staging(root)
+                    print(
+                        f"{datetime.now():%Y-%m-%d %H:%M:%S} refresh failed, retried once a raw file changes",
+                        file=sys.stderr,
+                        flush=True,
+                    )
+                    traceback.print_exc()
+                    if isinstance(error, BrokenExecutor):
+                        executor.shutdown(wait=False)
+                        executor = make_executor()
+                else:
+                    failed = None
+                    if name is not None:
+                        print(f"{datetime.now():%Y-%m-%d %H:%M:%S} swapped in snapshot {name}", flush=True)
+            previous = fingerprints
+            time.sleep(interval)
+    finally:
+        executor.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rebuild the cleaned outputs into a new snapshot when the raw files change."
+    )
+    parser.add_argument("--watch", action="store_true", help="keep polling the raw files instead of checking once")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between polls")
+    parser.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS, help="completed snapshots to keep")
+    parser.add_argument("--force", action="store_true", help="build a new snapshot even if nothing changed")
+    args = parser.parse_args(argv)
+
+    if args.watch:
+        watch(args.interval, args.keep)
+        return
+    with build_executor() as executor:
+        name = refresh_once(executor, force=args.force, keep=args.keep)
+    print(f"Swapped in snapshot {name}." if name else "Raw files unchanged; snapshot is current.")
+
+
+if __name__ == "__main__":
+    main()
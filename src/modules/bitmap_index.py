@@ -0,0 +1,268 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from .columnar_store import STORE_DIR
+from .profiling import timed
+from .row_index import ROW_INDEX_DIR, read_rows_from, row_prefix_state
+from .search_index import bitmap_to_positions, positions_to_bitmap
+
+# Per-value row bitmaps of the cleaned consultation CSVs, written by the ETL next to the row index
+BITMAP_INDEX_DIR = os.path.join(STORE_DIR, "bitmap_index")
+
+# Columns with one bitmap per distinct value; Consult_year is derived from Consult_date
+BITMAP_COLUMNS = ["Consult_year", "SAVSNET MPC", "Species"]
+
+
+def isin(column, values):
+    """
+    Filter spec matching the rows whose column holds one of the values.
+
+    Args:
+        column (str): One of BITMAP_COLUMNS.
+        values (iterable): Values to match, e.g. [2021, 2022] or ["trauma"].
+
+    Returns:
+        tuple: The spec, hashable and independent of the order of the values.
+    """
+    return ("in", column, tuple(sorted(set(values))))
+
+
+def all_of(*specs):
+    """Filter spec matching the rows every spec matches (AND); every row if none are given."""
+    return ("and",) + specs
+
+
+def any_of(*specs):
+    """Filter spec matching the rows any spec matches (OR); no row if none are given."""
+    return ("or",) + specs
+
+
+def negate(spec):
+    """Filter spec matching the rows the spec does not match."""
+    return ("not", spec)
+
+
+def where(filters):
+    """
+    Builds the AND of one isin spec per column, the shape the page filters take.
+
+    Args:
+        filters (dict): Column mapped to its selected values; None leaves the column unfiltered.
+
+    Returns:
+        tuple: The spec.
+    """
+    return all_of(*[isin(column, values) for column, values in filters.items() if values is not None])
+
+
+class BitmapIndex:
+    """
+    Row bitmaps of every distinct year, MPC type and species of a consultations file.
+
+    Each bitmap is a Python integer with bit i set for row i, built with
+    search_index.positions_to_bitmap, so a compound filter is a few AND/OR operations
+    over precomputed bitmaps instead of boolean masks built from the columns on every rerun.
+
+    Args:
+        bitmaps (dict): Column mapped to {value: bitmap}.
+        size (int): Number of rows the bitmaps cover.
+    """
+
+    def __init__(self, bitmaps, size):
+        self.bitmaps = bitmaps
+        self.size = size
+        self.all_rows = (1 << size) - 1
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Indexes consultations by position.
+
+        Args:
+            df (pandas.DataFrame): Rows in file order, with Consult_date, SAVSNET MPC and Species.
+
+        Returns:
+            BitmapIndex: The index; missing values are in no bitmap.
+        """
+        columns = {
+            "Consult_year": pd.to_datetime(df["Consult_date"], errors="coerce").dt.year,
+            "SAVSNET MPC": df["SAVSNET MPC"],
+            "Species": df["Species"],
+        }
+        bitmaps = {}
+        for column, values in columns.items():
+            groups = pd.Series(np.arange(len(df))).groupby(values.to_numpy()).indices
+            bitmaps[column] = {
+                int(value) if column == "Consult_year" else str(value): positions_to_bitmap(positions, len(df))
+                for value, positions in groups.items()
+            }
+        return cls(bitmaps, len(df))
+
+    def extend(self, other):
+        """
+        Appends the rows of another index after the rows of this one.
+
+        Args:
+            other (BitmapIndex): Index of the appended rows.
+
+        Returns:
+            BitmapIndex: A new index covering both.
+        """
+        bitmaps = {}
+        for column in BITMAP_COLUMNS:
+            ours, theirs = self.bitmaps.get(column, {}), other.bitmaps.get(column, {})
+            bitmaps[column] = {
+                value: ours.get(value, 0) | (theirs.get(value, 0) << self.size)
+                for value in list(ours) + [value for value in theirs if value not in ours]
+            }
+        return BitmapIndex(bitmaps, self.size + other.size)
+
+    def values(self, column):
+        """Sorted distinct values of an indexed column."""
+        return sorted(self.bitmaps[column])
+
+    def evaluate(self, spec):
+        """
+        Combines the bitmaps a filter spec refers to.
+
+        Args:
+            spec (tuple): Built with isin, all_of, any_of, negate or where. None matches every row.
+
+        Returns:
+            int: Bitmap of the matching rows.
+        """
+        if spec is None:
+            return self.all_rows
+        operator = spec[0]
+        if operator == "in":
+            _, column, values = spec
+            if column not in self.bitmaps:
+                raise ValueError(f"Column '{column}' has no bitmap index.")
+            bitmap = 0
+            for value in values:
+                bitmap |= self.bitmaps[column].get(value, 0)
+            return bitmap
+        if operator == "and":
+            bitmap = self.all_rows
+            for part in spec[1:]:
+                bitmap &= self.evaluate(part)
+                if not bitmap:
+                    break
+            return bitmap
+        if operator == "or":
+            bitmap = 0
+            for part in spec[1:]:
+                bitmap |= self.evaluate(part)
+            return bitmap
+        if operator == "not":
+            return self.all_rows & ~self.evaluate(spec[1])
+        raise ValueError(f"Unknown filter operator '{operator}'.")
+
+    def count(self, spec=None):
+        """Number of rows matching a filter spec, without materializing their positions."""
+        return self.evaluate(spec).bit_count()
+
+    @timed
+    def positions(self, spec=None):
+        """
+        Finds the rows matching a filter spec.
+
+        Args:
+            spec (tuple, optional): The filter. Defaults to every row.
+
+        Returns:
+            numpy.ndarray: Sorted row positions.
+        """
+        return bitmap_to_positions(self.evaluate(spec), self.size)
+
+
+def _bitmap_paths(csv_path, index_dir):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    base = os.path.join(index_dir, name)
+    return f"{base}.bitmaps.npy", f"{base}.bitmaps.json"
+
+
+def read_bitmap_index(csv_path, index_dir=BITMAP_INDEX_DIR):
+    """
+    Loads the bitmap index of a consultations CSV.
+
+    Args:
+        csv_path (str): The indexed CSV file.
+        index_dir (str): Directory holding the index files.
+
+    Returns:
+        BitmapIndex: The index.
+    """
+    bitmaps_path, meta_path = _bitmap_paths(csv_path, index_dir)
+    with open(meta_path, "r") as meta_file:
+        meta = json.load(meta_file)
+    packed = np.load(bitmaps_path, mmap_mode="r")
+    bitmaps = {column: {} for column in BITMAP_COLUMNS}
+    for (column, value), row in zip(meta["bitmaps"], packed):
+        bitmaps[column][value] = int.from_bytes(row.tobytes(), "little")
+    return BitmapIndex(bitmaps, meta["rows"])
+
+
+def _write_bitmap_index(index, csv_path, index_dir, state):
+    bitmaps_path, meta_path = _bitmap_paths(csv_path, index_dir)
+    keys = [(column, value) for column in BITMAP_COLUMNS for value in index.bitmaps[column]]
+    n_bytes = max(1, (index.size + 7) // 8)
+    packed = np.zeros((len(keys), n_bytes), dtype=np.uint8)
+    for row, (column, value) in enumerate(keys):
+        packed[row] = np.frombuffer(index.bitmaps[column][value].to_bytes(n_bytes, "little"), dtype=np.uint8)
+
+    np.save(f"{bitmaps_path}.tmp.npy", packed)
+    os.replace(f"{bitmaps_path}.tmp.npy", bitmaps_path)
+    with open(f"{meta_path}.tmp", "w") as meta_file:
+        json.dump({**state, "bitmaps": keys}, meta_file, indent=4)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+@timed
+def build_bitmap_index(csv_path, index_dir=BITMAP_INDEX_DIR, row_index_dir=ROW_INDEX_DIR, rebuild=False):
+    """
+    Indexes a consultations CSV by year, MPC type and species.
+
+    Rows are located with the file's row index, which must be current. If a bitmap
+    index already exists for a prefix of the file, as after an incremental ETL append,
+    only the rows added since are parsed and their bitmaps appended.
+
+    Args:
+        csv_path (str): The CSV file to index.
+        index_dir (str): Directory to write the index files to.
+        row_index_dir (str): Directory holding the file's row index.
+        rebuild (bool): Ignore any existing index and parse the whole file.
+    """
+    _, meta_path = _bitmap_paths(csv_path, index_dir)
+    os.makedirs(index_dir, exist_ok=True)
+
+    index = BitmapIndex({column: {} for column in BITMAP_COLUMNS}, 0)
+    if os.path.exists(meta_path) and not rebuild:
+        with open(meta_path, "r") as meta_file:
+            meta = json.load(meta_file)
+        previous = row_prefix_state(csv_path, meta["rows"], row_index_dir)
+        if previous is not None and all(meta[key] == value for key, value in previous.items()):
+            index = read_bitmap_index(csv_path, index_dir)
+
+    state = row_prefix_state(csv_path, index_dir=row_index_dir)
+    if state["rows"] > index.size:
+        new_rows = read_rows_from(
+            csv_path,
+            index.size,
+            ["Consult_date", "SAVSNET MPC", "Species"],
+            row_index_dir,
+            dtype={"SAVSNET MPC": str, "Species": str},
+        )
+        index = index.extend(BitmapIndex.from_frame(new_rows))
+
+    _write_bitmap_index(index, csv_path, index_dir, state)
+
+
+def bitmap_index_is_current(csv_path, index_dir=BITMAP_INDEX_DIR):
+    """Tells whether the bitmap index of a CSV file covers the file as it is now."""
+    _, meta_path = _bitmap_paths(csv_path, index_dir)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, "r") as meta_file:
+        return json.load(meta_file)["size"] == os.path.getsize(csv_path)
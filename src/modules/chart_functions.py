@@ -1,20 +1,31 @@
 import plotly.express as px
+import plotly.graph_objects as go
 import pandas as pd
-import streamlit as st
+from . import count_cube as cc
+from .date_time_functions import day_hour_components, day_hour_matrix
+from .downsampling import MAX_CHART_POINTS, downsample_series
+from .profiling import timed
 
-def create_mpc_bar_chart(dataframe, title):
+@timed
+def create_mpc_bar_chart(dataframe, title, count_column=None):
     """
     Creates a bar chart of SAVSNET_MPC counts with hover effects and improved visualization features.
 
     Args:
-        dataframe (pandas.DataFrame): The DataFrame containing the data.
+        dataframe (pandas.DataFrame): The DataFrame containing the data, or a count cube slice.
         title (str): The title for the chart.
+        count_column (str, optional): Column holding pre-aggregated counts, e.g. "Counts"
+                                      for a count cube. Rows are counted when None.
+
+    Returns:
+        tuple: The plotly.graph_objects.Figure bar chart, and the most frequent MPC type
+               as a sentence to show below it.
     """
     # Check if 'SAVSNET MPC' column exists in the dataframe
     if "SAVSNET MPC" not in dataframe.columns:
         raise ValueError("The dataframe does not contain the 'SAVSNET MPC' column.")
 
-    mpc_counts = dataframe["SAVSNET MPC"].value_counts()
+    mpc_counts = cc.mpc_counts(dataframe, count_column)
 
     # Get the index of the maximum count
     max_mpc = mpc_counts.idxmax()
@@ -44,81 +55,56 @@ def create_mpc_bar_chart(dataframe, title):
     fig.update_xaxes(tickfont=dict(size=14))
     fig.update_yaxes(tickfont=dict(size=14))
 
-    # Print the significant values in red and bold below the plot
-    st.markdown(f"<p style='color:red; font-weight:bold;'>Most frequent SAVSNET MPC: {max_mpc}, Count: {max_count}</p>", unsafe_allow_html=True)
-    
-    return fig
-    
+    # The significant values, shown by the page in red and bold below the plot
+    return fig, f"Most frequent SAVSNET MPC: {max_mpc}, Count: {max_count}"
+
+@timed
 def plot_consultation_heatmap(
-    df, date_column="Consult_date", title="Consultation Frequency by Day and Time"
+    df,
+    date_column="Consult_date",
+    title="Consultation Frequency by Day and Time",
+    count_column=None,
+    start_hour=8,
+    end_hour=20,
 ):
     """
     Generates a heatmap showing the frequency of consultations by day of the week and time of day.
 
+    The input frame is only read, never modified.
+
     Args:
-        df (pandas.DataFrame): The DataFrame containing the consultation data.
+        df (pandas.DataFrame): The DataFrame containing the consultation data, or a count cube slice.
         date_column (str): The name of the column containing the consultation date.
         title (str): The title for the heatmap.
+        count_column (str, optional): Column holding pre-aggregated counts. The 'Weekday'
+                                      and 'Hour' columns of the cube are used instead of
+                                      date_column when given.
+        start_hour (int): First hour of the day shown, inclusive.
+        end_hour (int): Last hour of the day shown, inclusive.
 
     Returns:
-        plotly.graph_objects.Figure: The heatmap plot.
+        tuple: The plotly.graph_objects.Figure heatmap, and the busiest day and hour as a
+               sentence to show below it.
+
+    Raises:
+        ValueError: If the hours are outside 0-23 or start_hour is after end_hour.
     """
-    # Ensure 'Consult_date' is a datetime type and extract day and hour
-    if date_column not in df.columns:
-        raise KeyError(f"Column '{date_column}' not found in DataFrame.")
-
-    df[date_column] = pd.to_datetime(df[date_column])
-    df["Day"] = df[date_column].dt.day_name()
-    df["Hour"] = df[date_column].dt.hour
-
-    # Filter hours between 8 AM and 8 PM
-    df_filtered = df[(df["Hour"] >= 8) & (df["Hour"] <= 20)]
-
-    # Convert hour to AM/PM format and sort by day of the week
-    df_filtered["Hour"] = df_filtered["Hour"].apply(
-        lambda x: (
-            "12 PM"
-            if x == 12
-            else "12 AM" if x == 0 else f"{x % 12} {'AM' if x < 12 else 'PM'}"
+    if count_column is not None:
+        heatmap_data = day_hour_matrix(
+            df["Weekday"], df["Hour"], df[count_column], start_hour, end_hour
         )
-    )
-    df_filtered["Hour"] = pd.Categorical(
-        df_filtered["Hour"],
-        categories=[
-            "7 AM", "8 AM", "9 AM", "10 AM", "11 AM",
-            "12 PM", "1 PM", "2 PM", "3 PM", "4 PM", "5 PM", "6 PM", 
-            "7 PM", "8 PM"
-        ],
-        ordered=True,
-    )
-    df_filtered["Day"] = pd.Categorical(
-        df_filtered["Day"],
-        categories=[
-            "Monday",
-            "Tuesday",
-            "Wednesday",
-            "Thursday",
-            "Friday",
-            "Saturday",
-            "Sunday",
-        ],
-        ordered=True,
-    )
-    df_filtered = df_filtered.sort_values(by=["Day", "Hour"])
+    else:
+        if date_column not in df.columns:
+            raise KeyError(f"Column '{date_column}' not found in DataFrame.")
+        weekdays, hours = day_hour_components(df[date_column])
+        heatmap_data = day_hour_matrix(weekdays, hours, None, start_hour, end_hour)
 
-    # Group by day and hour to count consultations
-    heatmap_data = (
-        df_filtered.groupby(["Day", "Hour"]).size().reset_index(name="Counts")
-    )
-
-    # Get the index of the maximum count
-    max_count_index = heatmap_data["Counts"].idxmax()
-    max_count_day = heatmap_data.loc[max_count_index, "Day"]
-    max_count_hour = heatmap_data.loc[max_count_index, "Hour"]
+    # Get the cell with the maximum count
+    max_count_day, max_count_hour = heatmap_data.stack().idxmax()
 
     # Generate the heatmap
     fig = px.imshow(
-        heatmap_data.pivot(index="Day", columns="Hour", values="Counts").fillna(0),
+        heatmap_data,
         labels=dict(x="Hour of Day", y="Day of Week", color="Consultation Count"),
         aspect="auto",
         title=title,
@@ -126,42 +112,99 @@ def plot_consultation_heatmap(
     )
     fig.update_layout(xaxis_title="Hour of Day", yaxis_title="Day of Week")
 
-    # Print the significant values in red and bold below the plot
-    st.markdown(f"<p style='color:red; font-weight:bold;'>Highest patient count observed at {max_count_hour} on {max_count_day}</p>", unsafe_allow_html=True)
+    # The significant values, shown by the page in red and bold below the plot
+    return fig, f"Highest patient count observed at {max_count_hour} on {max_count_day}"
 
-    return fig
 
-
-def plot_consultation_frequency(df, title="Consultation Frequency Over Time"):
+@timed
+def plot_consultation_frequency(
+    df,
+    title="Consultation Frequency Over Time",
+    count_column=None,
+    granularity="Quarterly",
+    period_column="Quarter_end",
+    max_points=MAX_CHART_POINTS,
+):
     """
     Generates a time-series plot showing the frequency of consultations over time.
 
     Args:
-        df (pandas.DataFrame): The DataFrame containing the consultation data.
+        df (pandas.DataFrame): The DataFrame containing the consultation data, a count cube
+                               slice or a rollup slice.
         title (str): The title for the chart.
+        count_column (str, optional): Column holding pre-aggregated counts. The period_column
+                                      is used instead of 'Consult_date'.
+        granularity (str): One of "Daily", "Weekly", "Monthly" or "Quarterly".
+        period_column (str): Period-end column of pre-aggregated counts, 'Quarter_end' for
+                             the count cube or 'Period_end' for a rollup.
+        max_points (int): Most points sent to the browser; longer series are downsampled
+                          with LTTB, which keeps their peaks and troughs.
 
     Returns:
-        plotly.graph_objects.Figure: The time-series plot.
+        tuple: The plotly.graph_objects.Figure time-series plot, and the busiest period as
+               a sentence to show below it.
     """
-    # Create a copy of the DataFrame to avoid modifying the original DataFrame
-    df_copy = df.copy()
+    # Count consultations per period
+    counts = cc.period_counts(df, granularity, count_column, period_column=period_column)
 
-    # Ensure 'Consult_date' is a datetime type
-    df_copy["Consult_date"] = pd.to_datetime(df_copy["Consult_date"])
-    df_copy.set_index("Consult_date", inplace=True)
-
-    # Resample and count consultations per quarter
-    quarterly_counts = df_copy.resample("QE").size().reset_index(name="Counts")
-
-    # Get the index of the maximum count
-    max_count_index = quarterly_counts["Counts"].idxmax()
-    max_count_date = quarterly_counts.loc[max_count_index, "Consult_date"]
+    # Get the index of the maximum count, from the full series rather than the downsampled one
+    max_count_index = counts["Counts"].idxmax()
+    max_count_date = counts.loc[max_count_index, "Consult_date"]
 
     # Generate the plot
-    fig = px.line(quarterly_counts, x="Consult_date", y="Counts", title=title)
+    series = downsample_series(counts, "Consult_date", "Counts", max_points)
+    fig = px.line(series, x="Consult_date", y="Counts", title=title)
     fig.update_layout(xaxis_title="Date", yaxis_title="Number of Consultations")
 
-    # Print the significant values in red and bold below the plot
-    st.markdown(f"<p style='color:red; font-weight:bold;'>Highest consultation count observed on {max_count_date}</p>", unsafe_allow_html=True)
+    # The significant values, shown by the page in red and bold below the plot
+    return fig, f"Highest consultation count observed on {max_count_date}"
+
+
+@timed
+def plot_time_series(df, date_column, title):
+    """
+    Generates a chart of the number of products issued per year, with the count per decade overlaid.
+
+    Args:
+        df (pandas.DataFrame): The products, with a parsed datetime column.
+        date_column (str): The name of the column containing the issue date.
+        title (str): The title for the chart.
+
+    Returns:
+        plotly.graph_objects.Figure: The combined bar and line chart.
+    """
+    # The date column is parsed once by the ETL, so only the year is extracted here
+    years = df[date_column].dt.year.rename('Year')
+
+    # Count number of products per year
+    year_data = years.groupby(years).size().reset_index(name='Count')
+
+    # Group data by decade
+    decades = ((years // 10) * 10).rename('Decade')
+
+    # Count number of products per decade
+    decade_data = decades.groupby(decades).size().reset_index(name='Decade_Count')
+
+    # Create a bar chart for the number of products per year
+    bar_fig = px.bar(year_data, x='Year', y='Count', labels={'Year': 'Year', 'Count': 'Number of Products'})
+
+    # Create a line plot for the number of products per decade
+    line_fig = go.Figure()
+    line_fig.add_trace(go.Scatter(x=decade_data['Decade'], y=decade_data['Decade_Count'],
+                                   mode='lines+markers', name='Decade Count', line=dict(color='blue')))
+
+    # Set the same y-axis range for both plots
+    y_max = max(year_data['Count'].max(), decade_data['Decade_Count'].max())
+    bar_fig.update_yaxes(range=[0, y_max])
+    line_fig.update_yaxes(range=[0, y_max])
+
+    # Combine both plots
+    bar_fig.update_traces(marker_color='rgba(50, 171, 96, 0.7)', marker_line_color='rgba(50, 171, 96, 1)',
+                          marker_line_width=1.5, opacity=0.7)
+    bar_fig.add_trace(line_fig.data[0])
+
+    # Set layout properties
+    bar_fig.update_layout(title=title, xaxis_title='Year', yaxis_title='Number of Products',
+                          legend_title_text='Legend', barmode='overlay', bargap=0.05)
 
-    return fig
\ No newline at end of file
+    return bar_fig
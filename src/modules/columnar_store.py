@@ -0,0 +1,210 @@
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Root of the typed columnar store written by the ETL scripts
+STORE_DIR = "data/store"
+CONSULTATION_STORE = os.path.join(STORE_DIR, "consultations")
+PRODUCT_STORE = os.path.join(STORE_DIR, "products")
+
+# Consultations are partitioned as Species=<species>/Consult_year=<year>/
+CONSULTATION_PARTITIONING = ds.partitioning(
+    pa.schema([("Species", pa.string()), ("Consult_year", pa.int16())]),
+    flavor="hive",
+)
+
+# Text columns are read into Arrow-backed pandas strings, without a Python object per value
+PANDAS_TYPES = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+}
+
+# Low-cardinality text columns stored dictionary-encoded
+DICTIONARY_COLUMNS = [
+    "SAVSNET MPC",
+    "Species",
+    "ControlledDrug",
+    "DistributionCategory",
+    "Territory",
+]
+
+
+def to_arrow_table(df):
+    """
+    Converts a DataFrame to an Arrow table, dictionary-encoding the low-cardinality columns.
+
+    Args:
+        df (pandas.DataFrame): The frame to convert.
+
+    Returns:
+        pyarrow.Table: The typed table.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for column in DICTIONARY_COLUMNS:
+        if column in table.column_names and not pa.types.is_dictionary(
+            table.schema.field(column).type
+        ):
+            position = table.schema.get_field_index(column)
+            table = table.set_column(
+                position, column, table[column].cast(pa.string()).dictionary_encode()
+            )
+    return table
+
+
+def _replace_directory(staging_dir, target_dir):
+    # Swap a freshly written directory into place so readers never see a half-written store
+    previous_dir = f"{target_dir}.old"
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    if os.path.exists(target_dir):
+        os.rename(target_dir, previous_dir)
+    os.rename(staging_dir, target_dir)
+    shutil.rmtree(previous_dir, ignore_errors=True)
+
+
+def write_consultation_store(df, root=CONSULTATION_STORE):
+    """
+    Writes consultations to a Parquet dataset partitioned by species and consult year.
+
+    Args:
+        df (pandas.DataFrame): Cleaned consultations with a datetime 'Consult_date' column.
+        root (str): Directory of the dataset. Any existing dataset is replaced.
+    """
+    df = df.assign(Consult_year=df["Consult_date"].dt.year.astype("int16"))
+    staging_dir = f"{root}.tmp"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    ds.write_dataset(
+        to_arrow_table(df),
+        staging_dir,
+        format="parquet",
+        partitioning=CONSULTATION_PARTITIONING,
+        basename_template="part-{i}.parquet",
+    )
+    _replace_directory(staging_dir, root)
+
+
+def append_consultation_store(df, batch_name, root=CONSULTATION_STORE):
+    """
+    Appends consultations to the partitioned store as new files, leaving existing files untouched.
+
+    Args:
+        df (pandas.DataFrame): Cleaned consultations with a datetime 'Consult_date' column.
+        batch_name (str): Unique name for this batch, used in the file names.
+        root (str): Directory of the dataset.
+    """
+    df = df.assign(Consult_year=df["Consult_date"].dt.year.astype("int16"))
+    ds.write_dataset(
+        to_arrow_table(df),
+        root,
+        format="parquet",
+        partitioning=CONSULTATION_PARTITIONING,
+        basename_template=f"part-{batch_name}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def write_product_store(sheets, root=PRODUCT_STORE):
+    """
+    Writes each product sheet to its own Parquet file.
+
+    Args:
+        sheets (dict): Sheet name mapped to its pandas.DataFrame.
+        root (str): Directory to write the files to.
+    """
+    os.makedirs(root, exist_ok=True)
+    for sheet_name, df in sheets.items():
+        output_file = os.path.join(root, f"{sheet_name}.parquet")
+        pq.write_table(to_arrow_table(df), f"{output_file}.tmp")
+        os.replace(f"{output_file}.tmp", output_file)
+
+
+def consultation_filter(species=None, exclude_species=None, years=None, mpc_types=None, consult_ids=None):
+    """
+    Builds a pushdown filter for the consultation store.
+
+    Species and year conditions prune whole partitions; the remaining conditions are
+    checked against row-group statistics before any data is decoded.
+
+    Args:
+        species (list, optional): Species values to keep.
+        exclude_species (list, optional): Species values to drop.
+        years (list, optional): Consult years to keep.
+        mpc_types (list, optional): 'SAVSNET MPC' values to keep.
+        consult_ids (list, optional): 'SAVSNET_consult_id' values to keep.
+
+    Returns:
+        pyarrow.dataset.Expression or None: The combined filter, or None to read everything.
+    """
+    conditions = []
+    if species is not None:
+        conditions.append(ds.field("Species").isin(list(species)))
+    if exclude_species is not None:
+        conditions.append(~ds.field("Species").isin(list(exclude_species)))
+    if years is not None:
+        conditions.append(ds.field("Consult_year").isin([int(year) for year in years]))
+    if mpc_types is not None:
+        conditions.append(ds.field("SAVSNET MPC").isin(list(mpc_types)))
+    if consult_ids is not None:
+        conditions.append(ds.field("SAVSNET_consult_id").isin([int(i) for i in consult_ids]))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def open_consultation_store(root=CONSULTATION_STORE):
+    """Opens the partitioned consultation dataset without reading any rows."""
+    return ds.dataset(root, format="parquet", partitioning=CONSULTATION_PARTITIONING)
+
+
+def read_consultation_store(root=CONSULTATION_STORE, filter=None, columns=None):
+    """
+    Reads consultations from the store, touching only matching partitions and columns.
+
+    Args:
+        root (str): Directory of the dataset.
+        filter (pyarrow.dataset.Expression, optional): Filter from consultation_filter.
+        columns (list, optional): Columns to read. Defaults to all columns.
+
+    Returns:
+        pandas.DataFrame: The matching consultations.
+    """
+    table = open_consultation_store(root).to_table(filter=filter, columns=columns)
+    return table.to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+def consultation_partition_years(root=CONSULTATION_STORE, filter=None):
+    """
+    Lists the consult years present in the store from partition paths alone.
+
+    Args:
+        root (str): Directory of the dataset.
+        filter (pyarrow.dataset.Expression, optional): Species filter to apply.
+
+    Returns:
+        list: Sorted consult years.
+    """
+    years = set()
+    for fragment in open_consultation_store(root).get_fragments(filter=filter):
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        years.add(int(keys["Consult_year"]))
+    return sorted(years)
+
+
+def read_product_store(sheet_name, root=PRODUCT_STORE, columns=None):
+    """
+    Reads one product sheet from the store.
+
+    Args:
+        sheet_name (str): Sheet name without spaces, e.g. "CurrentAuthorisedProducts".
+        root (str): Directory of the product files.
+        columns (list, optional): Columns to read. Defaults to all columns.
+
+    Returns:
+        pandas.DataFrame: The product data.
+    """
+    table = pq.read_table(os.path.join(root, f"{sheet_name}.parquet"), columns=columns)
+    return table.to_pandas(types_mapper=PANDAS_TYPES.get)
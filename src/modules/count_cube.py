@@ -0,0 +1,238 @@
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+from .columnar_store import STORE_DIR, to_arrow_table
+from .profiling import timed
+
+# Precomputed consultation counts written by the ETL next to the columnar store
+COUNT_CUBE_FILE = os.path.join(STORE_DIR, "count_cube.parquet")
+
+# Consultations per species, MPC type and day, rolled up by the dashboard's time series
+DAILY_COUNTS_FILE = os.path.join(STORE_DIR, "daily_counts.parquet")
+
+# Every combination of these columns gets one row holding its consultation count
+CUBE_DIMENSIONS = [
+    "Species",
+    "Consult_year",
+    "Quarter_end",
+    "SAVSNET MPC",
+    "Weekday",
+    "Hour",
+]
+
+DAILY_DIMENSIONS = ["Species", "Consult_year", "SAVSNET MPC", "Consult_day"]
+
+# Time series granularities mapped to their pandas period alias and period-end frequency
+GRANULARITIES = {
+    "Daily": ("D", "D"),
+    "Weekly": ("W", "W-SUN"),
+    "Monthly": ("M", "ME"),
+    "Quarterly": ("Q", "QE"),
+}
+
+
+def build_count_cube(df, date_column="Consult_date"):
+    """
+    Counts consultations over species x year x quarter x MPC x weekday x hour.
+
+    Args:
+        df (pandas.DataFrame): Consultations with 'Species', 'SAVSNET MPC' and a datetime column.
+        date_column (str): The name of the column containing the consultation date.
+
+    Returns:
+        pandas.DataFrame: One row per non-empty cell, with its count in 'Counts'.
+    """
+    dates = pd.to_datetime(df[date_column])
+    keys = pd.DataFrame(
+        {
+            "Species": df["Species"].astype(str).to_numpy(),
+            "Consult_year": dates.dt.year.astype("int16").to_numpy(),
+            "Quarter_end": dates.dt.to_period("Q").dt.end_time.dt.normalize().to_numpy(),
+            "SAVSNET MPC": df["SAVSNET MPC"].astype(str).to_numpy(),
+            "Weekday": dates.dt.weekday.astype("int8").to_numpy(),
+            "Hour": dates.dt.hour.astype("int8").to_numpy(),
+        }
+    )
+    return keys.groupby(CUBE_DIMENSIONS).size().reset_index(name="Counts")
+
+
+def merge_count_cubes(*cubes, dimensions=CUBE_DIMENSIONS):
+    """
+    Adds several count cubes together, e.g. an existing cube and the cube of a new batch.
+
+    Args:
+        dimensions (list): Key columns of the cubes; DAILY_DIMENSIONS for daily counts.
+
+    Returns:
+        pandas.DataFrame: The combined cube.
+    """
+    combined = pd.concat(cubes, ignore_index=True)
+    for column in ["Species", "SAVSNET MPC"]:
+        combined[column] = combined[column].astype(str)
+    return combined.groupby(dimensions)["Counts"].sum().reset_index()
+
+
+def build_daily_counts(df, date_column="Consult_date"):
+    """
+    Counts consultations per species, MPC type and calendar day.
+
+    Every coarser time series is rolled up from these counts, so the consultations
+    themselves are only scanned once, by the ETL.
+
+    Args:
+        df (pandas.DataFrame): Consultations with 'Species', 'SAVSNET MPC' and a datetime column.
+        date_column (str): The name of the column containing the consultation date.
+
+    Returns:
+        pandas.DataFrame: One row per non-empty day, with its count in 'Counts'.
+    """
+    dates = pd.to_datetime(df[date_column])
+    keys = pd.DataFrame(
+        {
+            "Species": df["Species"].astype(str).to_numpy(),
+            "Consult_year": dates.dt.year.astype("int16").to_numpy(),
+            "SAVSNET MPC": df["SAVSNET MPC"].astype(str).to_numpy(),
+            "Consult_day": dates.dt.normalize().to_numpy(),
+        }
+    )
+    return keys.groupby(DAILY_DIMENSIONS).size().reset_index(name="Counts")
+
+
+def rollup_counts(daily_counts, granularity):
+    """
+    Sums daily counts into periods of the given granularity.
+
+    A week that spans New Year is split into one row per year, so that filtering the
+    rollup by year keeps exactly that year's consultations.
+
+    Args:
+        daily_counts (pandas.DataFrame): Counts written by build_daily_counts.
+        granularity (str): A key of GRANULARITIES.
+
+    Returns:
+        pandas.DataFrame: 'Species', 'Consult_year', 'SAVSNET MPC', 'Period_end' and 'Counts'.
+    """
+    period_alias, _ = GRANULARITIES[granularity]
+    period_end = daily_counts["Consult_day"]
+    if period_alias != "D":
+        period_end = period_end.dt.to_period(period_alias).dt.end_time.dt.normalize()
+    rollup = daily_counts.drop(columns="Consult_day").assign(Period_end=period_end)
+    return (
+        rollup.groupby(["Species", "Consult_year", "SAVSNET MPC", "Period_end"], observed=True)["Counts"]
+        .sum()
+        .reset_index()
+    )
+
+
+def select_counts(counts, species=None, exclude_species=None, years=None, mpc_types=None):
+    """
+    Keeps the rows of a count cube or rollup matching a dashboard selection.
+
+    Args:
+        counts (pandas.DataFrame): A count cube, daily counts or rollup.
+        species (list, optional): 'Species' values to keep.
+        exclude_species (list, optional): 'Species' values to drop.
+        years (list, optional): Consult years to keep.
+        mpc_types (list, optional): 'SAVSNET MPC' values to keep.
+
+    Returns:
+        pandas.DataFrame: The matching rows, with their original index.
+    """
+    mask = pd.Series(True, index=counts.index)
+    if species is not None:
+        mask &= counts["Species"].isin(species)
+    if exclude_species is not None:
+        mask &= ~counts["Species"].isin(exclude_species)
+    if years is not None:
+        mask &= counts["Consult_year"].isin(years)
+    if mpc_types is not None:
+        mask &= counts["SAVSNET MPC"].isin(mpc_types)
+    return counts[mask]
+
+
+def write_count_cube(cube, filepath=COUNT_CUBE_FILE):
+    """Writes a count cube to Parquet, replacing any previous cube atomically."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    pq.write_table(to_arrow_table(cube), f"{filepath}.tmp")
+    os.replace(f"{filepath}.tmp", filepath)
+
+
+def read_count_cube(filepath=COUNT_CUBE_FILE):
+    """Reads a count cube written by write_count_cube."""
+    return pq.read_table(filepath).to_pandas()
+
+
+@timed
+def mpc_counts(dataframe, count_column=None):
+    """
+    Counts consultations per SAVSNET MPC type, most frequent first.
+
+    Args:
+        dataframe (pandas.DataFrame): Raw consultations, or a count cube slice.
+        count_column (str, optional): Column holding pre-aggregated counts. When None,
+                                      every row counts as one consultation.
+
+    Returns:
+        pandas.Series: Counts indexed by MPC type, without empty types.
+    """
+    if count_column is None:
+        counts = dataframe["SAVSNET MPC"].value_counts()
+    else:
+        counts = (
+            dataframe.groupby("SAVSNET MPC", observed=True)[count_column]
+            .sum()
+            .sort_values(ascending=False)
+        )
+        counts.name = "count"
+    # Categorical columns also report the types that were filtered out
+    return counts[counts > 0]
+
+
+@timed
+def period_counts(
+    dataframe,
+    granularity="Quarterly",
+    count_column=None,
+    date_column="Consult_date",
+    period_column="Quarter_end",
+):
+    """
+    Counts consultations per period, including empty periods in between.
+
+    Args:
+        dataframe (pandas.DataFrame): Raw consultations, a count cube slice or a rollup slice.
+        granularity (str): A key of GRANULARITIES.
+        count_column (str, optional): Column holding pre-aggregated counts.
+        date_column (str): Date column of raw consultations.
+        period_column (str): Period-end column of pre-aggregated counts, e.g.
+                             'Quarter_end' for the count cube or 'Period_end' for a rollup.
+
+    Returns:
+        pandas.DataFrame: 'Consult_date' (period end) and 'Counts' columns.
+    """
+    _, frequency = GRANULARITIES[granularity]
+    if count_column is None:
+        dates = pd.to_datetime(dataframe[date_column])
+        counts = pd.Series(1, index=dates).resample(frequency).size()
+    else:
+        counts = dataframe.groupby(period_column)[count_column].sum()
+        if not counts.empty:
+            periods = pd.date_range(counts.index.min(), counts.index.max(), freq=frequency)
+            counts = counts.reindex(periods, fill_value=0)
+    counts.index.name = "Consult_date"
+    return counts.reset_index(name="Counts")
+
+
+def quarterly_counts(dataframe, count_column=None, date_column="Consult_date"):
+    """
+    Counts consultations per calendar quarter, including empty quarters in between.
+
+    Args:
+        dataframe (pandas.DataFrame): Raw consultations, or a count cube slice.
+        count_column (str, optional): Column holding pre-aggregated counts.
+        date_column (str): Date column of raw consultations.
+
+    Returns:
+        pandas.DataFrame: 'Consult_date' (quarter end) and 'Counts' columns.
+    """
+    return period_counts(dataframe, "Quarterly", count_column, date_column)
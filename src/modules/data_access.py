@@ -0,0 +1,747 @@
+import os
+import numpy as np
+import pandas as pd
+import streamlit as st
+from . import columnar_store as cs
+from . import count_cube as cc
+from . import manifest as mf
+from . import narrative_index as ni
+from . import query_backend as qb
+from . import bitmap_index as bi
+from . import exports as ex
+from .row_index import ROW_INDEX_DIR, RowOffsetReader, build_row_index, row_index_is_current
+from .schema import CONSULTATION_SCHEMA, PRODUCT_SCHEMA, apply_schema
+from .search_index import SearchIndex
+from .snapshots import LEGACY_DATA_DIR, active_snapshot, pin_snapshot
+from .term_frequencies import TermFrequencies
+from .utility_functions import get_abbreviations_dict, get_annotator
+from .profiling import timed
+from .view_store import VIEWS
+
+# Directory holding the cleaned datasets written by the ETL scripts run by hand; a
+# background refresh writes them into a snapshot instead, see modules/snapshots.py
+DATA_DIR = LEGACY_DATA_DIR
+
+# Species selector labels mapped to their cleaned consultation files
+CONSULTATION_FILES = {
+    "Cats": "cats_consultations.csv",
+    "Dogs": "dogs_consultations.csv",
+    "Other Species": "other_species_consultations.csv",
+}
+
+# Species selector labels mapped to their 'Species' values; None means everything else
+SPECIES_VALUES = {
+    "Cats": ["cat"],
+    "Dogs": ["dog"],
+    "Other Species": None,
+}
+
+# Abbreviations the narrative search also matches by their meaning
+ABBREVIATIONS_FILE = "data/raw/commonly_used_terms.json"
+
+# Product columns behind the inventory page's search boxes
+PRODUCT_SEARCH_COLUMNS = ["TargetSpecies", "ActiveSubstances", "TherapeuticGroup"]
+
+# Sheets of the VMD product inventory
+PRODUCT_SHEETS = [
+    "CurrentAuthorisedProducts",
+    "SuspendedProducts",
+    "ExpiredProducts",
+    "HomeopathicProducts",
+]
+
+
+def file_version(filepath):
+    """
+    Returns a key that changes whenever the file on disk changes.
+
+    Args:
+        filepath (str): Path to the data file.
+
+    Returns:
+        str: The version key for the file, from its modification time and size.
+    """
+    stat = os.stat(filepath)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+@st.cache_resource(show_spinner=False)
+def _ensure_consultation_store(snapshot):
+    # The ETL normally writes the store; build it from the cleaned CSVs if it has not run yet
+    root = snapshot.store_path(cs.CONSULTATION_STORE)
+    if not os.path.isdir(root):
+        frames = [pd.read_csv(snapshot.data_path(filename)) for filename in CONSULTATION_FILES.values()]
+        cs.write_consultation_store(apply_schema(pd.concat(frames, ignore_index=True), CONSULTATION_SCHEMA), root)
+    return root
+
+
+@st.cache_resource(show_spinner=False)
+def _ensure_product_store(snapshot):
+    root = snapshot.store_path(cs.PRODUCT_STORE)
+    if not os.path.isdir(root):
+        sheets = {
+            sheet_name: apply_schema(pd.read_csv(snapshot.data_path(f"{sheet_name}.csv")), PRODUCT_SCHEMA)
+            for sheet_name in PRODUCT_SHEETS
+        }
+        cs.write_product_store(sheets, root)
+    return root
+
+
+@st.cache_resource(show_spinner=False)
+def _ensure_manifest(snapshot):
+    # Summarize whatever the store holds if the ETL has not written a manifest yet
+    manifest_file = snapshot.store_path(mf.MANIFEST_FILE)
+    manifest = mf.read_manifest(manifest_file)
+    missing_species = [species for species in SPECIES_VALUES if species not in manifest]
+    if missing_species:
+        root = _ensure_consultation_store(snapshot)
+        for species in missing_species:
+            consultations = cs.read_consultation_store(
+                root, filter=cs.consultation_filter(**_species_filter(species))
+            )
+            manifest[species] = mf.build_dataset_manifest(consultations, "Consult_date", "SAVSNET MPC")
+    missing_sheets = [sheet_name for sheet_name in PRODUCT_SHEETS if sheet_name not in manifest]
+    if missing_sheets:
+        root = _ensure_product_store(snapshot)
+        for sheet_name in missing_sheets:
+            products = cs.read_product_store(sheet_name, root)
+            manifest[sheet_name] = mf.build_dataset_manifest(
+                products,
+                "DateOfIssue" if "DateOfIssue" in products.columns else None,
+                "ControlledDrug" if "ControlledDrug" in products.columns else None,
+            )
+    if missing_species or missing_sheets:
+        mf.write_manifest(manifest, manifest_file)
+    return manifest_file
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _read_manifest(manifest_file, version):
+    return mf.read_manifest(manifest_file)
+
+
+def load_manifest():
+    """
+    Loads the manifest of every dataset without touching the data itself.
+
+    Returns:
+        dict: Dataset name (a species label or product sheet name) mapped to its row count,
+              schema, content hash and, where relevant, distinct values, years and date range.
+              The dictionary is shared between sessions and must not be modified.
+    """
+    manifest_file = _ensure_manifest(active_snapshot())
+    return _read_manifest(manifest_file, file_version(manifest_file))
+
+
+@timed
+def dataset_manifest(name):
+    """
+    Returns the manifest entry of one dataset.
+
+    Args:
+        name (str): A species label such as "Cats", or a product sheet name.
+
+    Returns:
+        dict: The dataset's manifest entry.
+    """
+    manifest = load_manifest()
+    key = name if name in manifest else "".join(name.split())
+    if key not in manifest:
+        raise KeyError(f"No manifest entry for dataset '{name}'.")
+    return manifest[key]
+
+
+def consultation_store_version():
+    """
+    Returns a key that changes whenever any consultation dataset changes.
+
+    Built from the content hashes in the manifest, so no data files are scanned.
+
+    Returns:
+        str: The version key.
+    """
+    return "-".join(dataset_manifest(species)["content_hash"] for species in SPECIES_VALUES)
+
+
+def _species_filter(species):
+    if species is None:
+        return {}
+    if species not in SPECIES_VALUES:
+        raise ValueError(f"Unknown species '{species}'.")
+    if SPECIES_VALUES[species] is None:
+        named = [value for values in SPECIES_VALUES.values() if values for value in values]
+        return {"exclude_species": named}
+    return {"species": SPECIES_VALUES[species]}
+
+
+def _as_key(values):
+    return None if values is None else tuple(values)
+
+
+@timed
+def _read_consultations(root, species, years, mpc_types, consult_ids, columns, version):
+    expression = cs.consultation_filter(
+        years=years, mpc_types=mpc_types, consult_ids=consult_ids, **_species_filter(species)
+    )
+    consultations = cs.read_consultation_store(
+        root, filter=expression, columns=None if columns is None else list(columns)
+    )
+    # Species comes back from the partition paths as plain strings
+    return apply_schema(consultations, CONSULTATION_SCHEMA)
+
+
+@timed
+def read_consultations(species=None, years=None, mpc_types=None, consult_ids=None, columns=None):
+    """
+    Reads consultations from the columnar store with filter and column pushdown.
+
+    Only the partitions for the requested species and years are opened, and only the
+    requested columns are decoded. Results are shared by every session through the
+    byte-budgeted view store.
+
+    Args:
+        species (str, optional): One of "Cats", "Dogs" or "Other Species". Defaults to all.
+        years (list, optional): Consult years to keep.
+        mpc_types (list, optional): 'SAVSNET MPC' values to keep.
+        consult_ids (list, optional): 'SAVSNET_consult_id' values to keep.
+        columns (list, optional): Columns to read. Defaults to all columns.
+
+    Returns:
+        pandas.DataFrame: A view of the matching consultations.
+    """
+    root = _ensure_consultation_store(active_snapshot())
+    spec = (species, _as_key(years), _as_key(mpc_types), _as_key(consult_ids), _as_key(columns))
+    version = consultation_store_version()
+    frame = VIEWS.get_or_compute(
+        ("consultations", root, version) + spec, lambda: _read_consultations(root, *spec, version)
+    )
+    return frame.copy(deep=False)
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _consultation_years(root, species, version):
+    return cs.consultation_partition_years(
+        root, filter=cs.consultation_filter(**_species_filter(species))
+    )
+
+
+@timed
+def consultation_years(species=None):
+    """
+    Lists the consult years available for a species without reading any rows.
+
+    Args:
+        species (str, optional): One of "Cats", "Dogs" or "Other Species". Defaults to all.
+
+    Returns:
+        list: Sorted consult years.
+    """
+    root = _ensure_consultation_store(active_snapshot())
+    return _consultation_years(root, species, consultation_store_version())
+
+
+@st.cache_resource(show_spinner=False)
+def _ensure_count_cube(snapshot):
+    filepath = snapshot.store_path(cc.COUNT_CUBE_FILE)
+    if not os.path.exists(filepath):
+        root = _ensure_consultation_store(snapshot)
+        consultations = cs.read_consultation_store(root, columns=["Species", "SAVSNET MPC", "Consult_date"])
+        cc.write_count_cube(cc.build_count_cube(consultations), filepath)
+    return filepath
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+@timed
+def _read_count_cube(filepath, version):
+    return cc.read_count_cube(filepath)
+
+
+@timed
+def load_count_cube(species=None, years=None, mpc_types=None):
+    """
+    Loads the slice of the precomputed count cube matching a dashboard selection.
+
+    The cube holds one row per species, year, quarter, MPC type, weekday and hour with
+    its consultation count in 'Counts', so its size does not grow with consultation volume.
+    Slices are shared by every session through the view store. With the "sql" query
+    backend the same rows are aggregated by the embedded database instead.
+
+    Args:
+        species (str, optional): One of "Cats", "Dogs" or "Other Species". Defaults to all.
+        years (list, optional): Consult years to keep.
+        mpc_types (list, optional): 'SAVSNET MPC' values to keep.
+
+    Returns:
+        pandas.DataFrame: The matching cube rows.
+    """
+    if qb.QUERY_BACKEND == "sql":
+        backend, version = load_query_backend()
+        key = ("sql_count_cube", version, species, _as_key(years), _as_key(mpc_types))
+        frame = VIEWS.get_or_compute(
+            key, lambda: backend.count_cube(**_selection(species, years, mpc_types))
+        )
+        return frame.copy(deep=False)
+
+    filepath = _ensure_count_cube(active_snapshot())
+    version = file_version(filepath)
+    key = ("count_cube", filepath, version, species, _as_key(years), _as_key(mpc_types))
+    frame = VIEWS.get_or_compute(
+        key, lambda: _select_counts(_read_count_cube(filepath, version), species, years, mpc_types)
+    )
+    return frame.copy(deep=False)
+
+
+def _selection(species, years, mpc_types):
+    # Filters of a dashboard selection, as taken by select_counts and the SQL backend
+    return {**_species_filter(species), "years": years, "mpc_types": mpc_types}
+
+
+def _select_counts(counts, species, years, mpc_types):
+    # Rows of a count cube or rollup matching a dashboard selection
+    return cc.select_counts(counts, **_selection(species, years, mpc_types))
+
+
+@st.cache_resource(show_spinner=False)
+def _ensure_sql_database(snapshot, engine, database_file):
+    # Keyed by engine and file name as well, since both follow query_backend's settings
+    filepath = snapshot.store_path(database_file)
+    if not os.path.exists(filepath):
+        root = _ensure_consultation_store(snapshot)
+        consultations = cs.read_consultation_store(
+            root, columns=["SAVSNET_consult_id", "Species", "SAVSNET MPC", "Consult_date"]
+        )
+        qb.write_sql_database(consultations, filepath)
+    return filepath
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _query_backend(filepath, engine, version):
+    return qb.SqlQueryBackend(filepath)
+
+
+def load_query_backend():
+    """
+    Returns the embedded database backend, building the database if the ETL has not.
+
+    Returns:
+        tuple: (query_backend.SqlQueryBackend, version of the database file).
+    """
+    filepath = _ensure_sql_database(active_snapshot(), qb.SQL_ENGINE, qb.SQL_DATABASE_FILE)
+    version = file_version(filepath)
+    return _query_backend(filepath, qb.SQL_ENGINE, version), f"{qb.SQL_ENGINE}-{filepath}-{version}"
+
+
+@st.cache_resource(show_spinner=False)
+def _ensure_daily_counts(snapshot):
+    filepath = snapshot.store_path(cc.DAILY_COUNTS_FILE)
+    if not os.path.exists(filepath):
+        root = _ensure_consultation_store(snapshot)
+        consultations = cs.read_consultation_store(root, columns=["Species", "SAVSNET MPC", "Consult_date"])
+        cc.write_count_cube(cc.build_daily_counts(consultations), filepath)
+    return filepath
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+@timed
+def _count_rollup(filepath, granularity, version):
+    # Rolled up once per granularity and version of the daily counts, for every session
+    return cc.rollup_counts(cc.read_count_cube(filepath), granularity)
+
+
+@timed
+def load_count_rollup(granularity, species=None, years=None, mpc_types=None):
+    """
+    Loads consultation counts per period for a dashboard selection.
+
+    Args:
+        granularity (str): One of "Daily", "Weekly", "Monthly" or "Quarterly".
+        species (str, optional): One of "Cats", "Dogs" or "Other Species". Defaults to all.
+        years (list, optional): Consult years to keep.
+        mpc_types (list, optional): 'SAVSNET MPC' values to keep.
+
+    Returns:
+        pandas.DataFrame: The matching rows, with their period end in 'Period_end' and
+                          their count in 'Counts'.
+    """
+    if granularity not in cc.GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'.")
+    if qb.QUERY_BACKEND == "sql":
+        backend, version = load_query_backend()
+        key = ("sql_count_rollup", version, granularity, species, _as_key(years), _as_key(mpc_types))
+        frame = VIEWS.get_or_compute(
+            key, lambda: backend.count_rollup(granularity, **_selection(species, years, mpc_types))
+        )
+        return frame.copy(deep=False)
+
+    filepath = _ensure_daily_counts(active_snapshot())
+    version = file_version(filepath)
+    key = ("count_rollup", filepath, version, granularity, species, _as_key(years), _as_key(mpc_types))
+    frame = VIEWS.get_or_compute(
+        key, lambda: _select_counts(_count_rollup(filepath, granularity, version), species, years, mpc_types)
+    )
+    return frame.copy(deep=False)
+
+
+def _consultation_csv(species):
+    # The species' cleaned CSV in the active snapshot
+    if species not in CONSULTATION_FILES:
+        raise ValueError(f"Unknown species '{species}'.")
+    snapshot = active_snapshot()
+    return snapshot, snapshot.data_path(CONSULTATION_FILES[species])
+
+
+def _ensure_row_index(snapshot, csv_path):
+    # The ETL maintains the index; build or extend it here if it is missing or behind
+    row_index_dir = snapshot.store_path(ROW_INDEX_DIR)
+    if not row_index_is_current(csv_path, row_index_dir):
+        build_row_index(csv_path, index_dir=row_index_dir)
+    return row_index_dir
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+@timed
+def _row_reader(snapshot, csv_path, version):
+    row_index_dir = _ensure_row_index(snapshot, csv_path)
+    return RowOffsetReader(csv_path, index_dir=row_index_dir, schema=CONSULTATION_SCHEMA)
+
+
+@timed
+def load_row_reader(species):
+    """
+    Returns a memory-mapped reader over one species' cleaned consultations CSV.
+
+    The reader finds rows by MPC type from the ETL's row-offset index and parses only
+    the rows asked for, so reading a page costs the same whatever the file size.
+
+    Args:
+        species (str): One of "Cats", "Dogs" or "Other Species".
+
+    Returns:
+        RowOffsetReader: The reader for the current version of the file.
+    """
+    snapshot, csv_path = _consultation_csv(species)
+    return _row_reader(snapshot, csv_path, file_version(csv_path))
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+@timed
+def _bitmap_index(snapshot, csv_path, version):
+    # The ETL maintains both indexes; build or extend them here if they are missing or behind
+    row_index_dir = _ensure_row_index(snapshot, csv_path)
+    index_dir = snapshot.store_path(bi.BITMAP_INDEX_DIR)
+    if not bi.bitmap_index_is_current(csv_path, index_dir):
+        bi.build_bitmap_index(csv_path, index_dir=index_dir, row_index_dir=row_index_dir)
+    return bi.read_bitmap_index(csv_path, index_dir)
+
+
+@timed
+def load_bitmap_index(species):
+    """
+    Returns the year, MPC type and species bitmaps of one species' consultations CSV.
+
+    Args:
+        species (str): One of "Cats", "Dogs" or "Other Species".
+
+    Returns:
+        bitmap_index.BitmapIndex: The index for the current version of the file, whose
+                                  positions line up with the reader from load_row_reader.
+    """
+    snapshot, csv_path = _consultation_csv(species)
+    return _bitmap_index(snapshot, csv_path, file_version(csv_path))
+
+
+@timed
+def load_row_positions(species, spec=None):
+    """
+    Finds the rows of one species' consultations matching a filter spec.
+
+    The spec is evaluated over the precomputed bitmaps of load_bitmap_index. Each
+    selection is computed once per version of the file and shared by every session
+    through the view store.
+
+    Args:
+        species (str): One of "Cats", "Dogs" or "Other Species".
+        spec (tuple, optional): Filter built with bitmap_index.where, isin, all_of,
+                                any_of or negate, e.g. where({"SAVSNET MPC": types}).
+                                Defaults to every row.
+
+    Returns:
+        numpy.ndarray: Sorted, read-only row positions for the reader from load_row_reader.
+    """
+    snapshot, csv_path = _consultation_csv(species)
+    index = _bitmap_index(snapshot, csv_path, file_version(csv_path))
+    return VIEWS.get_or_compute(
+        ("row_positions", csv_path, file_version(csv_path), spec),
+        lambda: index.positions(spec),
+    )
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+@timed
+def _narrative_index(snapshot, csv_path, version):
+    # The ETL maintains both indexes; build or extend them here if they are missing or behind
+    row_index_dir = _ensure_row_index(snapshot, csv_path)
+    index_dir = snapshot.store_path(ni.NARRATIVE_INDEX_DIR)
+    if not ni.narrative_index_is_current(csv_path, index_dir):
+        ni.build_narrative_index(csv_path, index_dir=index_dir, row_index_dir=row_index_dir)
+    synonyms = ni.synonyms_from_abbreviations(get_abbreviations_dict(ABBREVIATIONS_FILE))
+    return ni.NarrativeIndex(csv_path, synonyms, index_dir)
+
+
+@timed
+def search_narratives(species, query):
+    """
+    Ranks one species' consultations by how well their narratives match a query.
+
+    Each query is ranked once per version of the file and shared by every session
+    through the view store, so paging through the results does not search again.
+
+    Args:
+        species (str): One of "Cats", "Dogs" or "Other Species".
+        query (str): Words, "quoted phrases" and prefix* words that must all match.
+
+    Returns:
+        numpy.ndarray: Read-only row positions for the reader from load_row_reader, best
+                       match first; None when the query has no words.
+    """
+    snapshot, csv_path = _consultation_csv(species)
+    version = file_version(csv_path)
+    query = " ".join(query.split())
+
+    def rank():
+        results = _narrative_index(snapshot, csv_path, version).search(query)
+        return None if results is None else results[0]
+
+    return VIEWS.get_or_compute(("narrative_search", csv_path, version, query), rank)
+
+
+def select_consultation_rows(species, spec=None, query=""):
+    """
+    Finds the consultations the history page shows for its filters and narrative search.
+
+    Args:
+        species (str): One of "Cats", "Dogs" or "Other Species".
+        spec (tuple, optional): Filter spec, as for load_row_positions.
+        query (str): Narrative search; ignored when it has no words.
+
+    Returns:
+        numpy.ndarray: Row positions for the reader from load_row_reader: best match
+                       first when searching, in file order otherwise.
+    """
+    positions = load_row_positions(species, spec)
+    ranked = search_narratives(species, query)
+    if ranked is None:
+        return positions
+    # Best matches first, keeping only the rows the filters select
+    return ranked[np.isin(ranked, positions, assume_unique=True)]
+
+
+@timed
+def export_consultations(species, spec=None, query="", export_format="CSV", annotated=False):
+    """
+    Writes the consultations a history page selection shows to a new export file.
+
+    Rows are read, serialized and written a chunk at a time, so memory stays bounded
+    whatever the size of the selection. The file is private to the calling session.
+
+    Args:
+        species (str): One of "Cats", "Dogs" or "Other Species".
+        spec (tuple, optional): Filter spec, as for load_row_positions.
+        query (str): Narrative search, as for search_narratives.
+        export_format (str): A key of exports.EXPORT_FORMATS.
+        annotated (bool): Add an 'Annotated_narrative' column with the abbreviations spelled out.
+
+    Returns:
+        str: Path of the export file, in exports.EXPORT_DIR.
+    """
+    transform = None
+    if annotated:
+        annotator = get_annotator(get_abbreviations_dict(ABBREVIATIONS_FILE))
+
+        def transform(chunk):
+            return chunk.assign(Annotated_narrative=annotator.expand_series(chunk["Narrative"]))
+
+    chunks = ex.row_chunks(load_row_reader(species), select_consultation_rows(species, spec, query), transform)
+    filepath = ex.new_export_path(export_format)
+    ex.write_export(chunks, export_format, filepath)
+    return filepath
+
+
+@timed
+def load_consultations(species):
+    """
+    Loads all consultations for one species.
+
+    Args:
+        species (str): One of "Cats", "Dogs" or "Other Species".
+
+    Returns:
+        pandas.DataFrame: A view of the cached consultation data.
+    """
+    if species not in SPECIES_VALUES:
+        raise ValueError(f"Unknown species '{species}'.")
+    return read_consultations(species)
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+@timed
+def _read_products(root, sheet_name, version):
+    # The one base copy of a sheet per process; column subsets and filters are views of it
+    products = cs.read_product_store(sheet_name, root)
+    # A no-op for stores the ETL wrote; parses the dates of stores written before the schema
+    return apply_schema(products, PRODUCT_SCHEMA)
+
+
+def _product_sheet(sheet_name):
+    # The sheet's store root in the active snapshot, its name without spaces, and its version
+    root = _ensure_product_store(active_snapshot())
+    sheet_name = "".join(sheet_name.split())
+    return root, sheet_name, file_version(os.path.join(root, f"{sheet_name}.parquet"))
+
+
+def product_version(sheet_name):
+    """
+    Returns the version key of a product sheet in the columnar store.
+
+    Args:
+        sheet_name (str): The sheet name, e.g. "Current Authorised Products".
+
+    Returns:
+        str: The version key, which changes whenever the sheet is rewritten.
+    """
+    root, sheet_name, version = _product_sheet(sheet_name)
+    return f"{root}-{version}"
+
+
+@timed
+def load_products(sheet_name, columns=None):
+    """
+    Loads one sheet of the VMD product inventory from the columnar store.
+
+    Args:
+        sheet_name (str): The sheet name, e.g. "Current Authorised Products".
+        columns (list, optional): Columns to read. Defaults to all columns.
+
+    Returns:
+        pandas.DataFrame: A view of the cached product data.
+    """
+    root, sheet_name, version = _product_sheet(sheet_name)
+    if columns is None:
+        return _read_products(root, sheet_name, version).copy(deep=False)
+    frame = VIEWS.get_or_compute(
+        ("products", root, sheet_name, version, _as_key(columns)),
+        lambda: _read_products(root, sheet_name, version)[list(columns)],
+    )
+    return frame.copy(deep=False)
+
+
+@timed
+def load_filtered_products(sheet_name, controlled_drugs=None, search_queries=None):
+    """
+    Loads the products of a sheet matching the inventory page's filters.
+
+    Each combination of filters is computed once per version of the sheet and shared
+    by every session through the view store.
+
+    Args:
+        sheet_name (str): The sheet name, e.g. "Current Authorised Products".
+        controlled_drugs (list, optional): 'ControlledDrug' values to keep. All when empty.
+        search_queries (dict, optional): Search column mapped to the query typed for it.
+                                         Empty queries are ignored.
+
+    Returns:
+        pandas.DataFrame: A view of the matching products, indexed by row position in
+                          the sheet.
+    """
+    root, sheet_name, version = _product_sheet(sheet_name)
+    drugs = tuple(sorted(controlled_drugs)) if controlled_drugs else None
+    queries = tuple(
+        sorted((column, query) for column, query in (search_queries or {}).items() if query and query.strip())
+    )
+    if not drugs and not queries:
+        # Nothing to filter: the base copy itself, rather than a second copy of it
+        return _read_products(root, sheet_name, version).copy(deep=False)
+
+    def select():
+        products = _read_products(root, sheet_name, version)
+        mask = np.ones(len(products), dtype=bool)
+        if drugs:
+            mask &= products["ControlledDrug"].isin(drugs).to_numpy()
+        if queries:
+            matches = np.zeros(len(products), dtype=bool)
+            matches[_product_search_index(root, sheet_name, version).search(dict(queries))] = True
+            mask &= matches
+        return products[mask]
+
+    frame = VIEWS.get_or_compute(("filtered_products", root, sheet_name, version, drugs, queries), select)
+    return frame.copy(deep=False)
+
+
+@timed
+def export_products(sheet_name, controlled_drugs=None, search_queries=None, export_format="CSV"):
+    """
+    Writes the products an inventory page selection shows to a new export file.
+
+    The products are serialized a chunk at a time, so no second copy of them is built
+    in memory. The file is private to the calling session.
+
+    Args:
+        sheet_name (str): The sheet name, e.g. "Current Authorised Products".
+        controlled_drugs (list, optional): As for load_filtered_products.
+        search_queries (dict, optional): As for load_filtered_products.
+        export_format (str): A key of exports.EXPORT_FORMATS.
+
+    Returns:
+        str: Path of the export file, in exports.EXPORT_DIR.
+    """
+    products = load_filtered_products(sheet_name, controlled_drugs, search_queries)
+    filepath = ex.new_export_path(export_format)
+    ex.write_export(ex.frame_chunks(products), export_format, filepath)
+    return filepath
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+@timed
+def _product_search_index(root, sheet_name, version):
+    return SearchIndex(_read_products(root, sheet_name, version), PRODUCT_SEARCH_COLUMNS)
+
+
+@timed
+def load_product_search_index(sheet_name):
+    """
+    Returns the token and prefix index over a product sheet's search columns.
+
+    The index is built once per version of the sheet and shared by every session. Row
+    positions it returns line up with the index of the frame from load_products.
+
+    Args:
+        sheet_name (str): The sheet name, e.g. "Current Authorised Products".
+
+    Returns:
+        SearchIndex: The search index for the sheet.
+    """
+    return _product_search_index(*_product_sheet(sheet_name))
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+@timed
+def _product_term_frequencies(root, sheet_name, column, version):
+    return TermFrequencies(_read_products(root, sheet_name, version)[column])
+
+
+@timed
+def load_term_frequencies(sheet_name, column):
+    """
+    Returns the per-row term counts of a product sheet's text column.
+
+    Counts are computed once per version of the sheet and shared by every session.
+
+    Args:
+        sheet_name (str): The sheet name, e.g. "Current Authorised Products".
+        column (str): The text column, e.g. "ActiveSubstances".
+
+    Returns:
+        TermFrequencies: The term counts, addressed by row position.
+    """
+    root, sheet_name, version = _product_sheet(sheet_name)
+    return _product_term_frequencies(root, sheet_name, column, version)
@@ -1,5 +1,94 @@
+import numpy as np
 import pandas as pd
+from .profiling import timed
 
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def hour_label(hour):
+    """Formats an hour of the day (0-23) as a 12-hour clock label such as "9 AM"."""
+    if hour == 0:
+        return "12 AM"
+    if hour == 12:
+        return "12 PM"
+    return f"{hour % 12} {'AM' if hour < 12 else 'PM'}"
+
+
+@timed
+def day_hour_components(dates):
+    """
+    Returns the weekday (Monday=0) and hour of each timestamp as integer arrays.
+
+    Args:
+        dates (pandas.Series): Timestamps, or strings parseable as timestamps.
+
+    Returns:
+        tuple: (weekdays, hours) numpy arrays, with -1 where the timestamp is missing.
+    """
+    dates = pd.to_datetime(dates)
+    # Work on the underlying nanosecond integers; no per-row Python and no copy of the frame
+    nanoseconds = dates.to_numpy(dtype="datetime64[ns]").view("int64")
+    missing = dates.isna().to_numpy()
+    hours_since_epoch = nanoseconds // 3_600_000_000_000
+    days_since_epoch = hours_since_epoch // 24
+    # 1970-01-01 was a Thursday
+    weekdays = (days_since_epoch + 3) % 7
+    hours = hours_since_epoch % 24
+    weekdays[missing] = -1
+    hours[missing] = -1
+    return weekdays, hours
+
+
+def check_hour_window(start_hour, end_hour):
+    """
+    Validates the hours of a day shown by a heatmap.
+
+    Raises:
+        ValueError: If either hour is not an integer from 0 to 23, or start_hour is after end_hour.
+    """
+    for name, hour in (("start_hour", start_hour), ("end_hour", end_hour)):
+        if isinstance(hour, bool) or not isinstance(hour, (int, np.integer)) or not 0 <= hour <= 23:
+            raise ValueError(f"{name} must be an hour from 0 to 23, got {hour!r}.")
+    if start_hour > end_hour:
+        raise ValueError(f"start_hour ({start_hour}) is after end_hour ({end_hour}).")
+
+
+@timed
+def day_hour_matrix(weekdays, hours, weights=None, start_hour=8, end_hour=20):
+    """
+    Counts events into a weekday x hour matrix in a single binned pass.
+
+    Args:
+        weekdays (array-like): Weekday of each event, Monday=0.
+        hours (array-like): Hour of each event, 0-23.
+        weights (array-like, optional): Count carried by each event, e.g. from a count cube.
+        start_hour (int): First hour shown, inclusive.
+        end_hour (int): Last hour shown, inclusive.
+
+    Returns:
+        pandas.DataFrame: Counts with weekday names as rows and hour labels as columns.
+
+    Raises:
+        ValueError: If the hours are outside 0-23 or start_hour is after end_hour.
+    """
+    check_hour_window(start_hour, end_hour)
+    weekdays = np.asarray(weekdays, dtype="int64")
+    hours = np.asarray(hours, dtype="int64")
+    n_hours = end_hour - start_hour + 1
+    in_window = (hours >= start_hour) & (hours <= end_hour) & (weekdays >= 0) & (weekdays <= 6)
+    bins = weekdays[in_window] * n_hours + (hours[in_window] - start_hour)
+    if weights is not None:
+        weights = np.asarray(weights, dtype="float64")[in_window]
+    counts = np.bincount(bins, weights=weights, minlength=7 * n_hours).reshape(7, n_hours)
+    matrix = pd.DataFrame(
+        counts.astype("int64"),
+        index=pd.Index(DAY_NAMES, name="Day"),
+        columns=pd.Index([hour_label(hour) for hour in range(start_hour, end_hour + 1)], name="Hour"),
+    )
+    return matrix
+
+
+@timed
 def extract_day_time(df):
     """
     Extracts day of the week and hour from the 'Consult_date' column.
@@ -8,24 +97,28 @@ def extract_day_time(df):
         df (pandas.DataFrame): DataFrame containing the 'Consult_date' column.
     
     Returns:
-        pandas.DataFrame: DataFrame with added 'Day' and 'Hour' columns.
+        pandas.DataFrame: A new DataFrame with added 'Day' and 'Hour' columns; df is left unchanged.
     """
-    df['Consult_date'] = pd.to_datetime(df['Consult_date'])
-    df['Day'] = df['Consult_date'].dt.day_name()
-    df['Hour'] = df['Consult_date'].dt.hour
-    return df
+    weekdays, hours = day_hour_components(df['Consult_date'])
+    day_names = np.array(DAY_NAMES + [None], dtype=object)
+    return df.assign(
+        Consult_date=pd.to_datetime(df['Consult_date']),
+        Day=day_names[weekdays],
+        Hour=pd.array(np.where(hours >= 0, hours, None), dtype="Int64"),
+    )
 
+@timed
 def prepare_time_series_data(df):
     """
     Prepares data for time-series analysis by aggregating consultation counts by date.
     
     Args:
-        df (pandas.DataFrame): DataFrame with 'Consult_date' column.
+        df (pandas.DataFrame): DataFrame with 'Consult_date' column. It is left unchanged.
     
     Returns:
         pandas.DataFrame: Aggregated DataFrame with 'Consult_date' and 'Counts'.
     """
-    df['Consult_date'] = pd.to_datetime(df['Consult_date']).dt.date
-    aggregated_data = df.groupby('Consult_date').size().reset_index(name='Counts')
+    days = pd.to_datetime(df['Consult_date']).dt.date
+    aggregated_data = days.groupby(days).size().rename_axis('Consult_date').reset_index(name='Counts')
     return aggregated_data
 
@@ -0,0 +1,81 @@
+import numpy as np
+from .profiling import timed
+
+# Most points a time series chart sends to the browser
+MAX_CHART_POINTS = 1000
+
+
+@timed
+def lttb_indices(x, y, n_out):
+    """
+    Picks the points of a series to keep with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points in between are split into
+    n_out - 2 buckets, and from each bucket the point forming the largest triangle with
+    the previously kept point and the average of the next bucket is kept. Peaks and
+    troughs survive, unlike with plain striding or averaging.
+
+    Args:
+        x (array-like): Increasing x values, e.g. dates as int64 nanoseconds.
+        y (array-like): Values of the series.
+        n_out (int): Number of points to keep, at least 3.
+
+    Returns:
+        numpy.ndarray: Sorted positions of the kept points; every position when the
+                       series has no more than n_out points.
+
+    Raises:
+        ValueError: If the series has more than n_out points and n_out is below 3.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+    if n_out < 3:
+        raise ValueError(f"LTTB keeps at least 3 points, got n_out={n_out}.")
+
+    # Bucket boundaries over the inner points 1 .. n - 2
+    edges = np.linspace(1, n - 1, n_out - 1).astype("int64")
+    # Average of each bucket, plus the last point standing in for the bucket after the last
+    sums_x = np.add.reduceat(x[1 : n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1 : n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    next_x = np.append(sums_x[1:] / sizes[1:], x[-1])
+    next_y = np.append(sums_y[1:] / sizes[1:], y[-1])
+
+    kept = np.empty(n_out, dtype="int64")
+    kept[0] = 0
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # Twice the triangle area; the constant factor does not change the argmax
+        areas = np.abs(
+            (x[previous] - next_x[bucket]) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    kept[-1] = n - 1
+    return kept
+
+
+def downsample_series(frame, x_column, y_column, max_points=MAX_CHART_POINTS):
+    """
+    Reduces a time series frame to at most max_points rows, keeping its shape.
+
+    Args:
+        frame (pandas.DataFrame): The series, sorted by x_column.
+        x_column (str): Column of increasing x values, numeric or datetime.
+        y_column (str): Column of values.
+        max_points (int): Most rows to return.
+
+    Returns:
+        pandas.DataFrame: The kept rows; the frame itself when it is short enough.
+    """
+    if len(frame) <= max_points:
+        return frame
+    x = frame[x_column].to_numpy()
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").view("int64")
+    return frame.iloc[lttb_indices(x, frame[y_column].to_numpy(), max_points)]
@@ -0,0 +1,262 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from .columnar_store import STORE_DIR
+from .profiling import timed
+
+# Export files written by the pages, one per session and selection; private to the server,
+# never served as static files
+EXPORT_DIR = os.path.join(STORE_DIR, "exports")
+
+# Rows read, serialized and written at a time; bounds the memory of an export of any size
+EXPORT_CHUNK_ROWS = 20_000
+
+# Seconds an export file is kept once its session stops showing it, e.g. after the session ended
+EXPORT_MAX_AGE_SECONDS = 3600
+
+# Seconds between two sweeps of the export directory for files past EXPORT_MAX_AGE_SECONDS
+EXPORT_PRUNE_INTERVAL_SECONDS = 60
+
+# Largest export offered for download; the download button holds the whole file in memory
+EXPORT_MAX_DOWNLOAD_BYTES = int(float(os.environ.get("DASHBOARD_EXPORT_MAX_DOWNLOAD_MB", "200")) * 2**20)
+
+# Format offered on the pages mapped to its file extension and MIME type
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "JSON lines": ("jsonl", "application/x-ndjson"),
+}
+
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def frame_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Splits a frame that is already in memory into chunks, without copying it.
+
+    Args:
+        df (pandas.DataFrame): The rows to export.
+        chunk_rows (int): Rows per chunk.
+
+    Yields:
+        pandas.DataFrame: Consecutive slices of df; a single empty one if df is empty.
+    """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start : start + chunk_rows]
+
+
+def row_chunks(reader, positions, transform=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Reads rows of a CSV file chunk by chunk, so no more than one chunk is ever parsed at once.
+
+    Args:
+        reader (RowOffsetReader): Reader of the file.
+        positions (numpy.ndarray): Row positions to export, in export order.
+        transform (callable, optional): Applied to each chunk, e.g. to add columns.
+        chunk_rows (int): Rows per chunk.
+
+    Yields:
+        pandas.DataFrame: The rows of each chunk of positions; a single empty one if there are none.
+    """
+    for start in range(0, max(len(positions), 1), chunk_rows):
+        chunk = reader.read_rows(positions[start : start + chunk_rows])
+        yield chunk if transform is None else transform(chunk)
+
+
+def _portable_type(arrow_type):
+    # Every chunk is written with the same types, whatever pandas downcast or inferred for it
+    if pa.types.is_integer(arrow_type):
+        return pa.int64()
+    if pa.types.is_floating(arrow_type):
+        return pa.float64()
+    if pa.types.is_dictionary(arrow_type):
+        return pa.dictionary(pa.int32(), pa.string())
+    if pa.types.is_large_string(arrow_type) or pa.types.is_null(arrow_type):
+        return pa.string()
+    return arrow_type
+
+
+def _arrow_chunk(chunk):
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    schema = pa.schema([field.with_type(_portable_type(field.type)) for field in table.schema])
+    return table.cast(schema)
+
+
+@timed
+def write_export(chunks, export_format, filepath):
+    """
+    Serializes chunks of rows into one file, one chunk at a time.
+
+    The file is written under a temporary name and renamed once complete, so a reader
+    never sees a partial export.
+
+    Args:
+        chunks (iterable): DataFrames with the same columns, in export order.
+        export_format (str): A key of EXPORT_FORMATS.
+        filepath (str): File to write.
+
+    Returns:
+        int: Rows written.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'.")
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    staging = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    rows = 0
+    try:
+        if export_format == "Parquet":
+            writer = None
+            try:
+                for chunk in chunks:
+                    table = _arrow_chunk(chunk)
+                    if writer is None:
+                        writer = pq.ParquetWriter(staging, table.schema)
+                    writer.write_table(table)
+                    rows += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+        else:
+            with open(staging, "w", newline="", encoding="utf-8") as file:
+                for position, chunk in enumerate(chunks):
+                    if export_format == "CSV":
+                        chunk.to_csv(file, index=False, header=position == 0)
+                    elif len(chunk):
+                        chunk.to_json(file, orient="records", lines=True, date_format="iso")
+                    rows += len(chunk)
+        if os.path.exists(filepath):
+            # Keep the permissions new_export_path gave the file
+            shutil.copymode(filepath, staging)
+        os.replace(staging, filepath)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+    return rows
+
+
+def new_export_path(export_format, export_dir=EXPORT_DIR):
+    """
+    Reserves a new, unguessable file for one session's export.
+
+    Args:
+        export_format (str): A key of EXPORT_FORMATS.
+        export_dir (str): Directory holding the exports.
+
+    Returns:
+        str: Path of an empty file, readable and writable only by the server's user.
+    """
+    extension, _ = EXPORT_FORMATS[export_format]
+    os.makedirs(export_dir, exist_ok=True)
+    handle, filepath = tempfile.mkstemp(suffix=f".{extension}", dir=export_dir)
+    os.close(handle)
+    return filepath
+
+
+def prune_exports(max_age=EXPORT_MAX_AGE_SECONDS, export_dir=EXPORT_DIR):
+    """Deletes the export files written or last shown more than max_age seconds ago."""
+    if not os.path.isdir(export_dir):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(export_dir):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def prune_exports_periodically(interval=EXPORT_PRUNE_INTERVAL_SECONDS):
+    """Runs prune_exports, at most once every interval seconds across all sessions."""
+    global _last_prune
+    with _prune_lock:
+        if time.time() - _last_prune < interval:
+            return
+        _last_prune = time.time()
+    prune_exports()
+
+
+def session_export(state_key, selection):
+    """
+    Returns this session's export of a selection, if it has one.
+
+    Called on every run of the page, it also marks the session's export as still in
+    use and sweeps the files of sessions that stopped showing theirs.
+
+    Args:
+        state_key (str): Session state key the page keeps its export under.
+        selection (tuple): Dataset version, filters and format the export was made for.
+
+    Returns:
+        str: Path of the export file; None if the session has none for this selection.
+    """
+    prune_exports_periodically()
+    export = st.session_state.get(state_key)
+    if export is None:
+        return None
+    try:
+        # Restarts the file's EXPORT_MAX_AGE_SECONDS, even if another selection is shown now
+        os.utime(export["path"])
+    except FileNotFoundError:
+        return None
+    return export["path"] if export["selection"] == selection else None
+
+
+def keep_session_export(state_key, selection, filepath):
+    """
+    Records a new export of this session, deleting the one it replaces.
+
+    Args:
+        state_key (str): Session state key the page keeps its export under.
+        selection (tuple): Dataset version, filters and format the export was made for.
+        filepath (str): The new export file.
+    """
+    previous = st.session_state.get(state_key)
+    if previous is not None and previous["path"] != filepath:
+        try:
+            os.remove(previous["path"])
+        except FileNotFoundError:
+            pass
+    st.session_state[state_key] = {"selection": selection, "path": filepath}
+
+
+def offer_download(filepath, file_name, export_format, key, prepared=False):
+    """
+    Shows a button downloading an export file, once the user asked for it.
+
+    The download button reads the whole file into Streamlit's media store, so it is
+    only drawn in the run after an explicit click: the export itself, or a "Prepare
+    download" button drawn instead on every other run. Files over
+    EXPORT_MAX_DOWNLOAD_BYTES are never offered.
+
+    Args:
+        filepath (str): The session's export file.
+        file_name (str): Name the file is saved under, without extension.
+        export_format (str): A key of EXPORT_FORMATS.
+        key (str): Widget key of the button.
+        prepared (bool): The file was exported in this run, so no further click is needed.
+    """
+    extension, mime = EXPORT_FORMATS[export_format]
+    size = os.path.getsize(filepath)
+    size_mb = size / 2**20
+    if size > EXPORT_MAX_DOWNLOAD_BYTES:
+        st.warning(
+            f"The export is {size_mb:.1f} MB, over the {EXPORT_MAX_DOWNLOAD_BYTES / 2**20:.0f} MB download limit. "
+            "Narrow the filters or choose Parquet."
+        )
+        return
+    if not prepared and not st.button(f"Prepare download ({size_mb:.1f} MB)", key=f"{key}_prepare"):
+        return
+    with open(filepath, "rb") as file:
+        st.download_button(
+            f"Download {file_name}.{extension} ({size_mb:.1f} MB)",
+            data=file,
+            file_name=f"{file_name}.{extension}",
+            mime=mime,
+            key=key,
+        )
@@ -0,0 +1,125 @@
+import os
+import datetime
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from .profiling import register_gauges, timed
+from .view_store import ViewStore
+
+# Bytes of figure JSON kept in total; set DASHBOARD_FIGURE_BUDGET_MB to size it
+FIGURE_BUDGET_BYTES = int(float(os.environ.get("DASHBOARD_FIGURE_BUDGET_MB", "32")) * 2**20)
+
+
+def normalize_argument(value):
+    """
+    Turns a chart or filter argument into a hashable key that ignores selection order.
+
+    Lists and sets are sorted, since a multiselect gives the same selection in the order
+    it was clicked; tuples keep their order. Dicts become sorted (key, value) pairs.
+
+    Args:
+        value: None, a scalar, a date, or a list, tuple, set or dict of these.
+
+    Returns:
+        The normalized value.
+
+    Raises:
+        TypeError: If the value is a frame or array, or of a type with no stable key.
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, tuple):
+        return tuple(normalize_argument(item) for item in value)
+    if isinstance(value, (list, set, frozenset)):
+        return tuple(sorted((normalize_argument(item) for item in value), key=repr))
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), normalize_argument(item)) for key, item in value.items()))
+    raise TypeError(f"Cannot build a figure cache key from a {type(value).__name__}.")
+
+
+def _is_data(value):
+    return isinstance(value, (pd.DataFrame, pd.Series, np.ndarray))
+
+
+def figure_key(version, filters, chart, args, kwargs):
+    """
+    Builds the cache key of a chart call.
+
+    Frames passed to the chart are left out of the key: the dataset version and the
+    filters that selected them stand in for their content.
+
+    Args:
+        version (str): Version key of the dataset the frames were read from.
+        filters (dict): Filter arguments that produced the frames.
+        chart (callable): The chart function.
+        args (tuple): Its positional arguments.
+        kwargs (dict): Its keyword arguments.
+
+    Returns:
+        tuple: The key.
+    """
+    return (
+        version,
+        f"{chart.__module__}.{chart.__qualname__}",
+        normalize_argument(filters),
+        tuple(normalize_argument(arg) for arg in args if not _is_data(arg)),
+        normalize_argument({name: arg for name, arg in kwargs.items() if not _is_data(arg)}),
+    )
+
+
+class FigureCache:
+    """
+    Process-wide cache of Plotly figures, stored as their JSON within a byte budget.
+
+    Figures are rebuilt from the JSON on every hit, so each session gets its own
+    Figure object and nothing it does to the figure leaks into another session.
+
+    Args:
+        budget_bytes (int): Most bytes the cached figure JSON may hold together.
+    """
+
+    def __init__(self, budget_bytes=FIGURE_BUDGET_BYTES):
+        self._store = ViewStore(budget_bytes)
+
+    @timed
+    def get_or_build(self, version, filters, chart, *args, **kwargs):
+        """
+        Returns chart(*args, **kwargs), built once per dataset version, chart, filters and arguments.
+
+        Args:
+            version (str): Version key of the dataset the frames in args were read from.
+            filters (dict): Filter arguments that produced those frames.
+            chart (callable): Returns a Figure, or a tuple of a Figure and values without frames.
+            *args: Positional arguments of the chart.
+            **kwargs: Keyword arguments of the chart.
+
+        Returns:
+            What chart returns, with the Figure rebuilt from the cached JSON.
+        """
+
+        def build():
+            result = chart(*args, **kwargs)
+            if isinstance(result, tuple):
+                return (result[0].to_json(),) + tuple(result[1:])
+            return result.to_json()
+
+        cached = self._store.get_or_compute(figure_key(version, filters, chart, args, kwargs), build)
+        if isinstance(cached, tuple):
+            return (pio.from_json(cached[0]),) + cached[1:]
+        return pio.from_json(cached)
+
+    def clear(self):
+        self._store.clear()
+
+    def stats(self):
+        """Reports the hits, misses, evictions and bytes held, as ViewStore.stats does."""
+        return self._store.stats()
+
+
+# Figures shared by every session of this process
+FIGURES = FigureCache()
+register_gauges("figure_cache", FIGURES.stats)
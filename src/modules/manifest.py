@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from .columnar_store import STORE_DIR
+
+# Summary of every dataset written by the ETL, read by the pages to build their widgets
+MANIFEST_FILE = os.path.join(STORE_DIR, "manifest.json")
+
+
+def content_hash(df):
+    """
+    Hashes the values of a frame, independent of its index and of how it was stored.
+
+    Args:
+        df (pandas.DataFrame): The frame to hash.
+
+    Returns:
+        str: A hex digest that changes whenever any value changes.
+    """
+    digest = hashlib.sha256()
+    digest.update(",".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def build_dataset_manifest(df, date_column=None, category_column=None):
+    """
+    Summarizes one dataset.
+
+    Args:
+        df (pandas.DataFrame): The dataset.
+        date_column (str, optional): Datetime column to report the year list and date range of.
+        category_column (str, optional): Column to list the distinct values of, e.g. 'SAVSNET MPC'.
+
+    Returns:
+        dict: Row count, schema, content hash and, when requested, distinct values,
+              years and the min/max date.
+    """
+    manifest = {
+        "row_count": int(len(df)),
+        "schema": {column: str(dtype) for column, dtype in df.dtypes.items()},
+        "content_hash": content_hash(df),
+    }
+    if category_column is not None:
+        manifest["distinct_values"] = {
+            category_column: sorted(df[category_column].dropna().astype(str).unique().tolist())
+        }
+    if date_column is not None:
+        dates = pd.to_datetime(df[date_column])
+        manifest["years"] = sorted(dates.dt.year.dropna().astype(int).unique().tolist())
+        manifest["min_date"] = None if dates.empty else dates.min().isoformat()
+        manifest["max_date"] = None if dates.empty else dates.max().isoformat()
+    return manifest
+
+
+def merge_dataset_manifests(previous, batch):
+    """
+    Combines the manifest of a dataset with the manifest of rows appended to it.
+
+    The merged content hash chains the batch hash onto the previous one, so it still
+    changes with every append without re-reading the whole dataset.
+
+    Args:
+        previous (dict): Manifest of the dataset before the append.
+        batch (dict): Manifest of the appended rows.
+
+    Returns:
+        dict: The manifest of the dataset after the append.
+    """
+    if batch["row_count"] == 0:
+        return previous
+    merged = dict(previous)
+    merged["row_count"] = previous["row_count"] + batch["row_count"]
+    merged["content_hash"] = hashlib.sha256(
+        (previous["content_hash"] + batch["content_hash"]).encode()
+    ).hexdigest()
+    if "distinct_values" in previous:
+        merged["distinct_values"] = {
+            column: sorted(set(values) | set(batch["distinct_values"][column]))
+            for column, values in previous["distinct_values"].items()
+        }
+    if "years" in previous:
+        merged["years"] = sorted(set(previous["years"]) | set(batch["years"]))
+        dates = [date for date in [previous["min_date"], batch["min_date"]] if date]
+        merged["min_date"] = min(dates) if dates else None
+        dates = [date for date in [previous["max_date"], batch["max_date"]] if date]
+        merged["max_date"] = max(dates) if dates else None
+    return merged
+
+
+def write_manifest(manifest, filepath=MANIFEST_FILE):
+    """Writes the manifest as JSON, replacing any previous manifest atomically."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(f"{filepath}.tmp", "w") as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(f"{filepath}.tmp", filepath)
+
+
+def read_manifest(filepath=MANIFEST_FILE):
+    """Reads the manifest, or returns an empty one if it has not been written yet."""
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath, "r") as file:
+        return json.load(file)
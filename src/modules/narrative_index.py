@@ -0,0 +1,380 @@
+import os
+import re
+import json
+import math
+import shutil
+import time
+from bisect import bisect_left
+import numpy as np
+from .columnar_store import STORE_DIR
+from .profiling import timed
+from .row_index import ROW_INDEX_DIR, read_rows_from, row_prefix_state
+
+# Inverted indexes of the consultation narratives, written by the ETL next to the row index
+NARRATIVE_INDEX_DIR = os.path.join(STORE_DIR, "narrative_index")
+
+# Tokens are runs of letters and digits, joined by slashes as in "F/W" and "S/O", with
+# an optional trailing plus as in "C+" and "D+"
+NARRATIVE_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:/[a-z0-9]+)*\+?")
+
+# A query is quoted phrases and bare words; a word ending in * is a prefix
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+# BM25 term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Incremental appends add a segment each; past this many the index is rebuilt as one
+MAX_SEGMENTS = 8
+
+# Seconds a segment dropped from the index stays on disk, so a reader that loaded the
+# previous meta.json can still open it; it is deleted by the first build or load after that
+SEGMENT_GRACE_SECONDS = 3600
+
+# Arrays of a segment, each memory-mapped from its own .npy file:
+#   term_offsets: postings of term i are term_offsets[i] .. term_offsets[i + 1]
+#   docs, freqs: document (row within the segment) and term count of every posting
+#   position_offsets: token positions of posting j are position_offsets[j] .. position_offsets[j + 1]
+#   positions: token positions, in document order within each posting
+#   doc_lengths: tokens per document
+SEGMENT_ARRAYS = ["term_offsets", "docs", "freqs", "position_offsets", "positions", "doc_lengths"]
+
+# Documents and token positions packed into one int64 key, for phrase matching
+_POSITION_BITS = 32
+
+
+def tokenize_narrative(text):
+    """
+    Splits a narrative into lower-case tokens, keeping abbreviations such as "c+" whole.
+
+    Args:
+        text (str): The narrative. Missing values give no tokens.
+
+    Returns:
+        list: The tokens in order of appearance.
+    """
+    if not isinstance(text, str):
+        return []
+    return NARRATIVE_TOKEN_PATTERN.findall(text.lower())
+
+
+def synonyms_from_abbreviations(abbrev_dict):
+    """
+    Pairs every abbreviation with its meaning, in both directions.
+
+    Args:
+        abbrev_dict (dict): Abbreviations mapped to their meanings, as in commonly_used_terms.json.
+
+    Returns:
+        dict: Token tuple mapped to the token tuples it also matches, e.g. ("rf",) to
+              [("right", "fore")] and back. Parenthesized words of a meaning are left out.
+    """
+    synonyms = {}
+    for abbrev, meaning in abbrev_dict.items():
+        abbrev_tokens = tuple(tokenize_narrative(abbrev))
+        meaning_tokens = tuple(tokenize_narrative(re.sub(r"\(.*?\)", " ", meaning)))
+        if not abbrev_tokens or not meaning_tokens or abbrev_tokens == meaning_tokens:
+            continue
+        synonyms.setdefault(abbrev_tokens, []).append(meaning_tokens)
+        synonyms.setdefault(meaning_tokens, []).append(abbrev_tokens)
+    return synonyms
+
+
+def _write_segment(texts, segment_dir):
+    # Inverts the narratives of consecutive rows into one segment; returns its token count
+    vocabulary = {}
+    term_ids, doc_ids, token_positions = [], [], []
+    doc_lengths = np.zeros(len(texts), dtype="int32")
+    for doc, text in enumerate(texts):
+        tokens = tokenize_narrative(text)
+        doc_lengths[doc] = len(tokens)
+        term_ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+        doc_ids.extend([doc] * len(tokens))
+        token_positions.extend(range(len(tokens)))
+
+    # Number the terms in sorted order, so a prefix is a contiguous range of term ids
+    terms = sorted(vocabulary)
+    renumber = np.empty(len(terms), dtype="int64")
+    renumber[[vocabulary[term] for term in terms]] = np.arange(len(terms))
+    term_ids = renumber[np.asarray(term_ids, dtype="int64")]
+    doc_ids = np.asarray(doc_ids, dtype="int32")
+    token_positions = np.asarray(token_positions, dtype="int32")
+    order = np.lexsort((token_positions, doc_ids, term_ids))
+    term_ids, doc_ids, token_positions = term_ids[order], doc_ids[order], token_positions[order]
+
+    # One posting per term and document, holding that document's positions of the term
+    starts_posting = np.ones(len(term_ids), dtype=bool)
+    starts_posting[1:] = (term_ids[1:] != term_ids[:-1]) | (doc_ids[1:] != doc_ids[:-1])
+    posting_starts = np.flatnonzero(starts_posting)
+    position_offsets = np.append(posting_starts, len(term_ids)).astype("int64")
+    arrays = {
+        "term_offsets": np.searchsorted(term_ids[posting_starts], np.arange(len(terms) + 1)).astype("int64"),
+        "docs": doc_ids[posting_starts],
+        "freqs": np.diff(position_offsets).astype("int32"),
+        "position_offsets": position_offsets,
+        "positions": token_positions,
+        "doc_lengths": doc_lengths,
+    }
+
+    os.makedirs(segment_dir, exist_ok=True)
+    for name, values in arrays.items():
+        np.save(os.path.join(segment_dir, f"{name}.npy"), values)
+    with open(os.path.join(segment_dir, "terms.json"), "w") as terms_file:
+        json.dump(terms, terms_file)
+    return int(doc_lengths.sum())
+
+
+def _index_directory(csv_path, index_dir):
+    return os.path.join(index_dir, os.path.splitext(os.path.basename(csv_path))[0])
+
+
+def _sweep_retired(directory, retired, now):
+    # Deletes the retired segments past their grace period; returns the ones still kept
+    expired = [name for name, retired_at in retired.items() if now - retired_at >= SEGMENT_GRACE_SECONDS]
+    for name in expired:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return {name: retired_at for name, retired_at in retired.items() if name not in expired}
+
+
+def _read_meta(directory):
+    meta_path = os.path.join(directory, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as meta_file:
+        return json.load(meta_file)
+
+
+@timed
+def build_narrative_index(csv_path, index_dir=NARRATIVE_INDEX_DIR, row_index_dir=ROW_INDEX_DIR, rebuild=False):
+    """
+    Builds the inverted index of the 'Narrative' column of a consultations CSV.
+
+    The index is a list of immutable segments. If an index already exists for a prefix
+    of the file, as after an incremental ETL append, only the rows added since are
+    parsed, into a new segment; past MAX_SEGMENTS the whole file is indexed again as
+    one. Rows are located with the file's row index, which must be current.
+
+    Segments dropped from the index are listed in meta.json as retired and only
+    deleted once SEGMENT_GRACE_SECONDS have passed, by a later build or by loading
+    the index.
+
+    Args:
+        csv_path (str): The CSV file to index.
+        index_dir (str): Directory to write the index to, one subdirectory per file.
+        row_index_dir (str): Directory holding the file's row index.
+        rebuild (bool): Ignore any existing index and parse the whole file.
+    """
+    directory = _index_directory(csv_path, index_dir)
+    os.makedirs(directory, exist_ok=True)
+    meta = _read_meta(directory)
+    segments, first_row = [], 0
+    if meta is not None and not rebuild and len(meta["segments"]) < MAX_SEGMENTS:
+        previous = row_prefix_state(csv_path, meta["rows"], row_index_dir)
+        if previous is not None and all(meta[key] == value for key, value in previous.items()):
+            segments, first_row = meta["segments"], meta["rows"]
+
+    state = row_prefix_state(csv_path, index_dir=row_index_dir)
+    if state["rows"] > first_row:
+        texts = read_rows_from(csv_path, first_row, ["Narrative"], row_index_dir, dtype=str)["Narrative"]
+        # Segment names are never reused, so readers of a replaced index keep valid files
+        name = f"{first_row}-{state['rows']}-{time.time_ns()}"
+        tokens = _write_segment(texts.tolist(), os.path.join(directory, name))
+        segments = segments + [{"name": name, "doc_start": first_row, "docs": len(texts), "tokens": tokens}]
+
+    # Segments no longer listed, and leftovers of an interrupted build, are retired now
+    # and deleted once their grace period is over
+    now = time.time()
+    kept = {segment["name"] for segment in segments}
+    retired = {} if meta is None else dict(meta.get("retired", {}))
+    for entry in os.listdir(directory):
+        if entry not in kept and os.path.isdir(os.path.join(directory, entry)):
+            retired.setdefault(entry, now)
+    retired = _sweep_retired(directory, retired, now)
+
+    with open(os.path.join(directory, "meta.json.tmp"), "w") as meta_file:
+        json.dump({**state, "segments": segments, "retired": retired}, meta_file, indent=4)
+    os.replace(os.path.join(directory, "meta.json.tmp"), os.path.join(directory, "meta.json"))
+
+
+def narrative_index_is_current(csv_path, index_dir=NARRATIVE_INDEX_DIR):
+    """Tells whether the narrative index of a CSV file covers the file as it is now."""
+    meta = _read_meta(_index_directory(csv_path, index_dir))
+    return meta is not None and meta["size"] == os.path.getsize(csv_path)
+
+
+class _Segment:
+    def __init__(self, segment_dir, doc_start):
+        self.doc_start = doc_start
+        for name in SEGMENT_ARRAYS:
+            setattr(self, name, np.load(os.path.join(segment_dir, f"{name}.npy"), mmap_mode="r"))
+        with open(os.path.join(segment_dir, "terms.json"), "r") as terms_file:
+            self.terms = json.load(terms_file)
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+
+    def prefix_term_ids(self, prefix):
+        return range(bisect_left(self.terms, prefix), bisect_left(self.terms, prefix + "\uffff"))
+
+    def postings(self, term_id):
+        # Documents (as rows of the file) and counts of one term
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.docs[start:end].astype("int64") + self.doc_start, np.asarray(self.freqs[start:end])
+
+    def position_keys(self, term_id):
+        # Every occurrence of one term as a packed (row, position) key
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        docs, freqs = self.postings(term_id)
+        positions = self.positions[self.position_offsets[start] : self.position_offsets[end]]
+        return (np.repeat(docs, freqs) << _POSITION_BITS) + positions
+
+
+def _sum_by_doc(docs, counts):
+    # Adds up the counts of each document; returns sorted unique documents and their sums
+    if len(docs) == 0:
+        return np.array([], dtype="int64"), np.array([], dtype="int64")
+    unique_docs, inverse = np.unique(docs, return_inverse=True)
+    return unique_docs, np.bincount(inverse, weights=counts).astype("int64")
+
+
+class NarrativeIndex:
+    """
+    BM25-ranked full-text search over the narratives of one consultations file.
+
+    Queries are bare words, "quoted phrases" and prefix* words, and a row must match
+    all of them. A bare word with no exact match is matched as a prefix, so "melox"
+    finds "meloxicam". Abbreviations and their meanings from commonly_used_terms.json
+    match each other, so "RF" also finds "right fore". The segment arrays are
+    memory-mapped, so only the postings a query touches are read from disk. Loading
+    the index deletes its retired segments whose grace period is over.
+
+    Args:
+        csv_path (str): The indexed CSV file; results are its row positions.
+        synonyms (dict, optional): From synonyms_from_abbreviations.
+        index_dir (str): Directory holding the index.
+    """
+
+    def __init__(self, csv_path, synonyms=None, index_dir=NARRATIVE_INDEX_DIR):
+        directory = _index_directory(csv_path, index_dir)
+        meta = _read_meta(directory)
+        # Their names stay listed in meta.json until the next build, which drops them
+        _sweep_retired(directory, meta.get("retired", {}), time.time())
+        self.size = meta["rows"]
+        self.segments = [
+            _Segment(os.path.join(directory, segment["name"]), segment["doc_start"])
+            for segment in meta["segments"]
+        ]
+        self.doc_lengths = np.concatenate(
+            [np.asarray(segment.doc_lengths) for segment in self.segments] or [np.array([], dtype="int32")]
+        )
+        total_tokens = sum(segment["tokens"] for segment in meta["segments"])
+        self.average_length = total_tokens / self.size if self.size else 0.0
+        self.synonyms = synonyms or {}
+
+    def parse(self, query):
+        """
+        Splits a query into clauses that must all match.
+
+        Args:
+            query (str): The text typed by the user, e.g. 'lame "right fore" melox*'.
+
+        Returns:
+            list: One (alternatives, prefix) pair per clause, where alternatives are
+                  token tuples any of which may match.
+        """
+        clauses, words = [], []
+        for phrase, word in QUERY_PATTERN.findall(query):
+            if phrase:
+                self._add_words(clauses, words)
+                words = []
+                tokens = tuple(tokenize_narrative(phrase))
+                if tokens:
+                    clauses.append(([tokens] + self.synonyms.get(tokens, []), False))
+            elif word.endswith("*"):
+                self._add_words(clauses, words)
+                words = []
+                tokens = tuple(tokenize_narrative(word[:-1]))
+                if tokens:
+                    clauses.append(([tokens], len(tokens) == 1))
+            else:
+                words.extend(tokenize_narrative(word))
+        self._add_words(clauses, words)
+        return clauses
+
+    def _add_words(self, clauses, words):
+        # Consecutive bare words forming a multi-word synonym, such as "right fore", make one clause
+        longest = max((len(key) for key in self.synonyms), default=1)
+        start = 0
+        while start < len(words):
+            for length in range(min(longest, len(words) - start), 0, -1):
+                tokens = tuple(words[start : start + length])
+                if length == 1 or tokens in self.synonyms:
+                    break
+            clauses.append(([tokens] + self.synonyms.get(tokens, []), None if length == 1 else False))
+            start += length
+
+    def _match(self, tokens, prefix):
+        # Rows containing one alternative, with the number of times they contain it
+        docs, counts = [], []
+        for segment in self.segments:
+            if len(tokens) == 1:
+                term_id = segment.term_ids.get(tokens[0])
+                term_ids = segment.prefix_term_ids(tokens[0]) if prefix else [] if term_id is None else [term_id]
+                for term_id in term_ids:
+                    segment_docs, segment_counts = segment.postings(term_id)
+                    docs.append(segment_docs)
+                    counts.append(segment_counts)
+                continue
+            term_ids = [segment.term_ids.get(token) for token in tokens]
+            if None in term_ids:
+                continue
+            # A phrase occurs where each token sits one position after the previous one
+            keys = segment.position_keys(term_ids[0])
+            for offset, term_id in enumerate(term_ids[1:], start=1):
+                keys = np.intersect1d(keys, segment.position_keys(term_id) - offset, assume_unique=True)
+            phrase_docs, phrase_counts = np.unique(keys >> _POSITION_BITS, return_counts=True)
+            docs.append(phrase_docs)
+            counts.append(phrase_counts)
+        if not docs:
+            return np.array([], dtype="int64"), np.array([], dtype="int64")
+        return _sum_by_doc(np.concatenate(docs), np.concatenate(counts))
+
+    def _clause_scores(self, alternatives, prefix):
+        # prefix is None for a bare word, matched exactly unless nothing matches it that way
+        docs, counts = _sum_by_doc(
+            *[
+                np.concatenate(arrays)
+                for arrays in zip(*[self._match(tokens, bool(prefix)) for tokens in alternatives])
+            ]
+        )
+        if len(docs) == 0 and prefix is None:
+            return self._clause_scores(alternatives[:1], True)
+        idf = math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+        lengths = self.doc_lengths[docs] / self.average_length if self.average_length else 1.0
+        return docs, idf * counts * (BM25_K1 + 1) / (counts + BM25_K1 * (1 - BM25_B + BM25_B * lengths))
+
+    @timed
+    def search(self, query):
+        """
+        Ranks the rows matching a query.
+
+        Args:
+            query (str): The text typed by the user.
+
+        Returns:
+            tuple: (positions, scores) numpy arrays, best match first and ties in file
+                   order; None for a query without any words.
+        """
+        clauses = self.parse(query)
+        if not clauses:
+            return None
+        docs, scores = None, None
+        for alternatives, prefix in clauses:
+            clause_docs, clause_scores = self._clause_scores(alternatives, prefix)
+            if docs is None:
+                docs, scores = clause_docs, clause_scores
+            else:
+                docs, left, right = np.intersect1d(docs, clause_docs, assume_unique=True, return_indices=True)
+                scores = scores[left] + clause_scores[right]
+            if len(docs) == 0:
+                break
+        order = np.lexsort((docs, -scores))
+        return docs[order], scores[order]
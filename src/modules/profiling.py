@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import numpy as np
+import pandas as pd
+import streamlit as st
+from .columnar_store import STORE_DIR
+
+# Instrumentation is compiled out unless the app is started with DASHBOARD_PROFILE=1
+ENABLED = os.environ.get("DASHBOARD_PROFILE", "").lower() in ("1", "true", "yes")
+
+PROFILE_DIR = os.path.join(STORE_DIR, "profiling")
+# One JSON line per rerun with every span it recorded
+TRACE_FILE = os.path.join(PROFILE_DIR, "traces.jsonl")
+# Rolling per-span statistics in Prometheus text format, for a node exporter textfile collector
+METRICS_FILE = os.path.join(PROFILE_DIR, "metrics.prom")
+
+# The trace file is rotated to TRACE_FILE.1 once it grows past this size
+TRACE_FILE_MAX_BYTES = 10 * 2**20
+# Minimum seconds between two rewrites of the metrics file
+METRICS_INTERVAL = 5.0
+# Latest durations kept per span for the rolling percentiles
+STATS_WINDOW = 1000
+# Reruns kept per session for the sidebar panel
+SESSION_TRACES = 20
+
+_NULL_SPAN = nullcontext()
+_local = threading.local()
+
+
+class RerunTrace:
+    """
+    Spans recorded during one rerun of a page, in the order they finished.
+
+    Args:
+        page (str): Name of the page being run.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self._stack = []
+
+    def to_record(self):
+        return {
+            "timestamp": self.timestamp,
+            "page": self.page,
+            "total_ms": (time.perf_counter() - self.started) * 1000,
+            "spans": self.spans,
+        }
+
+
+class SpanStats:
+    """
+    Thread-safe rolling statistics of every span, shared by all sessions of the process.
+
+    Args:
+        window (int): Number of latest durations kept per span for the percentiles.
+    """
+
+    def __init__(self, window=STATS_WINDOW):
+        self.window = window
+        self._durations = {}
+        self._counts = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            if name not in self._durations:
+                self._durations[name] = deque(maxlen=self.window)
+                self._counts[name] = 0
+                self._totals[name] = 0.0
+            self._durations[name].append(seconds)
+            self._counts[name] += 1
+            self._totals[name] += seconds
+
+    def snapshot(self):
+        """
+        Summarizes every span seen so far.
+
+        Returns:
+            list: One dict per span with its call count, total seconds, and the p50, p95
+                  and max of its latest durations.
+        """
+        with self._lock:
+            items = [
+                (name, self._counts[name], self._totals[name], np.array(durations))
+                for name, durations in self._durations.items()
+            ]
+        return [
+            {
+                "span": name,
+                "count": count,
+                "sum": total,
+                "p50": float(np.percentile(durations, 50)),
+                "p95": float(np.percentile(durations, 95)),
+                "max": float(durations.max()),
+            }
+            for name, count, total, durations in items
+        ]
+
+    def to_prometheus(self):
+        """Renders the snapshot as a Prometheus summary, in seconds."""
+        lines = [
+            f"# HELP dashboard_span_seconds Wall time of instrumented spans over the last {self.window} calls.",
+            "# TYPE dashboard_span_seconds summary",
+        ]
+        for stats in self.snapshot():
+            label = stats["span"].replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            lines.append(f'dashboard_span_seconds{{span="{label}",quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'dashboard_span_seconds{{span="{label}",quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'dashboard_span_seconds_sum{{span="{label}"}} {stats["sum"]:.6f}')
+            lines.append(f'dashboard_span_seconds_count{{span="{label}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+# Statistics of every session of this process
+STATS = SpanStats()
+
+# Other process-wide numbers reported next to the spans, as prefix -> callable returning {name: value}
+GAUGES = {}
+
+
+def register_gauges(prefix, read):
+    """
+    Adds a set of numbers to the metrics file and the profiling panel.
+
+    Args:
+        prefix (str): Name of the set, e.g. "view_store".
+        read (callable): Returns the current values as a dict of numbers.
+    """
+    GAUGES[prefix] = read
+
+
+def _gauges_to_prometheus():
+    lines = []
+    for prefix, read in GAUGES.items():
+        for name, value in read().items():
+            metric = f"dashboard_{prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+_files_lock = threading.Lock()
+_last_metrics_write = [0.0]
+
+
+@contextmanager
+def _span(name):
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        depth = len(trace._stack)
+        trace._stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if trace is not None:
+            trace._stack.pop()
+            trace.spans.append(
+                {
+                    "name": name,
+                    "start_ms": (start - trace.started) * 1000,
+                    "duration_ms": seconds * 1000,
+                    "depth": depth,
+                }
+            )
+        STATS.add(name, seconds)
+
+
+def span(name):
+    """
+    Times a block of code.
+
+    Args:
+        name (str): Name the block is reported under, e.g. "dashboards: heatmap".
+
+    Returns:
+        A context manager; a shared no-op one when profiling is disabled.
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _span(name)
+
+
+def timed(func):
+    """
+    Decorator timing every call of a function under "<module>.<qualified name>".
+
+    When profiling is disabled the function is returned unchanged, so it costs nothing.
+    """
+    if not ENABLED:
+        return func
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def start_rerun(page):
+    """
+    Starts the trace of a page rerun. Call at the top of the page script.
+
+    A trace left unfinished by an exception in the previous rerun is discarded.
+
+    Args:
+        page (str): Name of the page, used in the trace file.
+    """
+    if ENABLED:
+        _local.trace = RerunTrace(page)
+
+
+def _write_trace(record):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with _files_lock:
+        if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > TRACE_FILE_MAX_BYTES:
+            os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+        with open(TRACE_FILE, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+        now = time.monotonic()
+        if now - _last_metrics_write[0] >= METRICS_INTERVAL:
+            _last_metrics_write[0] = now
+            with open(f"{METRICS_FILE}.tmp", "w") as file:
+                file.write(STATS.to_prometheus() + _gauges_to_prometheus())
+            os.replace(f"{METRICS_FILE}.tmp", METRICS_FILE)
+
+
+def _render_panel(traces):
+    last = traces[-1]
+    spans = pd.DataFrame([span for trace in traces for span in trace["spans"]])
+    with st.sidebar.expander("Profiling", expanded=False):
+        st.caption(f"Last rerun: {last['total_ms']:.0f} ms over {len(last['spans'])} spans")
+        for prefix, read in GAUGES.items():
+            values = ", ".join(
+                f"{name} {value:,}" if isinstance(value, int) else f"{name} {value:.2f}"
+                for name, value in read().items()
+            )
+            st.caption(f"{prefix}: {values}")
+        if spans.empty:
+            return
+        slowest = (
+            spans.groupby("name")["duration_ms"]
+            .agg(calls="count", total_ms="sum", mean_ms="mean", max_ms="max")
+            .sort_values("total_ms", ascending=False)
+            .head(15)
+        )
+        st.write(f"Slowest spans over the last {len(traces)} reruns")
+        st.dataframe(slowest.round(1), use_container_width=True)
+
+
+def finish_rerun():
+    """
+    Ends the trace of the current rerun. Call at the bottom of the page script.
+
+    Appends the trace to the trace file, refreshes the metrics file when it is due,
+    and shows the slowest spans of this session in the sidebar.
+    """
+    if not ENABLED:
+        return
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    if trace is None:
+        return
+    record = trace.to_record()
+    if "_profiling_traces" not in st.session_state:
+        st.session_state["_profiling_traces"] = deque(maxlen=SESSION_TRACES)
+    traces = st.session_state["_profiling_traces"]
+    traces.append(record)
+    _write_trace(record)
+    _render_panel(traces)
@@ -0,0 +1,228 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+from .columnar_store import STORE_DIR
+from .count_cube import CUBE_DIMENSIONS, GRANULARITIES
+from .profiling import timed
+
+try:
+    # Columnar embedded database, faster than SQLite for these aggregates once history grows
+    import duckdb
+
+    SQL_ENGINE = "duckdb"
+except ImportError:
+    duckdb = None
+    SQL_ENGINE = "sqlite"
+
+# Where the dashboard aggregates run: "pandas" over the count cube files, or "sql" over
+# the embedded database; set DASHBOARD_QUERY_BACKEND to choose
+QUERY_BACKEND = os.environ.get("DASHBOARD_QUERY_BACKEND", "pandas").lower()
+
+# One row per consultation, written by the ETL next to the columnar store
+SQL_DATABASE_FILE = os.path.join(STORE_DIR, f"consultations.{SQL_ENGINE}")
+
+SQL_TABLE = "consultations"
+
+# Column holding the period end of each time series granularity; derived once by the
+# ETL, so the queries need no dialect-specific date functions
+PERIOD_COLUMNS = {
+    "Daily": "Consult_day",
+    "Weekly": "Week_end",
+    "Monthly": "Month_end",
+    "Quarterly": "Quarter_end",
+}
+
+# Integer types of the count cube columns, restored on the results of a query
+CUBE_TYPES = {"Consult_year": "int16", "Weekday": "int8", "Hour": "int8", "Counts": "int64"}
+
+
+def sql_frame(df, date_column="Consult_date"):
+    """
+    Derives the rows of the SQL table from cleaned consultations.
+
+    Args:
+        df (pandas.DataFrame): Consultations with 'SAVSNET_consult_id', 'Species',
+                               'SAVSNET MPC' and a datetime column.
+        date_column (str): The name of the column containing the consultation date.
+
+    Returns:
+        pandas.DataFrame: One row per consultation, with its year, weekday and hour and
+                          the end of its day, week, month and quarter as ISO dates.
+    """
+    dates = pd.to_datetime(df[date_column])
+    columns = {
+        "SAVSNET_consult_id": df["SAVSNET_consult_id"].to_numpy(),
+        "Species": df["Species"].astype(str).to_numpy(),
+        "SAVSNET MPC": df["SAVSNET MPC"].astype(str).to_numpy(),
+        "Consult_year": dates.dt.year.to_numpy(),
+        "Weekday": dates.dt.weekday.to_numpy(),
+        "Hour": dates.dt.hour.to_numpy(),
+    }
+    for granularity, column in PERIOD_COLUMNS.items():
+        period_alias, _ = GRANULARITIES[granularity]
+        period_end = dates.dt.normalize()
+        if period_alias != "D":
+            period_end = dates.dt.to_period(period_alias).dt.end_time.dt.normalize()
+        columns[column] = period_end.dt.strftime("%Y-%m-%d").to_numpy()
+    return pd.DataFrame(columns)
+
+
+def _insert(connection, rows, create):
+    if SQL_ENGINE == "duckdb":
+        connection.register("new_rows", rows)
+        if create:
+            connection.execute(f"CREATE TABLE {SQL_TABLE} AS SELECT * FROM new_rows")
+        else:
+            connection.execute(f"INSERT INTO {SQL_TABLE} SELECT * FROM new_rows")
+        connection.unregister("new_rows")
+        return
+    rows.to_sql(SQL_TABLE, connection, if_exists="fail" if create else "append", index=False)
+    if create:
+        # DuckDB prunes by its per-block min/max; SQLite needs an index to skip rows
+        connection.execute(
+            f'CREATE INDEX {SQL_TABLE}_filters ON {SQL_TABLE} (Species, Consult_year, "SAVSNET MPC")'
+        )
+    connection.commit()
+
+
+def _connect(filepath, read_only=False):
+    if SQL_ENGINE == "duckdb":
+        return duckdb.connect(filepath, read_only=read_only)
+    if read_only:
+        return sqlite3.connect(f"file:{filepath}?mode=ro", uri=True, check_same_thread=False)
+    return sqlite3.connect(filepath)
+
+
+@timed
+def write_sql_database(df, filepath=SQL_DATABASE_FILE):
+    """
+    Writes consultations to a new embedded database, replacing any previous one atomically.
+
+    Args:
+        df (pandas.DataFrame): All cleaned consultations.
+        filepath (str): Database file to write.
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    staging = f"{filepath}.tmp"
+    if os.path.exists(staging):
+        os.remove(staging)
+    connection = _connect(staging)
+    try:
+        _insert(connection, sql_frame(df), create=True)
+    finally:
+        connection.close()
+    os.replace(staging, filepath)
+
+
+@timed
+def append_sql_database(df, filepath=SQL_DATABASE_FILE):
+    """Appends a batch of new consultations to a database written by write_sql_database."""
+    connection = _connect(filepath)
+    try:
+        _insert(connection, sql_frame(df), create=False)
+    finally:
+        connection.close()
+
+
+class SqlQueryBackend:
+    """
+    Filters and aggregates consultations in the embedded database.
+
+    Only the aggregated rows leave the database, in the same shape as the count cube
+    and rollup slices of the pandas path, so the chart and table functions take either.
+    Each thread reads through its own read-only connection.
+
+    Args:
+        filepath (str): Database written by write_sql_database.
+    """
+
+    def __init__(self, filepath=SQL_DATABASE_FILE):
+        self.filepath = filepath
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = _connect(self.filepath, read_only=True)
+        return self._local.connection
+
+    def query(self, sql, params=()):
+        """
+        Runs a query and returns its result.
+
+        Args:
+            sql (str): The query, with ? placeholders; the table is named 'consultations'.
+            params (sequence): Values of the placeholders.
+
+        Returns:
+            pandas.DataFrame: The result rows.
+        """
+        connection = self._connection()
+        if SQL_ENGINE == "duckdb":
+            return connection.execute(sql, list(params)).df()
+        return pd.read_sql_query(sql, connection, params=list(params))
+
+    @staticmethod
+    def _where(species=None, exclude_species=None, years=None, mpc_types=None):
+        clauses, params = [], []
+        for column, values, negated in [
+            ("Species", species, False),
+            ("Species", exclude_species, True),
+            ("Consult_year", years, False),
+            ('"SAVSNET MPC"', mpc_types, False),
+        ]:
+            if values is None:
+                continue
+            values = [int(value) if column == "Consult_year" else str(value) for value in values]
+            if not values:
+                clauses.append("1 = 1" if negated else "1 = 0")
+                continue
+            placeholders = ", ".join("?" for _ in values)
+            clauses.append(f"{column} {'NOT IN' if negated else 'IN'} ({placeholders})")
+            params.extend(values)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def _counts(self, dimensions, filters):
+        where, params = self._where(**filters)
+        columns = ", ".join(f'"{column}"' for column in dimensions)
+        frame = self.query(
+            f"SELECT {columns}, COUNT(*) AS Counts FROM {SQL_TABLE} {where} "
+            f"GROUP BY {columns} ORDER BY {columns}",
+            params,
+        )
+        for column, dtype in CUBE_TYPES.items():
+            if column in frame.columns:
+                frame[column] = frame[column].astype(dtype)
+        return frame
+
+    @timed
+    def count_cube(self, **filters):
+        """
+        Counts the matching consultations over the count cube's dimensions.
+
+        Args:
+            **filters: species, exclude_species, years and mpc_types value lists.
+
+        Returns:
+            pandas.DataFrame: The rows load_count_cube returns for the same selection.
+        """
+        frame = self._counts(CUBE_DIMENSIONS, filters)
+        frame["Quarter_end"] = pd.to_datetime(frame["Quarter_end"])
+        return frame
+
+    @timed
+    def count_rollup(self, granularity, **filters):
+        """
+        Counts the matching consultations per period of a granularity.
+
+        Args:
+            granularity (str): A key of GRANULARITIES.
+            **filters: species, exclude_species, years and mpc_types value lists.
+
+        Returns:
+            pandas.DataFrame: The rows load_count_rollup returns for the same selection.
+        """
+        period_column = PERIOD_COLUMNS[granularity]
+        frame = self._counts(["Species", "Consult_year", "SAVSNET MPC", period_column], filters)
+        frame[period_column] = pd.to_datetime(frame[period_column])
+        return frame.rename(columns={period_column: "Period_end"})
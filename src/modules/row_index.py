@@ -0,0 +1,233 @@
+import io
+import os
+import json
+import mmap
+import hashlib
+import numpy as np
+import pandas as pd
+from .columnar_store import STORE_DIR
+from .profiling import timed
+from .schema import apply_schema
+
+# Byte-offset indexes of the cleaned consultation CSVs, written by the ETL
+ROW_INDEX_DIR = os.path.join(STORE_DIR, "row_index")
+
+
+def _index_paths(csv_path, index_dir):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    base = os.path.join(index_dir, name)
+    return f"{base}.offsets.npy", f"{base}.codes.npy", f"{base}.json"
+
+
+def _record_starts(buffer, base_offset):
+    # A newline ends a record only outside quotes; doubled quotes keep the parity even
+    # Only the quote and newline positions are kept, not a running count per byte
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    quotes = np.flatnonzero(data == ord('"'))
+    newlines = np.flatnonzero(data == ord("\n"))
+    ends = newlines[np.searchsorted(quotes, newlines) % 2 == 0]
+    return ends + 1 + base_offset
+
+
+def _last_row_digest(file, offsets):
+    # Fingerprint of the last indexed row, to tell an append from a rewritten file
+    if len(offsets) < 2:
+        return None
+    file.seek(offsets[-2])
+    return hashlib.sha1(file.read(int(offsets[-1] - offsets[-2]))).hexdigest()
+
+
+def build_row_index(csv_path, category_column="SAVSNET MPC", index_dir=ROW_INDEX_DIR, rebuild=False):
+    """
+    Indexes a CSV file by the byte offset and category code of every row.
+
+    If an index already exists for a prefix of the file, as after an incremental ETL
+    append, only the bytes added since are scanned.
+
+    Args:
+        csv_path (str): The CSV file to index.
+        category_column (str): Column whose value is stored as a small integer code per row.
+        index_dir (str): Directory to write the index files to.
+        rebuild (bool): Ignore any existing index and scan the whole file.
+    """
+    offsets_path, codes_path, meta_path = _index_paths(csv_path, index_dir)
+    os.makedirs(index_dir, exist_ok=True)
+    size = os.path.getsize(csv_path)
+
+    with open(csv_path, "rb") as file:
+        header = file.readline()
+        offsets, codes, categories = np.array([len(header)], dtype="int64"), np.array([], dtype="int16"), []
+        if os.path.exists(meta_path) and not rebuild:
+            with open(meta_path, "r") as meta_file:
+                meta = json.load(meta_file)
+            if meta["header_size"] == len(header) and meta["size"] <= size:
+                previous_offsets = np.load(offsets_path)
+                if _last_row_digest(file, previous_offsets) == meta["last_row_digest"]:
+                    offsets = previous_offsets
+                    codes = np.load(codes_path)
+                    categories = meta["categories"]
+
+        file.seek(offsets[-1])
+        tail = file.read()
+
+    if tail:
+        new_ends = _record_starts(tail, offsets[-1])
+        if not tail.endswith(b"\n"):
+            new_ends = np.append(new_ends, size)
+        values = pd.read_csv(io.BytesIO(header + tail), usecols=[category_column], dtype=str)[category_column]
+        if len(values) != len(new_ends):
+            raise ValueError(f"Could not line up the rows of '{csv_path}' with their byte offsets.")
+        for value in values.dropna().unique():
+            if value not in categories:
+                categories.append(value)
+        lookup = {value: code for code, value in enumerate(categories)}
+        new_codes = np.array([lookup.get(value, -1) for value in values], dtype="int16")
+        offsets = np.concatenate([offsets, new_ends])
+        codes = np.concatenate([codes, new_codes])
+
+    with open(csv_path, "rb") as file:
+        last_row_digest = _last_row_digest(file, offsets)
+
+    np.save(f"{offsets_path}.tmp.npy", offsets)
+    np.save(f"{codes_path}.tmp.npy", codes)
+    os.replace(f"{offsets_path}.tmp.npy", offsets_path)
+    os.replace(f"{codes_path}.tmp.npy", codes_path)
+    with open(f"{meta_path}.tmp", "w") as meta_file:
+        json.dump(
+            {
+                "size": size,
+                "header_size": len(header),
+                "category_column": category_column,
+                "categories": categories,
+                "last_row_digest": last_row_digest,
+            },
+            meta_file,
+            indent=4,
+        )
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def row_index_is_current(csv_path, index_dir=ROW_INDEX_DIR):
+    """Tells whether the index of a CSV file covers the file as it is now."""
+    _, _, meta_path = _index_paths(csv_path, index_dir)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, "r") as meta_file:
+        return json.load(meta_file)["size"] == os.path.getsize(csv_path)
+
+
+def row_prefix_state(csv_path, rows=None, index_dir=ROW_INDEX_DIR):
+    """
+    Describes the first rows of an indexed CSV file, for the indexes derived from it.
+
+    A derived index records the state of the rows it covers. If the state of that many
+    rows is unchanged later on, the file was only appended to and the index can be
+    extended with the rows after them.
+
+    Args:
+        csv_path (str): The CSV file, indexed with build_row_index.
+        rows (int, optional): Number of leading rows. Defaults to every row.
+        index_dir (str): Directory holding the row index.
+
+    Returns:
+        dict: 'rows', 'size' (byte offset where those rows end) and 'last_row_digest';
+              None if the file has fewer rows.
+    """
+    offsets = np.load(_index_paths(csv_path, index_dir)[0], mmap_mode="r")
+    if rows is None:
+        rows = len(offsets) - 1
+    if rows > len(offsets) - 1:
+        return None
+    with open(csv_path, "rb") as file:
+        last_row_digest = _last_row_digest(file, offsets[: rows + 1])
+    return {"rows": rows, "size": int(offsets[rows]), "last_row_digest": last_row_digest}
+
+
+def read_rows_from(csv_path, first_row, columns, index_dir=ROW_INDEX_DIR, dtype=None):
+    """
+    Parses some columns of every row of an indexed CSV file from first_row on.
+
+    Args:
+        csv_path (str): The CSV file, indexed with build_row_index.
+        first_row (int): Position of the first row to parse.
+        columns (list): Columns to parse.
+        index_dir (str): Directory holding the row index.
+        dtype (dict, optional): Column types passed to pandas.read_csv.
+
+    Returns:
+        pandas.DataFrame: The rows, with a RangeIndex starting at 0.
+    """
+    offsets = np.load(_index_paths(csv_path, index_dir)[0], mmap_mode="r")
+    with open(csv_path, "rb") as file:
+        header = file.read(int(offsets[0]))
+        file.seek(int(offsets[first_row]))
+        tail = file.read(int(offsets[-1] - offsets[first_row]))
+    rows = pd.read_csv(io.BytesIO(header + tail), usecols=columns, dtype=dtype)
+    if len(rows) != len(offsets) - 1 - first_row:
+        raise ValueError(f"Could not line up the rows of '{csv_path}' with its row index.")
+    return rows
+
+
+class RowOffsetReader:
+    """
+    Reads selected rows of an indexed CSV file without parsing the rest of it.
+
+    The file and its offset/code arrays are memory-mapped, so a page read costs the
+    bytes of the requested rows only, whatever the size of the file.
+
+    Args:
+        csv_path (str): The CSV file, indexed with build_row_index.
+        index_dir (str): Directory holding the index files.
+        schema (dict, optional): Column types the rows read are converted to, e.g.
+                                 schema.CONSULTATION_SCHEMA.
+    """
+
+    def __init__(self, csv_path, index_dir=ROW_INDEX_DIR, schema=None):
+        offsets_path, codes_path, meta_path = _index_paths(csv_path, index_dir)
+        with open(meta_path, "r") as meta_file:
+            meta = json.load(meta_file)
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self.codes = np.load(codes_path, mmap_mode="r")
+        self.categories = meta["categories"]
+        self.category_column = meta["category_column"]
+        with open(csv_path, "rb") as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._header = self._data[: meta["header_size"]]
+        self.schema = schema
+
+    def __len__(self):
+        return len(self.codes)
+
+    @timed
+    def positions(self, categories=None):
+        """
+        Finds the rows whose category is one of the given values.
+
+        Args:
+            categories (list, optional): Category values to keep. Defaults to every row.
+
+        Returns:
+            numpy.ndarray: Sorted row positions.
+        """
+        if categories is None:
+            return np.arange(len(self.codes))
+        categories = set(categories)
+        wanted = [code for code, value in enumerate(self.categories) if value in categories]
+        return np.flatnonzero(np.isin(self.codes, wanted))
+
+    @timed
+    def read_rows(self, positions):
+        """
+        Parses only the given rows.
+
+        Args:
+            positions (array-like): Row positions to read.
+
+        Returns:
+            pandas.DataFrame: The rows, in the order given.
+        """
+        positions = np.asarray(positions, dtype="int64")
+        chunks = [self._data[self.offsets[i] : self.offsets[i + 1]] for i in positions]
+        chunks = [chunk if chunk.endswith(b"\n") else chunk + b"\n" for chunk in chunks]
+        rows = pd.read_csv(io.BytesIO(self._header + b"".join(chunks)))
+        return rows if self.schema is None else apply_schema(rows, self.schema)
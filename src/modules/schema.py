@@ -0,0 +1,131 @@
+import pandas as pd
+
+# Column types of each dataset, enforced by the ETL when it writes the data and by the
+# loaders when they read it:
+#   "category": low-cardinality text, stored once per distinct value
+#   "datetime": parsed once, at ingestion, instead of by every caller
+#   "int": integers downcast to the smallest type that holds them
+#   "string": free text, held in Arrow buffers instead of one Python object per value
+# Columns a schema does not list are passed through unchanged.
+CONSULTATION_SCHEMA = {
+    "SAVSNET_consult_id": "int",
+    "Narrative": "string",
+    "SAVSNET MPC": "category",
+    "Consult_date": "datetime",
+    "Species": "category",
+    "Consult_year": "int",
+}
+
+PRODUCT_SCHEMA = {
+    "VMDProductNo": "string",
+    "Name": "string",
+    "MAHolder": "category",
+    "Distributors": "string",
+    "VMNo": "string",
+    "DateOfIssue": "datetime",
+    "DateOfExpiration": "datetime",
+    "DateOfSuspension": "datetime",
+    "AuthorisationRoute": "category",
+    "Territory": "category",
+    "ActiveSubstances": "string",
+    "ControlledDrug": "category",
+    "TargetSpecies": "string",
+    "DistributionCategory": "category",
+    "PharmaceuticalForm": "category",
+    "TherapeuticGroup": "string",
+    "SPC_Link": "string",
+    "UKPAR_Link": "string",
+    "PAAR_Link": "string",
+}
+
+# Columns carried over from the raw extracts that nothing reads, such as the row
+# number pandas wrote into the SAVSNET extract
+REDUNDANT_COLUMNS = ["index"]
+
+
+def _to_category(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    # Excel hands back numbers and text mixed in one column, e.g. ControlledDrug 2 and "N"
+    return series.where(series.isna(), series.astype(str)).astype("category")
+
+
+def _to_datetime(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series, errors="coerce")
+
+
+def _to_string(series):
+    if isinstance(series.dtype, pd.StringDtype):
+        return series
+    return series.astype("string[pyarrow]")
+
+
+def _to_int(series):
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    # Missing or non-numeric values leave a float column rather than failing the load
+    return pd.to_numeric(series, errors="coerce", downcast="integer")
+
+
+CONVERTERS = {
+    "category": _to_category,
+    "datetime": _to_datetime,
+    "int": _to_int,
+    "string": _to_string,
+}
+
+
+def apply_schema(df, schema):
+    """
+    Converts a frame to the declared column types and drops the redundant columns.
+
+    Columns already of the right type are kept as they are, so applying a schema to a
+    frame read back from the typed store costs next to nothing.
+
+    Args:
+        df (pandas.DataFrame): The frame as parsed, e.g. from CSV, Excel or Parquet.
+        schema (dict): Column name mapped to its type; CONSULTATION_SCHEMA or PRODUCT_SCHEMA.
+
+    Returns:
+        pandas.DataFrame: A new typed frame; df is left unchanged.
+    """
+    df = df.drop(columns=[column for column in REDUNDANT_COLUMNS if column in df.columns])
+    converted = {
+        column: CONVERTERS[kind](df[column]) for column, kind in schema.items() if column in df.columns
+    }
+    return df.assign(**converted)
+
+
+def memory_usage_mb(df):
+    """Deep memory footprint of a frame in MB, counting the Python strings it holds."""
+    return df.memory_usage(deep=True, index=True).sum() / 2**20
+
+
+def memory_report(untyped, typed):
+    """
+    Compares the memory footprint of datasets before and after their schema was applied.
+
+    Args:
+        untyped (dict): Dataset name mapped to its frame with pandas' default inference.
+        typed (dict): The same datasets after apply_schema.
+
+    Returns:
+        pandas.DataFrame: One row per dataset with its rows, MB before and after, and
+                          how many times smaller it became.
+    """
+    rows = []
+    for name, df in typed.items():
+        before = memory_usage_mb(untyped[name])
+        after = memory_usage_mb(df)
+        rows.append(
+            {
+                "dataset": name,
+                "rows": len(df),
+                "untyped_mb": round(before, 2),
+                "typed_mb": round(after, 2),
+                "reduction": round(before / after, 1) if after else None,
+            }
+        )
+    return pd.DataFrame(rows).set_index("dataset")
@@ -0,0 +1,185 @@
+import re
+from bisect import bisect_left
+import numpy as np
+from .profiling import timed
+
+# Tokens are runs of letters and digits; everything else separates them
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Share of the rows from which a token's rows are kept as a packed bitmap rather than
+# positions; at 4 bytes a position, the bitmap is then no larger
+DENSE_TOKEN_SHARE = 1 / 32
+
+
+def tokenize(text):
+    """
+    Splits text into lower-case alphanumeric tokens.
+
+    Args:
+        text (str): The text to split. Missing values give no tokens.
+
+    Returns:
+        list: The tokens in order of appearance.
+    """
+    if not isinstance(text, str):
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def positions_to_bitmap(positions, size):
+    """
+    Converts row positions to a bitmap with bit i set for row i.
+
+    Args:
+        positions (array-like): Row positions to set.
+        size (int): Number of rows the bitmap covers.
+
+    Returns:
+        int: The bitmap.
+    """
+    bits = np.zeros(max(size, 1), dtype=bool)
+    bits[np.asarray(positions, dtype="int64")] = True
+    return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+
+def bitmap_to_positions(bitmap, size):
+    """
+    Converts a row bitmap back to sorted row positions.
+
+    Args:
+        bitmap (int): Bitmap with bit i set for row i.
+        size (int): Number of rows the bitmap covers.
+
+    Returns:
+        numpy.ndarray: The positions of the set bits.
+    """
+    n_bytes = max(1, (size + 7) // 8)
+    bits = np.unpackbits(
+        np.frombuffer(bitmap.to_bytes(n_bytes, "little"), dtype=np.uint8), bitorder="little"
+    )
+    return np.flatnonzero(bits[:size])
+
+
+def _packed_bitmap(positions, size):
+    bits = np.zeros(size, dtype=bool)
+    bits[positions] = True
+    return np.packbits(bits, bitorder="little")
+
+
+class SearchIndex:
+    """
+    Token index over the text columns of a frame.
+
+    Each token maps to the sorted positions of the rows containing it, so the index
+    grows with the number of token occurrences rather than with vocabulary x rows.
+    Tokens found in at least DENSE_TOKEN_SHARE of the rows, such as "dogs" or "tablet",
+    are stored as packed bitmaps instead, which is then the smaller of the two.
+
+    A query word matches every token it is a substring of, as the page's former
+    str.contains filter did within a word: "cillin" finds "amoxicillin". The sorted
+    vocabulary is scanned for those tokens, which is far shorter than the column.
+
+    Args:
+        df (pandas.DataFrame): The frame to index. Rows are addressed by position.
+        columns (list): The text columns to index. Columns missing from df are skipped.
+    """
+
+    def __init__(self, df, columns):
+        self.size = len(df)
+        self.vocabulary = {}
+        self.postings = {}
+        self.frequencies = {}
+        dense_rows = max(1, int(self.size * DENSE_TOKEN_SHARE))
+        for column in columns:
+            if column not in df.columns:
+                continue
+            rows_by_token = {}
+            for position, text in enumerate(df[column].tolist()):
+                for token in set(tokenize(text)):
+                    rows_by_token.setdefault(token, []).append(position)
+            self.vocabulary[column] = sorted(rows_by_token)
+            self.frequencies[column] = {token: len(rows) for token, rows in rows_by_token.items()}
+            self.postings[column] = {
+                # Positions are appended in row order, so they are already sorted
+                token: _packed_bitmap(rows, self.size) if len(rows) >= dense_rows else np.asarray(rows, dtype="int32")
+                for token, rows in rows_by_token.items()
+            }
+
+    def _prefix_range(self, column, prefix):
+        tokens = self.vocabulary[column]
+        start = bisect_left(tokens, prefix)
+        end = bisect_left(tokens, prefix + "\uffff")
+        return tokens[start:end]
+
+    def _matching_tokens(self, column, word):
+        return [token for token in self.vocabulary[column] if word in token]
+
+    def _rows_with(self, column, tokens):
+        rows = np.zeros(self.size, dtype=bool)
+        for token in tokens:
+            posting = self.postings[column][token]
+            if posting.dtype == np.uint8:
+                rows |= np.unpackbits(posting, count=self.size, bitorder="little").astype(bool)
+            else:
+                rows[posting] = True
+        return rows
+
+    def match(self, column, query):
+        """
+        Finds the rows whose column contains every query word within one of its words.
+
+        Args:
+            column (str): The indexed column to search.
+            query (str): The text typed by the user, e.g. "dog cat".
+
+        Returns:
+            numpy.ndarray: Boolean mask over the rows. No rows match if the column is not
+                           indexed or the query holds no letters or digits.
+        """
+        words = tokenize(query)
+        if column not in self.postings or not words:
+            return np.zeros(self.size, dtype=bool)
+        rows = np.ones(self.size, dtype=bool)
+        for word in words:
+            rows &= self._rows_with(column, self._matching_tokens(column, word))
+            if not rows.any():
+                break
+        return rows
+
+    @timed
+    def search(self, queries):
+        """
+        Intersects the matches of several search fields.
+
+        Args:
+            queries (dict): Column mapped to the query typed for it. Blank queries are
+                            ignored; one of only punctuation matches no rows.
+
+        Returns:
+            numpy.ndarray: Sorted positions of the rows matching every non-blank query.
+        """
+        rows = np.ones(self.size, dtype=bool)
+        for column, query in queries.items():
+            if query and query.strip():
+                rows &= self.match(column, query)
+        return np.flatnonzero(rows)
+
+    @timed
+    def suggest(self, column, prefix, limit=5):
+        """
+        Ranks completions for the last word typed in a search box.
+
+        Args:
+            column (str): The indexed column being searched.
+            prefix (str): The text typed so far.
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            list: Completed tokens, most frequent first.
+        """
+        tokens = tokenize(prefix)
+        if column not in self.postings or not tokens:
+            return []
+        candidates = self._prefix_range(column, tokens[-1])
+        ranked = sorted(candidates, key=lambda token: (-self.frequencies[column][token], token))
+        return ranked[:limit]
@@ -0,0 +1,147 @@
+import os
+import json
+import shutil
+import threading
+from typing import NamedTuple
+from .columnar_store import STORE_DIR
+
+# Cleaned outputs written in place by running the ETL scripts by hand
+LEGACY_DATA_DIR = "data/cleaned"
+
+# Versioned copies of the cleaned outputs and the store, one directory per refresh
+SNAPSHOT_DIR = "data/snapshots"
+
+# Name of the snapshot pages read, replaced atomically once a refresh is complete
+CURRENT_POINTER = os.path.join(SNAPSHOT_DIR, "CURRENT")
+
+# Raw file fingerprints a snapshot was built from, kept inside the snapshot
+SNAPSHOT_META = "snapshot.json"
+
+_local = threading.local()
+
+
+class Snapshot(NamedTuple):
+    """
+    One consistent version of every dataset: the cleaned CSVs and the store beside them.
+
+    Args:
+        name (str): Snapshot name; None for the legacy layout.
+        data_dir (str): Directory of the cleaned CSV files.
+        store_dir (str): Root of the columnar store, indexes, count cubes and manifest.
+    """
+
+    name: str
+    data_dir: str
+    store_dir: str
+
+    def data_path(self, filename):
+        """Path of a cleaned output in this snapshot."""
+        return os.path.join(self.data_dir, filename)
+
+    def store_path(self, default_path):
+        """Path in this snapshot of one of the store's files, given its default path below STORE_DIR."""
+        return os.path.join(self.store_dir, os.path.relpath(default_path, STORE_DIR))
+
+
+LEGACY_SNAPSHOT = Snapshot(None, LEGACY_DATA_DIR, STORE_DIR)
+
+
+def snapshot_named(name, root=SNAPSHOT_DIR):
+    """Returns the snapshot with the given name below root."""
+    return Snapshot(name, os.path.join(root, name, "cleaned"), os.path.join(root, name, "store"))
+
+
+def current_snapshot(root=SNAPSHOT_DIR):
+    """
+    Resolves the snapshot the CURRENT pointer names.
+
+    Args:
+        root (str): Directory holding the snapshots and their pointer.
+
+    Returns:
+        Snapshot: The current snapshot; the legacy layout if no refresh has completed.
+    """
+    try:
+        with open(os.path.join(root, "CURRENT"), "r") as pointer:
+            return snapshot_named(pointer.read().strip(), root)
+    except FileNotFoundError:
+        return LEGACY_SNAPSHOT
+
+
+def swap_current(name, root=SNAPSHOT_DIR):
+    """
+    Points CURRENT at a completed snapshot.
+
+    The pointer is replaced in a single rename, so readers see either the old or the
+    new snapshot, never a mix of the two.
+
+    Args:
+        name (str): The snapshot to make current.
+        root (str): Directory holding the snapshots and their pointer.
+    """
+    with open(os.path.join(root, "CURRENT.tmp"), "w") as pointer:
+        pointer.write(name)
+        pointer.flush()
+        os.fsync(pointer.fileno())
+    os.replace(os.path.join(root, "CURRENT.tmp"), os.path.join(root, "CURRENT"))
+
+
+def read_snapshot_meta(snapshot):
+    """Returns the metadata recorded when a snapshot was built; empty for the legacy layout."""
+    if snapshot.name is None:
+        return {}
+    with open(os.path.join(os.path.dirname(snapshot.data_dir), SNAPSHOT_META), "r") as meta_file:
+        return json.load(meta_file)
+
+
+def list_snapshots(root=SNAPSHOT_DIR):
+    """Names of the completed snapshots below root, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        entry
+        for entry in os.listdir(root)
+        if os.path.exists(os.path.join(root, entry, SNAPSHOT_META))
+    )
+
+
+def prune_snapshots(keep, root=SNAPSHOT_DIR):
+    """
+    Deletes all but the newest completed snapshots, never the current one.
+
+    A session finishes the rerun it started on an older snapshot, so keep should
+    cover the snapshots swapped in during one rerun; memory-mapped files stay
+    readable after they are deleted.
+
+    Args:
+        keep (int): Number of snapshots to keep.
+        root (str): Directory holding the snapshots.
+    """
+    current = current_snapshot(root).name
+    for name in list_snapshots(root)[:-keep] if keep > 0 else list_snapshots(root):
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def pin_snapshot(snapshot=None):
+    """
+    Pins the current snapshot for the rest of this thread's page run.
+
+    Call at the top of a page script, so every dataset the rerun reads comes from the
+    same snapshot even if a refresh swaps CURRENT halfway through it.
+
+    Args:
+        snapshot (Snapshot, optional): Snapshot to pin instead of the current one, e.g. a
+                                       fixture built in a temporary directory.
+
+    Returns:
+        Snapshot: The pinned snapshot.
+    """
+    _local.snapshot = current_snapshot() if snapshot is None else snapshot
+    return _local.snapshot
+
+
+def active_snapshot():
+    """Returns the snapshot pinned for this thread, or the current one when none is pinned."""
+    snapshot = getattr(_local, "snapshot", None)
+    return snapshot if snapshot is not None else current_snapshot()
@@ -1,14 +1,19 @@
 import pandas as pd
 import streamlit as st
-from .utility_functions import to_pascal_case, annotate_abbreviations
+from . import count_cube as cc
+from .utility_functions import to_pascal_case, AbbreviationAnnotator, get_annotator
+from .profiling import timed
 
 
-def create_mpc_counts_table(dataframe):
+@timed
+def create_mpc_counts_table(dataframe, count_column=None):
     """
     Calculates SAVSNET MPC counts and generates a styled table with a loading spinner.
 
     Args:
-        dataframe (pandas.DataFrame): The DataFrame containing consultation data.
+        dataframe (pandas.DataFrame): The DataFrame containing consultation data, or a count cube slice.
+        count_column (str, optional): Column holding pre-aggregated counts, e.g. "Counts"
+                                      for a count cube. Rows are counted when None.
 
     Returns:
         pandas.Styler: A styled table showing the count of each SAVSNET MPC type.
@@ -18,7 +23,7 @@ def create_mpc_counts_table(dataframe):
             raise ValueError("The dataframe does not contain the 'SAVSNET MPC' column.")
 
         # Using value_counts to count occurrences of each type in 'SAVSNET MPC'
-        mpc_counts = dataframe["SAVSNET MPC"].value_counts().reset_index()
+        mpc_counts = cc.mpc_counts(dataframe, count_column).reset_index()
         mpc_counts.columns = [
             "Consultation Type",
             "Count",
@@ -46,7 +51,64 @@ def create_mpc_counts_table(dataframe):
     return styled_table
 
 
-def prepare_and_display_consult_data(df, filter_types=None, abbreviations=None):
+# Layout of a consultation card: details on the left, notes on the right
+CONSULT_CARD_STYLE = """<style>
+.consult-card {display: flex; gap: 2rem; padding: 1rem 0; border-bottom: 1px solid rgba(128, 128, 128, 0.4);}
+.consult-card .consult-details {flex: 1;}
+.consult-card .consult-details h3 {padding-top: 0;}
+.consult-card .consult-notes {flex: 3; text-align: justify; line-height: 1.6;}
+</style>"""
+
+
+@timed
+def escape_html(values):
+    """
+    Escapes HTML special characters across a whole Series at once.
+
+    Args:
+        values (pandas.Series): The values to escape.
+
+    Returns:
+        pandas.Series: Strings safe to place inside HTML text, with line breaks as <br>.
+    """
+    return (
+        values.astype(str)
+        .str.replace("&", "&amp;", regex=False)
+        .str.replace("<", "&lt;", regex=False)
+        .str.replace(">", "&gt;", regex=False)
+        .str.replace(r"\r?\n", "<br>", regex=True)
+    )
+
+
+@timed
+def build_consult_cards_html(df_display):
+    """
+    Builds one HTML block holding a card per consultation.
+
+    Args:
+        df_display (pandas.DataFrame): Rows with 'Patient Consultation ID', 'Consultation Type',
+                                       'Consultation Date' and 'Consultation Notes'. The notes
+                                       are inserted as HTML and must already be escaped.
+
+    Returns:
+        str: The cards, preceded by their stylesheet.
+    """
+    cards = (
+        '<div class="consult-card"><div class="consult-details"><h3>Consultation ID: '
+        + escape_html(df_display["Patient Consultation ID"])
+        + "</h3><p><strong>Type:</strong> "
+        + escape_html(df_display["Consultation Type"])
+        + "</p><p><strong>Date:</strong> "
+        + escape_html(df_display["Consultation Date"])
+        + '</p></div><div class="consult-notes"><strong>Notes:</strong> '
+        + df_display["Consultation Notes"].astype(str)
+        + "</div></div>"
+    )
+    return CONSULT_CARD_STYLE + "".join(cards.tolist())
+
+
+@timed
+def prepare_and_display_consult_data(df, filter_types=None, abbreviations=None, version=None):
     with st.spinner("Processing consultation data..."):
         required_columns = [
             "SAVSNET_consult_id",
@@ -68,28 +130,25 @@ def prepare_and_display_consult_data(df, filter_types=None, abbreviations=None):
             inplace=True,
         )
 
-        df_display["Consultation Type"] = df_display["Consultation Type"].apply(to_pascal_case)
+        # Maps each category once rather than every row, since the types are categorical
+        df_display["Consultation Type"] = df_display["Consultation Type"].map(to_pascal_case)
         df_display["Consultation Date"] = pd.to_datetime(df_display["Consultation Date"]).dt.strftime("%Y-%m-%d %H:%M:%S")
 
         if filter_types:
             df_display = df_display[df_display["Consultation Type"].isin(filter_types)]
 
+        # Escape the notes before annotating, so only the tooltips are markup
+        df_display["Consultation Notes"] = escape_html(df_display["Consultation Notes"])
+
         if abbreviations:
-            df_display["Consultation Notes"] = df_display["Consultation Notes"].apply(
-                lambda x: annotate_abbreviations(x, abbreviations)
+            # Accept either a ready annotator or a plain abbreviation dictionary
+            if not isinstance(abbreviations, AbbreviationAnnotator):
+                abbreviations = get_annotator(abbreviations)
+            df_display["Consultation Notes"] = abbreviations.annotate_series(
+                df_display["Consultation Notes"], keys=df_display["Patient Consultation ID"], version=version
             )
 
-        # Display each entry as a card
-        for _, row in df_display.iterrows():
-            with st.container():
-                col1, col2 = st.columns([1, 3])
-                with col1:
-                    st.subheader(f"Consultation ID: {row['Patient Consultation ID']}")
-                    st.write(f"**Type:** {row['Consultation Type']}")
-                    st.write(f"**Date:** {row['Consultation Date']}")
-                with col2:
-                    # Apply inline styles for justification and line spacing
-                    st.markdown(f"<div style='text-align: justify; line-height: 1.6;'><strong>Notes:</strong> {row['Consultation Notes']}</div>", unsafe_allow_html=True)
-                st.markdown("---")  # Optional line separator
+        # Display the whole page of cards as a single element
+        st.markdown(build_consult_cards_html(df_display), unsafe_allow_html=True)
 
         return None  # This function does not return anything as it directly renders in Streamlit
@@ -0,0 +1,136 @@
+import io
+import re
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from wordcloud import STOPWORDS, WordCloud
+from .profiling import timed
+
+# Same word pattern WordCloud uses when it tokenizes text itself
+WORD_PATTERN = re.compile(r"\w[\w']+")
+
+
+class TermFrequencies:
+    """
+    Per-row token counts for a text column, computed once.
+
+    Counts are stored as three aligned arrays (row, term, count), so the frequencies of
+    any subset of rows are a single weighted bincount instead of re-tokenizing the text.
+    Terms are counted case-insensitively and shown in their most common spelling,
+    with stop words and bare numbers left out like WordCloud does.
+
+    Args:
+        texts (pandas.Series): The text column. Rows are addressed by position.
+    """
+
+    def __init__(self, texts):
+        term_ids = {}
+        spellings = []
+        rows, terms, counts = [], [], []
+        for position, text in enumerate(texts.tolist()):
+            if not isinstance(text, str):
+                continue
+            row_counts = Counter()
+            for word in WORD_PATTERN.findall(text):
+                key = word.lower()
+                if key in STOPWORDS or key.isdigit():
+                    continue
+                if key not in term_ids:
+                    term_ids[key] = len(term_ids)
+                    spellings.append(Counter())
+                spellings[term_ids[key]][word] += 1
+                row_counts[term_ids[key]] += 1
+            for term, count in row_counts.items():
+                rows.append(position)
+                terms.append(term)
+                counts.append(count)
+
+        self.size = len(texts)
+        self.terms = [spelling.most_common(1)[0][0] for spelling in spellings]
+        self.rows = np.asarray(rows, dtype="int64")
+        self.term_ids = np.asarray(terms, dtype="int64")
+        self.counts = np.asarray(counts, dtype="float64")
+
+    @timed
+    def frequencies(self, positions=None):
+        """
+        Sums term counts over a subset of rows.
+
+        Args:
+            positions (array-like, optional): Row positions to include. Defaults to all rows.
+
+        Returns:
+            dict: Term mapped to its total count, without zero counts.
+        """
+        if positions is None:
+            term_ids, counts = self.term_ids, self.counts
+        else:
+            selected = np.zeros(self.size, dtype=bool)
+            selected[np.asarray(positions, dtype="int64")] = True
+            mask = selected[self.rows]
+            term_ids, counts = self.term_ids[mask], self.counts[mask]
+        totals = np.bincount(term_ids, weights=counts, minlength=len(self.terms))
+        return {self.terms[i]: float(totals[i]) for i in np.flatnonzero(totals)}
+
+
+@timed
+def render_word_cloud(frequencies, width=800, height=400, colormap="viridis"):
+    """
+    Renders a word cloud from term frequencies as PNG bytes, without going through matplotlib.
+
+    Args:
+        frequencies (dict): Term mapped to its weight.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        colormap (str): Matplotlib colormap name used to colour the words.
+
+    Returns:
+        bytes: The PNG image, or None if there are no terms to draw.
+    """
+    if not frequencies:
+        return None
+    wordcloud = WordCloud(width=width, height=height, colormap=colormap)
+    image = wordcloud.generate_from_frequencies(frequencies).to_image()
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageCache:
+    """
+    Bounded, thread-safe LRU cache of rendered images.
+
+    Args:
+        max_entries (int): Number of images kept before the least recently used is dropped.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        """
+        Returns the cached image for key, calling render() to create it on a miss.
+
+        Args:
+            key (tuple): Hashable signature of everything the image depends on.
+            render (callable): Produces the image when it is not cached.
+
+        Returns:
+            The cached or freshly rendered image.
+        """
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+        image = render()
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+        return image
+
+
+# Word clouds shared by every session, keyed by dataset version and filter signature
+WORD_CLOUD_CACHE = ImageCache(max_entries=32)
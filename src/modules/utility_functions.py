@@ -1,6 +1,13 @@
 import re
+import html
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 import pandas as pd
+from .excel_ingest import read_workbook
+from .profiling import timed
 
 def to_pascal_case(text):
     """
@@ -22,20 +29,161 @@ def pascal_to_space_pascal(pascal_string):
         result += char
     return result
 
-def annotate_abbreviations(text, abbrev_dict):
-    """Annotate abbreviations in text with HTML tooltips, adding color and background styling."""
-    # Regex to find abbreviations, matching whole words only
-    regex_pattern = (
-        r"\b(" + "|".join(re.escape(abbrev) for abbrev in abbrev_dict.keys()) + r")\b"
-    )
+# Styling applied to every annotated abbreviation
+ABBREVIATION_STYLE = "text-decoration: underline; font-style: italic; background-color: #FFFF99; color: #CC0000;"
+
+
+class AbbreviationAnnotator:
+    """
+    Annotates abbreviations in consultation narratives with HTML tooltips.
 
-    # Replacement function to add tooltips and style
-    def replace(match):
+    The abbreviations are compiled once into a single trie-shaped pattern, so the
+    regex engine follows shared prefixes instead of trying every alternative in turn.
+    Matching is whole-word and case-insensitive, and meanings are looked up with the
+    case-folded abbreviation so that variants such as "hx" and "Hx" resolve to "HX".
+
+    The annotator is shared by every session, so its cache of annotated narratives is
+    guarded by a lock. Cached narratives are keyed by dataset version, abbreviation table
+    and consult id, so a refreshed dataset or an edited table is never served stale markup.
+
+    Args:
+        abbrev_dict (dict): Abbreviations mapped to their meanings.
+        cache_size (int): Number of annotated narratives kept.
+    """
+
+    def __init__(self, abbrev_dict, cache_size=10000):
+        self.meanings = {abbrev.casefold(): meaning for abbrev, meaning in abbrev_dict.items()}
+        # Hash of the abbreviation table, part of every cache key
+        self.table_hash = hashlib.sha256(
+            json.dumps(sorted(abbrev_dict.items()), ensure_ascii=False).encode()
+        ).hexdigest()
+        trie = {}
+        for abbrev in self.meanings:
+            node = trie
+            for char in abbrev:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        # Only whole words match: no word character may touch either end, except after
+        # abbreviations that already end in punctuation such as "C+" or "F/W"
+        self.pattern = re.compile(
+            r"(?<!\w)(?:" + self._trie_to_regex(trie) + r")(?:(?<=\w)(?!\w)|(?<!\w))",
+            flags=re.IGNORECASE,
+        )
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _trie_to_regex(cls, node):
+        # Longer continuations first so the longest abbreviation wins
+        branches = [
+            re.escape(char) + cls._trie_to_regex(child)
+            for char, child in sorted(node.items(), reverse=True)
+            if char
+        ]
+        if "" in node:
+            if not branches:
+                return ""
+            return "(?:" + "|".join(branches) + ")?"
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    def _replace(self, match):
+        abbrev = match.group(0)
+        # Meanings come from the workbook and end up in markup rendered as HTML
+        title = html.escape(self.meanings.get(abbrev.casefold(), "Unknown abbreviation"), quote=True)
+        return f'<span title="{title}" style="{ABBREVIATION_STYLE}">{abbrev}</span>'
+
+    def annotate(self, text):
+        """
+        Annotates a single narrative.
+
+        Args:
+            text (str): The narrative text.
+
+        Returns:
+            str: The text with each abbreviation wrapped in a styled tooltip span.
+        """
+        return self.pattern.sub(self._replace, text)
+
+    @timed
+    def annotate_series(self, texts, keys=None, version=None):
+        """
+        Annotates a whole Series of narratives at once.
+
+        Args:
+            texts (pandas.Series): The narratives.
+            keys (pandas.Series, optional): Consult ids aligned with texts. When given,
+                                            annotated narratives are cached by id.
+            version (str, optional): Version key of the dataset the narratives were read
+                                     from, e.g. data_access.consultation_store_version().
+
+        Returns:
+            pandas.Series: The annotated narratives, with the same index as texts.
+        """
+        if keys is None:
+            return texts.astype(str).str.replace(self.pattern, self._replace, regex=True)
+
+        keys = [(version, self.table_hash, key) for key in keys.tolist()]
+        # Results are collected locally, so another session evicting a key cannot lose it
+        with self._lock:
+            found = {key: self._cache[key] for key in keys if key in self._cache}
+        missing = [position for position, key in enumerate(keys) if key not in found]
+        if missing:
+            annotated = texts.iloc[missing].astype(str).str.replace(
+                self.pattern, self._replace, regex=True
+            )
+            for position, value in zip(missing, annotated):
+                found[keys[position]] = value
+        with self._lock:
+            for key in keys:
+                self._cache[key] = found[key]
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return pd.Series([found[key] for key in keys], index=texts.index, dtype=object)
+
+    def _expand(self, match):
         abbrev = match.group(0)
-        title = abbrev_dict.get(abbrev.upper(), "Unknown abbreviation")
-        # Added background color (light yellow) and text color (dark red) for emphasis
-        return f'<span title="{title}" style="text-decoration: underline; font-style: italic; background-color: #FFFF99; color: #CC0000;">{abbrev}</span>'
-    return re.sub(regex_pattern, replace, text, flags=re.IGNORECASE)
+        meaning = self.meanings.get(abbrev.casefold())
+        return f"{abbrev} ({meaning})" if meaning else abbrev
+
+    def expand_series(self, texts):
+        """
+        Spells out the abbreviations of a Series of narratives as plain text, for exports.
+
+        Args:
+            texts (pandas.Series): The narratives.
+
+        Returns:
+            pandas.Series: The narratives with each abbreviation followed by its meaning
+                           in brackets, e.g. "O/E (On examination)".
+        """
+        return texts.astype(str).str.replace(self.pattern, self._expand, regex=True)
+
+
+@lru_cache(maxsize=8)
+def _annotator_for(items):
+    return AbbreviationAnnotator(dict(items))
+
+
+def get_annotator(abbrev_dict):
+    """
+    Returns a shared annotator for an abbreviation dictionary, building it only once.
+
+    Args:
+        abbrev_dict (dict): Abbreviations mapped to their meanings.
+
+    Returns:
+        AbbreviationAnnotator: The compiled annotator.
+    """
+    return _annotator_for(tuple(sorted(abbrev_dict.items())))
+
+
+def annotate_abbreviations(text, abbrev_dict):
+    """Annotate abbreviations in text with HTML tooltips, adding color and background styling."""
+    return get_annotator(abbrev_dict).annotate(text)
 
 def load_file(filepath):
     """Loads JSON data from a file.
@@ -74,10 +222,17 @@ def get_abbreviations_dict(filepath):
     abbreviations_dict = {item["Abbreviation"]: item["Meaning"] for item in data}
     return abbreviations_dict
 
-def load_xlsx(filepath):
-    sheets = {
-        sheet_name: pd.read_excel(filepath, sheet_name=sheet_name)
-        for sheet_name in pd.ExcelFile(filepath).sheet_names
-    }
+def load_xlsx(filepath, workers=1):
+    """
+    Loads every sheet of an Excel file, opening the workbook once.
+
+    Args:
+        filepath (str): Path to the Excel file.
+        workers (int): Worker processes to parse the sheets with; see excel_ingest.read_workbook.
+
+    Returns:
+        dict: Sheet names mapped to their DataFrames.
+    """
+    sheets, _ = read_workbook(filepath, workers=workers)
     return sheets
 
@@ -0,0 +1,140 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from .profiling import register_gauges
+
+# Bytes the shared views may hold in total; set DASHBOARD_VIEW_BUDGET_MB to size it
+VIEW_BUDGET_BYTES = int(float(os.environ.get("DASHBOARD_VIEW_BUDGET_MB", "256")) * 2**20)
+
+
+def estimate_bytes(value):
+    """
+    Estimates the memory held by a cached value.
+
+    Args:
+        value: A DataFrame, Series, numpy array, a tuple of these, or any other object.
+
+    Returns:
+        int: Bytes, counting the Python strings held by object columns.
+    """
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(estimate_bytes(item) for item in value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True, index=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class ViewStore:
+    """
+    Process-wide, thread-safe LRU cache of views derived from the base datasets.
+
+    Views are filtered subsets and aggregates keyed by the dataset version and the
+    filter spec that produced them, so every session asking for the same selection
+    shares one copy. The least recently used views are evicted once their total size
+    passes the byte budget. Cached views are shared and must not be modified; callers
+    hand out shallow copies, as the loaders in data_access do.
+
+    Args:
+        budget_bytes (int): Most bytes the cached views may hold together.
+    """
+
+    def __init__(self, budget_bytes=VIEW_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._views = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._computing = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached view for key, calling compute() to create it on a miss.
+
+        Sessions asking for a view that is being computed wait for it rather than
+        computing it again.
+
+        Args:
+            key (tuple): Hashable signature of the view: its kind, dataset version and filter spec.
+            compute (callable): Produces the view when it is not cached.
+
+        Returns:
+            The cached or freshly computed view.
+        """
+        with self._lock:
+            if key in self._views:
+                self._views.move_to_end(key)
+                self.hits += 1
+                return self._views[key][0]
+            key_lock = self._computing.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._views:
+                    self._views.move_to_end(key)
+                    self.hits += 1
+                    return self._views[key][0]
+                self.misses += 1
+            try:
+                value = compute()
+                self._add(key, value)
+            finally:
+                with self._lock:
+                    self._computing.pop(key, None)
+        return value
+
+    def _add(self, key, value):
+        size = estimate_bytes(value)
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        with self._lock:
+            if size > self.budget_bytes:
+                # Larger than the whole budget: handed out once, never cached
+                self.rejections += 1
+                return
+            self._views[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.budget_bytes:
+                _, (_, evicted_size) = self._views.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Reports the counters used to size the budget.
+
+        Returns:
+            dict: Hits, misses, evictions, rejected oversized views, cached views, bytes
+                  held, the budget, and the hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejections": self.rejections,
+                "entries": len(self._views),
+                "bytes": self._bytes,
+                "budget_bytes": self.budget_bytes,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Views shared by every session of this process
+VIEWS = ViewStore()
+register_gauges("view_store", VIEWS.stats)
@@ -1,14 +1,20 @@
 import streamlit as st
-import pandas as pd
 from modules import chart_functions as cf
 from modules import table_functions as tf
-
-# Data Loading (adjust paths if needed)
-df_cats = pd.read_csv("data/cleaned/cats_consultations.csv")
-df_dogs = pd.read_csv("data/cleaned/dogs_consultations.csv")
-df_other = pd.read_csv("data/cleaned/other_species_consultations.csv")
+from modules import profiling
+from modules.data_access import (
+    consultation_store_version,
+    dataset_manifest,
+    load_count_cube,
+    load_count_rollup,
+    pin_snapshot,
+)
+from modules.figure_cache import FIGURES
 
 st.set_page_config(layout="wide")
+profiling.start_rerun("01_dashboards")
+# Read every dataset of this rerun from one snapshot, even if a refresh swaps it meanwhile
+pin_snapshot()
 
 # Inject custom CSS to improve tab readability
 st.markdown(
@@ -32,115 +38,86 @@ st.markdown(
 # Header
 st.title("Veterinary Management Dashboard")
 
-# Main Tabs for Species
-cats_tab, dogs_tab, other_tab = st.tabs(["Cats", "Dogs", "Other Species"])
+# Species shown on the dashboard, with the prefix of their widget keys
+SPECIES = {"Cats": "cats", "Dogs": "dogs", "Other Species": "other"}
 
-with cats_tab:
-        # Add filters for Year and Consultation Type
-    df_cats['Consult_date'] = pd.to_datetime(df_cats['Consult_date'])
-    unique_years = df_cats['Consult_date'].dt.year.unique().tolist()
-    selected_year = st.selectbox('Select Year', options=unique_years, index=unique_years.index(2018))
+# Time series granularities offered on the dashboard
+GRANULARITIES = ["Daily", "Weekly", "Monthly", "Quarterly"]
 
-    consultation_types = df_cats['SAVSNET MPC'].unique().tolist()
-    selected_consultation_types = st.multiselect('Select Consultation Types', options=consultation_types, default=['vaccination'])
 
-    # Filter the dataframe based on the selected filters
-    filtered_df_cats = df_cats[(df_cats['Consult_date'].dt.year == selected_year) & (df_cats['SAVSNET MPC'].isin(selected_consultation_types))]
-
-    row1_col1, row1_col2 = st.columns(2)
+def show_chart(fig, highlight):
+    """Draws a chart with its significant values in red and bold below it."""
+    with profiling.span("emit: plotly_chart"):
+        st.plotly_chart(fig, use_container_width=True)
+    st.markdown(f"<p style='color:red; font-weight:bold;'>{highlight}</p>", unsafe_allow_html=True)
 
-    with row1_col1:
-        st.title("Filtered Consultation Counts")
-        cats_table = tf.create_mpc_counts_table(filtered_df_cats)
-        st.table(cats_table)
 
-    with row1_col2:
-        st.title("Filtered Consultation Distribution")
-        cat_chart = cf.create_mpc_bar_chart(filtered_df_cats, f"Cats: Consultation Types in {selected_year}")
-        st.plotly_chart(cat_chart, use_container_width=True)
-        
-    row2_col1, row2_col2 = st.columns(2)
+def dashboard_section(species, key_prefix):
+    """
+    Renders the filters, table and charts of one species.
 
-    with row2_col1:
-        st.title("Consultation Frequency Over Time")
-        time_series_fig = cf.plot_consultation_frequency(filtered_df_cats, "Consultation Frequency Over Time")
-        st.plotly_chart(time_series_fig, use_container_width=True)
+    Args:
+        species (str): Species name, as in the count cube and the manifest.
+        key_prefix (str): Prefix of the species' widget keys.
+    """
+    # Add filters for Year and Consultation Type
+    # Widget options come from the ETL manifest, without loading any data
+    species_manifest = dataset_manifest(species)
+    unique_years = species_manifest['years']
+    selected_year = st.selectbox('Select Year', options=unique_years, index=unique_years.index(2018), key=f'{key_prefix}_year')
 
-    with row2_col2:
-        st.title("Consultation Heatmap")
-        heatmap_fig_cats = cf.plot_consultation_heatmap(filtered_df_cats,"Consult_date", "Consultation Frequency by Day and Time")
-        st.plotly_chart(heatmap_fig_cats, use_container_width=True)
+    consultation_types = species_manifest['distinct_values']['SAVSNET MPC']
+    selected_consultation_types = st.multiselect('Select Consultation Types', options=consultation_types, default=['vaccination'], key=f'{key_prefix}_consultation_types')
 
-with dogs_tab:
-    
-    # Add filters for Year and Consultation Type
-    df_dogs['Consult_date'] = pd.to_datetime(df_dogs['Consult_date'])
-    unique_years = df_dogs['Consult_date'].dt.year.unique().tolist()
-    selected_year = st.selectbox('Select Year', options=unique_years, index=unique_years.index(2018))
+    # Filter the precomputed counts based on the selected filters
+    filtered_df = load_count_cube(species, years=[selected_year], mpc_types=selected_consultation_types)
 
-    consultation_types = df_dogs['SAVSNET MPC'].unique().tolist()
-    selected_consultation_types = st.multiselect('Select Consultation Types', options=consultation_types, default=['vaccination'])
+    if filtered_df["Counts"].sum() == 0:
+        st.info("No consultations match the selected filters.")
+        return
 
-    # Filter the dataframe based on the selected filters
-    filtered_df_dogs = df_dogs[(df_dogs['Consult_date'].dt.year == selected_year) & (df_dogs['SAVSNET MPC'].isin(selected_consultation_types))]
+    # Figures are built once per dataset version and filter selection, for every session
+    version = consultation_store_version()
+    filters = {"species": species, "years": [selected_year], "mpc_types": selected_consultation_types}
 
     row1_col1, row1_col2 = st.columns(2)
 
     with row1_col1:
         st.title("Filtered Consultation Counts")
-        dogs_table = tf.create_mpc_counts_table(filtered_df_dogs)
-        st.table(dogs_table)
+        counts_table = tf.create_mpc_counts_table(filtered_df, count_column="Counts")
+        with profiling.span("emit: table"):
+            st.table(counts_table)
 
     with row1_col2:
         st.title("Filtered Consultation Distribution")
-        dog_chart = cf.create_mpc_bar_chart(filtered_df_dogs, f"Dogs: Consultation Types in {selected_year}")
-        st.plotly_chart(dog_chart, use_container_width=True)
-        
+        show_chart(*FIGURES.get_or_build(version, filters, cf.create_mpc_bar_chart, filtered_df, f"{species}: Consultation Types in {selected_year}", count_column="Counts"))
+
     row2_col1, row2_col2 = st.columns(2)
 
     with row2_col1:
         st.title("Consultation Frequency Over Time")
-        time_series_fig = cf.plot_consultation_frequency(filtered_df_dogs, "Consultation Frequency Over Time")
-        st.plotly_chart(time_series_fig, use_container_width=True)
+        granularity = st.selectbox('Granularity', options=GRANULARITIES, index=GRANULARITIES.index('Quarterly'), key=f'{key_prefix}_granularity')
+        # Counts per period are rolled up once per dataset version, not per rerun
+        rollup_df = load_count_rollup(granularity, species, years=[selected_year], mpc_types=selected_consultation_types)
+        show_chart(*FIGURES.get_or_build(version, filters, cf.plot_consultation_frequency, rollup_df, "Consultation Frequency Over Time", count_column="Counts", granularity=granularity, period_column="Period_end"))
 
     with row2_col2:
         st.title("Consultation Heatmap")
-        heatmap_fig_dogs = cf.plot_consultation_heatmap(filtered_df_dogs,"Consult_date", "Consultation Frequency by Day and Time")
-        st.plotly_chart(heatmap_fig_dogs, use_container_width=True)
-
-with other_tab:
-    
-    # Add filters for Year and Consultation Type
-    df_other['Consult_date'] = pd.to_datetime(df_other['Consult_date'])
-    unique_years = df_other['Consult_date'].dt.year.unique().tolist()
-    selected_year = st.selectbox('Select Year', options=unique_years, index=unique_years.index(2018))
+        show_chart(*FIGURES.get_or_build(version, filters, cf.plot_consultation_heatmap, filtered_df, "Consult_date", "Consultation Frequency by Day and Time", count_column="Counts"))
 
-    consultation_types = df_other['SAVSNET MPC'].unique().tolist()
-    selected_consultation_types = st.multiselect('Select Consultation Types', options=consultation_types, default=['vaccination'])
 
-    # Filter the dataframe based on the selected filters
-    filtered_df_other = df_other[(df_other['Consult_date'].dt.year == selected_year) & (df_other['SAVSNET MPC'].isin(selected_consultation_types))]
-
-    row1_col1, row1_col2 = st.columns(2)
-
-    with row1_col1:
-        st.title("Filtered Consultation Counts")
-        other_table = tf.create_mpc_counts_table(filtered_df_other)
-        st.table(other_table)
+# Streamlit drops the state of widgets that are not drawn in a rerun, so the filters of
+# the hidden species are kept alive here and come back as they were left
+for key_prefix in SPECIES.values():
+    for key in (f"{key_prefix}_year", f"{key_prefix}_consultation_types", f"{key_prefix}_granularity"):
+        if key in st.session_state:
+            st.session_state[key] = st.session_state[key]
 
-    with row1_col2:
-        st.title("Filtered Consultation Distribution")
-        other_chart = cf.create_mpc_bar_chart(filtered_df_other, f"Other Species: Consultation Types in {selected_year}")
-        st.plotly_chart(other_chart, use_container_width=True)
-        
-    row2_col1, row2_col2 = st.columns(2)
+# Species selector in place of tabs, since every tab body runs on every rerun whether
+# it is visible or not; only the selected species is computed
+selected_species = st.radio("Species", options=list(SPECIES), horizontal=True, key="dashboard_species")
 
-    with row2_col1:
-        st.title("Consultation Frequency Over Time")
-        time_series_fig = cf.plot_consultation_frequency(filtered_df_other, "Consultation Frequency Over Time")
-        st.plotly_chart(time_series_fig, use_container_width=True)
+with profiling.span(f"dashboards: {selected_species}"):
+    dashboard_section(selected_species, SPECIES[selected_species])
 
-    with row2_col2:
-        st.title("Consultation Heatmap")
-        heatmap_fig_others = cf.plot_consultation_heatmap(filtered_df_other,"Consult_date", "Consultation Frequency by Day and Time")
-        st.plotly_chart(heatmap_fig_others, use_container_width=True)
+profiling.finish_rerun()
@@ -1,26 +1,40 @@
 import streamlit as st
-import pandas as pd
+from modules import profiling
+from modules.bitmap_index import where
+from modules.exports import EXPORT_FORMATS, keep_session_export, offer_download, session_export
 from modules.table_functions import prepare_and_display_consult_data
-from modules.utility_functions import to_pascal_case, get_abbreviations_dict
+from modules.utility_functions import to_pascal_case, get_abbreviations_dict, get_annotator
+from modules.data_access import (
+    SPECIES_VALUES,
+    consultation_store_version,
+    dataset_manifest,
+    export_consultations,
+    load_row_reader,
+    pin_snapshot,
+    select_consultation_rows,
+)
 
 # Set page configuration
 st.set_page_config(page_title="Consultation History", layout="wide")
+profiling.start_rerun("02_consultations")
+# Read every dataset of this rerun from one snapshot, even if a refresh swaps it meanwhile
+pin_snapshot()
 
-# Load abbreviations dictionary from JSON
-abbreviations = get_abbreviations_dict("data/raw/commonly_used_terms.json")
+# Load abbreviations dictionary from JSON; the compiled annotator is shared across reruns
+abbreviations = get_annotator(get_abbreviations_dict("data/raw/commonly_used_terms.json"))
 
-# Prepare unique consultation types
-consult_types_path = "data/cleaned/"
-all_consult_types = pd.concat(
-    [
-        pd.read_csv(f"{consult_types_path}cats_consultations.csv")["SAVSNET MPC"],
-        pd.read_csv(f"{consult_types_path}dogs_consultations.csv")["SAVSNET MPC"],
-        pd.read_csv(f"{consult_types_path}other_species_consultations.csv")[
-            "SAVSNET MPC"
-        ],
-    ]
-).unique()
-all_consult_types = pd.Series(all_consult_types).map(to_pascal_case).unique()
+# Prepare unique consultation types from the ETL manifest
+raw_consult_types = sorted(
+    set().union(
+        *[dataset_manifest(species)["distinct_values"]["SAVSNET MPC"] for species in SPECIES_VALUES]
+    )
+)
+# Display name of each consultation type mapped back to every stored value shown under it,
+# since values such as "post_op" and "Post Op" get the same name
+consult_type_values = {}
+for value in raw_consult_types:
+    consult_type_values.setdefault(to_pascal_case(value), []).append(value)
+all_consult_types = list(consult_type_values)
 
 # Page title
 st.title("Consultation History")
@@ -28,13 +42,8 @@ st.title("Consultation History")
 # Define tab selection based on user interaction
 tab_selection = st.sidebar.selectbox("Select Species", ["Cats", "Dogs", "Other Species"])
 
-# Determine file path based on selection
-selected_file_path = (
-    f"{consult_types_path}{tab_selection.lower().replace(' ', '_')}_consultations.csv"
-)
-
-# Load data only for the selected species
-df = pd.read_csv(selected_file_path)
+# Row-offset reader for the selected species; rows are parsed only when they are displayed
+reader = load_row_reader(tab_selection)
 
 # Apply consultation type filter
 selected_types = st.sidebar.multiselect(
@@ -44,22 +53,71 @@ selected_types = st.sidebar.multiselect(
     key=f"{tab_selection}_consult_type",
 )
 
-# Filter data by selected types
-filtered_data = df[df["SAVSNET MPC"].map(to_pascal_case).isin(selected_types)]
+# Filter data by selected types by combining the precomputed bitmaps of the index; the
+# positions of each selection are shared by every session
+filter_spec = where(
+    {"SAVSNET MPC": [value for name in selected_types for value in consult_type_values[name]]}
+)
+
+# Search the narratives through the ETL's inverted index rather than scanning them
+query = st.sidebar.text_input(
+    "Search Narratives:",
+    key=f"{tab_selection}_narrative_query",
+    help='Every word must match. Use "quotes" for phrases and * for prefixes, e.g. lame "right fore" melox*. '
+    "Abbreviations also match their meanings.",
+)
+# Rows matching the filters, best narrative matches first when searching
+filtered_rows = select_consultation_rows(tab_selection, filter_spec, query)
+
+# Export the whole selection, read and written a chunk at a time
+with st.sidebar.expander("Export"):
+    export_format = st.selectbox("Format", list(EXPORT_FORMATS), key=f"{tab_selection}_export_format")
+    annotated = st.checkbox(
+        "Include annotated narratives",
+        key=f"{tab_selection}_export_annotated",
+        help="Adds a column with every abbreviation followed by its meaning.",
+    )
+    # Each session gets its own file, kept until it exports another selection
+    export_selection = (
+        consultation_store_version(), tab_selection, filter_spec, " ".join(query.split()), export_format, annotated
+    )
+    export_file = session_export("consultations_export_file", export_selection)
+    exported = export_file is None and st.button(
+        f"Export {len(filtered_rows)} consultations", key=f"{tab_selection}_export"
+    )
+    if exported:
+        with st.spinner("Exporting consultations..."):
+            export_file = export_consultations(tab_selection, filter_spec, query, export_format, annotated)
+        keep_session_export("consultations_export_file", export_selection, export_file)
+    if export_file is not None:
+        offer_download(
+            export_file,
+            tab_selection.lower().replace(" ", "_") + "_consultations",
+            export_format,
+            key=f"{tab_selection}_download",
+            prepared=exported,
+        )
 
 # Pagination setup
-items_per_page = 10  # Set the number of items you want per page
-max_pages = len(filtered_data) // items_per_page + (
-    1 if len(filtered_data) % items_per_page > 0 else 0
+items_per_page = st.sidebar.selectbox(
+    "Consultations per page", [10, 25, 50, 100, 250, 500]
+)  # Cards are rendered as one block, so larger pages stay cheap
+max_pages = max(
+    1, len(filtered_rows) // items_per_page + (1 if len(filtered_rows) % items_per_page > 0 else 0)
 )
 current_page = st.sidebar.number_input("Page", 1, max_pages, 1)  # Input for page selection
 start_index = (
     (current_page - 1) * items_per_page
 )  # Calculate the starting index of the current page
 end_index = start_index + items_per_page  # Calculate the ending index of the current page
-page_data = filtered_data.iloc[
-    start_index:end_index
-]  # Slice the DataFrame for the current page
+if len(filtered_rows) == 0:
+    st.info("No consultations match the selected filters.")
+else:
+    page_data = reader.read_rows(
+        filtered_rows[start_index:end_index]
+    )  # Read only the rows of the current page
+
+    # Display the consultation data for the current page
+    prepare_and_display_consult_data(page_data, abbreviations=abbreviations, version=consultation_store_version())
 
-# Display the consultation data for the current page
-prepare_and_display_consult_data(page_data, abbreviations=abbreviations)
+profiling.finish_rerun()
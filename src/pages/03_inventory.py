@@ -1,76 +1,40 @@
 from typing import Counter
+import hashlib
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+from modules.chart_functions import plot_time_series
+from modules.exports import EXPORT_FORMATS, keep_session_export, offer_download, session_export
+from modules.figure_cache import FIGURES
 from modules.utility_functions import pascal_to_space_pascal
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-
-# Path to your cleaned data
-DATA_DIR = "data/cleaned/"
-
-
-# Function to load a specific CSV file
-def load_data(sheet_name):
-    filename = f"{DATA_DIR}{''.join(sheet_name.split())}.csv"
-    return pd.read_csv(filename)
-
-
-# Function to plot time-series analysis grouped by decade
-def plot_time_series(df, date_column, title):
-    df[date_column] = pd.to_datetime(df[date_column])
-    
-    # Group data by year
-    df['Year'] = df[date_column].dt.year
-    
-    # Count number of products per year
-    year_data = df.groupby('Year').size().reset_index(name='Count')
-    
-    # Group data by decade
-    df['Decade'] = (df['Year'] // 10) * 10
-    
-    # Count number of products per decade
-    decade_data = df.groupby('Decade').size().reset_index(name='Decade_Count')
-    
-    # Create a bar chart for the number of products per year
-    bar_fig = px.bar(year_data, x='Year', y='Count', labels={'Year': 'Year', 'Count': 'Number of Products'})
-    
-    # Create a line plot for the number of products per decade
-    line_fig = go.Figure()
-    line_fig.add_trace(go.Scatter(x=decade_data['Decade'], y=decade_data['Decade_Count'],
-                                   mode='lines+markers', name='Decade Count', line=dict(color='blue')))
-    
-    # Set the same y-axis range for both plots
-    y_max = max(year_data['Count'].max(), decade_data['Decade_Count'].max())
-    bar_fig.update_yaxes(range=[0, y_max])
-    line_fig.update_yaxes(range=[0, y_max])
-    
-    # Combine both plots
-    bar_fig.update_traces(marker_color='rgba(50, 171, 96, 0.7)', marker_line_color='rgba(50, 171, 96, 1)', 
-                          marker_line_width=1.5, opacity=0.7)
-    bar_fig.add_trace(line_fig.data[0])
-    
-    # Set layout properties
-    bar_fig.update_layout(title=title, xaxis_title='Year', yaxis_title='Number of Products', 
-                          legend_title_text='Legend', barmode='overlay', bargap=0.05)
-    
-    return bar_fig
-
-
-# Function to perform text analysis and plot word cloud as image
-def plot_word_cloud(df, column):
-    text = " ".join(df[column].dropna().values)
-    wordcloud = WordCloud(width=800, height=400, colormap="viridis").generate(text)
-
-    # Generate the word cloud image
-    plt.figure(figsize=(10, 5))
-    plt.imshow(wordcloud, interpolation="bilinear")
-    plt.axis("off")
+from modules.data_access import (
+    export_products,
+    load_filtered_products,
+    load_product_search_index,
+    load_term_frequencies,
+    pin_snapshot,
+    product_version,
+)
+from modules.term_frequencies import WORD_CLOUD_CACHE, render_word_cloud
+from modules import profiling
+
+# Function to plot the word cloud of a column for the currently filtered rows
+def plot_word_cloud(df, column, sheet_name):
+    term_frequencies = load_term_frequencies(sheet_name, column)
+    # The filtered rows themselves are the filter signature, whichever widgets produced them
+    filter_signature = hashlib.blake2b(df.index.to_numpy(dtype="int64").tobytes()).hexdigest()
+    cache_key = (sheet_name, product_version(sheet_name), column, filter_signature)
+    image = WORD_CLOUD_CACHE.get_or_render(
+        cache_key, lambda: render_word_cloud(term_frequencies.frequencies(df.index))
+    )
 
     # Display the word cloud image using Streamlit
-    st.image(wordcloud.to_array(), use_column_width=True)
+    if image is not None:
+        with profiling.span("emit: image"):
+            st.image(image, use_column_width=True)
+
 
+profiling.start_rerun("03_inventory")
+# Read every dataset of this rerun from one snapshot, even if a refresh swaps it meanwhile
+pin_snapshot()
 
 # Tab names
 tabs = [
@@ -82,8 +46,6 @@ tabs = [
 
 # Tab selection
 selected_sheet = st.selectbox("Product Inventory", tabs)
-# Load the data for the selected tab
-df = load_data(selected_sheet)
 
 # Controlled Drug filter logic with unique key
 # Controlled Drug filter logic with conditional display
@@ -94,11 +56,10 @@ if selected_sheet != "Expired Products":
         controlled_drug_options, 
         key=f"controlled_drug_{selected_sheet}"
     )
-
-    if selected_drugs:
-        df = df[df["ControlledDrug"].isin(selected_drugs)]
+    controlled_drugs = selected_drugs
 else:  # Explicitly disable/hide for Expired Products
     st.write("**Controlled Drug filter not applicable for expired products.")
+    controlled_drugs = None
         
 # Filter based on ControlledDrug flag
 controlled_drug_options = ["2", "3", "4", "5", "N"]
@@ -107,39 +68,47 @@ selected_drugs = st.multiselect("Filter by Controlled Drug", controlled_drug_opt
 # Add a collapsible section for more filters
 more_filters_expander = st.expander("More Filters", expanded=False)
 with more_filters_expander:
-    # Add a search bar to filter by target species
-    search_species = st.text_input("Search by Target Species")
-
-    # Filter DataFrame based on search input
-    if search_species:
-        df = df[df["TargetSpecies"].str.contains(search_species, case=False, na=False)]
-
-    # Add a search bar to filter by Active Substances
-    search_substances = st.text_input("Search by Active Substances")
-
-    # Filter DataFrame based on search input
-    if search_substances:
-        df = df[
-            df["ActiveSubstances"].str.contains(search_substances, case=False, na=False)
-        ]
-
-    # Add a search bar to filter by Therapeutic Group
-    search_th_grp = st.text_input("Search by Therapeutic Group")
-
-    # Filter DataFrame based on search input
-    if search_th_grp:
-        df = df[
-            df["TherapeuticGroup"].str.contains(search_th_grp, case=False, na=False)
-        ]
+    search_index = load_product_search_index(selected_sheet)
+
+    def search_box(label, column):
+        query = st.text_input(label)
+        # Offer the most common words starting with what has been typed
+        suggestions = search_index.suggest(column, query)
+        if query and suggestions:
+            st.caption(f"Suggestions: {', '.join(suggestions)}")
+        return query
+
+    # Add search bars to filter by target species, active substances and therapeutic group
+    search_queries = {
+        "TargetSpecies": search_box("Search by Target Species", "TargetSpecies"),
+        "ActiveSubstances": search_box("Search by Active Substances", "ActiveSubstances"),
+        "TherapeuticGroup": search_box("Search by Therapeutic Group", "TherapeuticGroup"),
+    }
+
+# Load the products matching every filter; each combination is computed once and shared
+# by every session that selects it
+df = load_filtered_products(selected_sheet, controlled_drugs, search_queries)
 
 # Display time-series analysis
 if "DateOfIssue" in df.columns:
-    st.plotly_chart(plot_time_series(df, "DateOfIssue", "Trend Analysis Over Time"))
+    with profiling.span("inventory: time series"):
+        # Built once per sheet version and filter selection, for every session
+        time_series_fig = FIGURES.get_or_build(
+            product_version(selected_sheet),
+            {"sheet": selected_sheet, "controlled_drugs": controlled_drugs, "search_queries": search_queries},
+            plot_time_series,
+            df,
+            "DateOfIssue",
+            "Trend Analysis Over Time",
+        )
+    with profiling.span("emit: plotly_chart"):
+        st.plotly_chart(time_series_fig)
 
 # Display word cloud for Active Substances
 if "ActiveSubstances" in df.columns:
     st.write("Word Cloud for Active Substances")
-    plot_word_cloud(df, "ActiveSubstances")
+    with profiling.span("inventory: word cloud"):
+        plot_word_cloud(df, "ActiveSubstances", selected_sheet)
 
 
 # Define number of rows and columns for each page
@@ -170,6 +139,28 @@ st.session_state.selected_sheet = selected_sheet
 # Display the number of results available
 st.write(f"{len(df)} results available")
 
+# Export every filtered product, serialized a chunk at a time
+with st.expander("Export", expanded=False):
+    export_format = st.selectbox("Format", list(EXPORT_FORMATS), key="products_export_format")
+    # Each session gets its own file, kept until it exports another selection
+    export_selection = (
+        product_version(selected_sheet),
+        selected_sheet,
+        tuple(sorted(controlled_drugs or [])),
+        tuple(sorted(search_queries.items())),
+        export_format,
+    )
+    export_file = session_export("products_export_file", export_selection)
+    exported = export_file is None and st.button(f"Export {len(df)} products", key="products_export")
+    if exported:
+        with st.spinner("Exporting products..."):
+            export_file = export_products(selected_sheet, controlled_drugs, search_queries, export_format)
+        keep_session_export("products_export_file", export_selection, export_file)
+    if export_file is not None:
+        offer_download(
+            export_file, "".join(selected_sheet.split()), export_format, key="products_download", prepared=exported
+        )
+
 # Display the information in a grid of cards
 columns = st.columns(columns_per_page)
 
@@ -212,38 +203,41 @@ if page_number < total_pages:
 st.query_params["page_number"] = page_number
 
 # Loop over each column
-for i, column in enumerate(columns):
-    # Display cards in this column
-    for j in range(rows_per_page):
-        index = i * rows_per_page + j
-        if index < len(df_page):
-            # Display product name above the card
-            with column:
-                # Apply different styling to the product name
-                st.markdown(
-                    f'<h3 style="color: #CA9CE1; font-size: 1.5em;">{df_page["Name"].iloc[index]}</h3>',
-                    unsafe_allow_html=True,
-                )
-
-                # Display product details in two columns
-                col1, col2 = st.columns(2)
-                product_info = (
-                    df_page[columns_to_display[1:]].iloc[index].to_dict()
-                )  # Exclude product name from body
-                for key, value in product_info.items():
-                    # Apply styling to keys
-                    col1.markdown(
-                        f'<span style="color: #F2BEFC;">{pascal_to_space_pascal(key)}:</span>',
+with profiling.span("inventory: product cards"):
+    for i, column in enumerate(columns):
+        # Display cards in this column
+        for j in range(rows_per_page):
+            index = i * rows_per_page + j
+            if index < len(df_page):
+                # Display product name above the card
+                with column:
+                    # Apply different styling to the product name
+                    st.markdown(
+                        f'<h3 style="color: #CA9CE1; font-size: 1.5em;">{df_page["Name"].iloc[index]}</h3>',
                         unsafe_allow_html=True,
                     )
-                    # Apply styling to values
-                    col2.markdown(
-                        f'<span style="font-family: Roboto, sans-serif;">{value}</span>',
-                        unsafe_allow_html=True,
-                    )
-
-                # Close product details container
-                st.markdown("</div>", unsafe_allow_html=True)
 
-                # Add horizontal separator between products
-                st.markdown('<hr style="margin: 20px 0;">', unsafe_allow_html=True)
+                    # Display product details in two columns
+                    col1, col2 = st.columns(2)
+                    product_info = (
+                        df_page[columns_to_display[1:]].iloc[index].to_dict()
+                    )  # Exclude product name from body
+                    for key, value in product_info.items():
+                        # Apply styling to keys
+                        col1.markdown(
+                            f'<span style="color: #F2BEFC;">{pascal_to_space_pascal(key)}:</span>',
+                            unsafe_allow_html=True,
+                        )
+                        # Apply styling to values
+                        col2.markdown(
+                            f'<span style="font-family: Roboto, sans-serif;">{value}</span>',
+                            unsafe_allow_html=True,
+                        )
+
+                    # Close product details container
+                    st.markdown("</div>", unsafe_allow_html=True)
+
+                    # Add horizontal separator between products
+                    st.markdown('<hr style="margin: 20px 0;">', unsafe_allow_html=True)
+
+profiling.finish_rerun()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app and the ETL import their modules from src, as when run with streamlit or python
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
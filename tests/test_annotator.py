@@ -0,0 +1,33 @@
+import pandas as pd
+from modules.utility_functions import AbbreviationAnnotator
+
+ABBREVIATIONS = {"O/E": "On examination", "Hx": "History", "C+": 'Cat "plus" <vaccine>'}
+
+
+def test_annotate_escapes_meanings():
+    annotated = AbbreviationAnnotator(ABBREVIATIONS).annotate("C+ given")
+    assert 'title="Cat &quot;plus&quot; &lt;vaccine&gt;"' in annotated
+    assert "<vaccine>" not in annotated
+
+
+def test_annotate_series_matches_annotate():
+    annotator = AbbreviationAnnotator(ABBREVIATIONS)
+    texts = pd.Series(["O/E bright", "hx of vomiting", "no abbreviations"], index=[7, 3, 5])
+    annotated = annotator.annotate_series(texts, keys=pd.Series([1, 2, 3]), version="v1")
+    assert annotated.index.tolist() == [7, 3, 5]
+    assert annotated.tolist() == [annotator.annotate(text) for text in texts]
+
+
+def test_annotate_series_cache_is_keyed_by_version_and_table():
+    annotator = AbbreviationAnnotator(ABBREVIATIONS)
+    keys = pd.Series([1])
+    first = annotator.annotate_series(pd.Series(["O/E bright"]), keys=keys, version="v1")
+    # Same consult id, rewritten narrative in a refreshed dataset
+    refreshed = annotator.annotate_series(pd.Series(["Hx bright"]), keys=keys, version="v2")
+    assert "History" in refreshed.iloc[0] and "On examination" not in refreshed.iloc[0]
+    # The old version is still served from its own entry
+    assert annotator.annotate_series(pd.Series(["ignored"]), keys=keys, version="v1").equals(first)
+
+    edited = AbbreviationAnnotator({**ABBREVIATIONS, "O/E": "Observed externally"})
+    assert edited.table_hash != annotator.table_hash
+    assert "Observed externally" in edited.annotate_series(pd.Series(["O/E bright"]), keys=keys, version="v1").iloc[0]
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+import pandas as pd
+from modules.bitmap_index import BitmapIndex, all_of, any_of, isin, negate, where
+
+
+@pytest.fixture(scope="module")
+def consultations():
+    rng = np.random.default_rng(8)
+    n_rows = 5000
+    dates = pd.Timestamp("2016-01-01") + pd.to_timedelta(rng.integers(0, 5 * 365, size=n_rows), unit="D")
+    frame = pd.DataFrame(
+        {
+            "Consult_date": dates,
+            "SAVSNET MPC": rng.choice(["vaccination", "trauma", "pruritus", "post_op"], size=n_rows),
+            "Species": rng.choice(["cat", "dog", "rabbit"], size=n_rows),
+        }
+    )
+    # Missing values fall in no bitmap
+    frame.loc[::211, "SAVSNET MPC"] = None
+    frame.loc[::307, "Consult_date"] = pd.NaT
+    return frame
+
+
+def _column(frame, column):
+    if column == "Consult_year":
+        return frame["Consult_date"].dt.year
+    return frame[column]
+
+
+def _mask(frame, spec):
+    # The same spec evaluated with boolean masks over the columns
+    operator = spec[0]
+    if operator == "in":
+        return _column(frame, spec[1]).isin(spec[2]).to_numpy()
+    if operator == "and":
+        mask = np.ones(len(frame), dtype=bool)
+        for part in spec[1:]:
+            mask &= _mask(frame, part)
+        return mask
+    if operator == "or":
+        mask = np.zeros(len(frame), dtype=bool)
+        for part in spec[1:]:
+            mask |= _mask(frame, part)
+        return mask
+    return ~_mask(frame, spec[1])
+
+
+SPECS = [
+    isin("SAVSNET MPC", ["trauma"]),
+    isin("SAVSNET MPC", []),
+    isin("Consult_year", [2017, 2019, 1999]),
+    isin("Species", ["dog", "cat"]),
+    all_of(),
+    any_of(),
+    all_of(isin("Species", ["cat"]), isin("Consult_year", [2018])),
+    any_of(isin("Species", ["rabbit"]), isin("SAVSNET MPC", ["vaccination", "post_op"])),
+    negate(isin("SAVSNET MPC", ["trauma", "pruritus"])),
+    all_of(negate(isin("Species", ["dog"])), any_of(isin("Consult_year", [2016]), negate(all_of()))),
+    where({"SAVSNET MPC": ["pruritus"], "Consult_year": [2020, 2016], "Species": None}),
+    where({}),
+]
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=[str(spec) for spec in SPECS])
+def test_specs_match_boolean_masks(consultations, spec):
+    index = BitmapIndex.from_frame(consultations)
+    expected = _mask(consultations, spec)
+    np.testing.assert_array_equal(index.positions(spec), np.flatnonzero(expected))
+    assert index.count(spec) == expected.sum()
+
+
+def test_specs_are_hashable_and_order_independent():
+    assert isin("Species", ["dog", "cat", "dog"]) == isin("Species", ["cat", "dog"])
+    assert hash(where({"Species": ["cat"], "Consult_year": [2018, 2017]}))
+    with pytest.raises(ValueError):
+        BitmapIndex.from_frame(pd.DataFrame(columns=["Consult_date", "SAVSNET MPC", "Species"])).evaluate(
+            isin("Narrative", ["x"])
+        )
+
+
+@pytest.mark.parametrize("split", [0, 1, 2500, 4999, 5000])
+def test_extend_matches_an_index_of_all_rows(consultations, split):
+    head, tail = consultations.iloc[:split], consultations.iloc[split:].reset_index(drop=True)
+    extended = BitmapIndex.from_frame(head).extend(BitmapIndex.from_frame(tail))
+    whole = BitmapIndex.from_frame(consultations)
+    assert extended.size == whole.size == len(consultations)
+    for column, bitmaps in whole.bitmaps.items():
+        assert extended.bitmaps[column] == bitmaps, column
+    for spec in SPECS:
+        np.testing.assert_array_equal(extended.positions(spec), np.flatnonzero(_mask(consultations, spec)))
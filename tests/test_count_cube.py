@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import pandas as pd
+from modules.count_cube import GRANULARITIES, build_count_cube, build_daily_counts, rollup_counts
+
+GROUPS = ["Species", "Consult_year", "SAVSNET MPC"]
+
+
+@pytest.fixture(scope="module")
+def consultations():
+    rng = np.random.default_rng(4)
+    # Spans several New Years, with weeks that start in one year and end in the next
+    dates = pd.Timestamp("2015-12-20") + pd.to_timedelta(rng.integers(0, 4 * 365 * 24, size=20_000), unit="h")
+    return pd.DataFrame(
+        {
+            "Consult_date": dates,
+            "Species": rng.choice(["cat", "dog", "rabbit"], size=len(dates)),
+            "SAVSNET MPC": rng.choice(["vaccination", "trauma", "pruritus"], size=len(dates)),
+        }
+    )
+
+
+@pytest.mark.parametrize("granularity", list(GRANULARITIES))
+def test_rollups_sum_to_the_daily_counts(consultations, granularity):
+    daily = build_daily_counts(consultations)
+    rollup = rollup_counts(daily, granularity)
+    assert rollup["Counts"].sum() == len(consultations)
+    pd.testing.assert_series_equal(
+        rollup.groupby(GROUPS)["Counts"].sum(), daily.groupby(GROUPS)["Counts"].sum(), check_dtype=False
+    )
+    # Every period ends on or after each day it holds, and within the same year's rows
+    assert (rollup["Period_end"].dt.year >= rollup["Consult_year"]).all()
+
+
+def test_weekly_and_quarterly_periods(consultations):
+    daily = build_daily_counts(consultations)
+    dates = consultations["Consult_date"]
+    weekly = rollup_counts(daily, "Weekly")
+    # Weeks end on Sunday; one spanning New Year is split by year
+    assert (weekly["Period_end"].dt.weekday == 6).all()
+    expected = dates.groupby([dates.dt.year, dates.dt.to_period("W").dt.end_time.dt.normalize()]).size()
+    actual = weekly.groupby(["Consult_year", "Period_end"])["Counts"].sum()
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
+
+    quarterly = rollup_counts(daily, "Quarterly")
+    expected = dates.groupby(dates.dt.to_period("Q").dt.end_time.dt.normalize()).size()
+    actual = quarterly.groupby("Period_end")["Counts"].sum()
+    np.testing.assert_array_equal(actual.index.to_numpy(), expected.index.to_numpy())
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
+
+
+def test_count_cube_quarters_match_the_quarterly_rollup(consultations):
+    cube = build_count_cube(consultations)
+    quarterly = rollup_counts(build_daily_counts(consultations), "Quarterly")
+    np.testing.assert_array_equal(
+        cube.groupby("Quarter_end")["Counts"].sum().to_numpy(),
+        quarterly.groupby("Period_end")["Counts"].sum().to_numpy(),
+    )
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import pandas as pd
+from modules.downsampling import downsample_series, lttb_indices
+
+
+@pytest.mark.parametrize("n, n_out", [(1001, 1000), (5000, 1000), (10_000, 3), (97, 10), (4, 3)])
+def test_lttb_keeps_exactly_n_out_sorted_points(n, n_out):
+    rng = np.random.default_rng(n)
+    y = rng.normal(size=n).cumsum()
+    kept = lttb_indices(np.arange(n), y, n_out)
+    assert len(kept) == n_out
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_peaks():
+    y = np.zeros(10_000)
+    y[4321] = 100.0
+    y[7777] = -50.0
+    kept = lttb_indices(np.arange(len(y)), y, 100)
+    assert 4321 in kept and 7777 in kept
+
+
+def test_short_series_are_kept_whole():
+    np.testing.assert_array_equal(lttb_indices(np.arange(5), np.ones(5), 10), np.arange(5))
+    np.testing.assert_array_equal(lttb_indices([], [], 10), [])
+    with pytest.raises(ValueError):
+        lttb_indices(np.arange(10), np.ones(10), 2)
+
+
+def test_downsample_series_on_dates():
+    days = pd.date_range("2000-01-01", periods=3000, freq="D")
+    frame = pd.DataFrame({"Consult_date": days, "Counts": np.arange(3000) % 17})
+    series = downsample_series(frame, "Consult_date", "Counts", max_points=500)
+    assert len(series) == 500
+    assert series["Consult_date"].is_monotonic_increasing
+    assert series["Consult_date"].iloc[0] == days[0] and series["Consult_date"].iloc[-1] == days[-1]
+    short = frame.head(400)
+    assert downsample_series(short, "Consult_date", "Counts", max_points=500) is short
@@ -0,0 +1,67 @@
+import os
+import time
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+from modules import exports as ex
+
+# A page's export section: export on click, then offer the session's file
+SCRIPT = """
+import pandas as pd
+import streamlit as st
+from modules import exports as ex
+
+selection = ("v1", "CSV")
+export_file = ex.session_export("export_file", selection)
+exported = export_file is None and st.button("Export", key="export")
+if exported:
+    export_file = ex.new_export_path("CSV", {export_dir!r})
+    ex.write_export(ex.frame_chunks(pd.DataFrame({{"Rows": range(1000)}})), "CSV", export_file)
+    ex.keep_session_export("export_file", selection, export_file)
+if export_file is not None:
+    ex.offer_download(export_file, "rows", "CSV", key="download", prepared=exported)
+"""
+
+
+def _buttons(app):
+    return [button.key for button in app.button]
+
+
+def test_download_is_only_drawn_after_a_click(tmp_path):
+    app = AppTest.from_string(SCRIPT.format(export_dir=str(tmp_path)), default_timeout=60).run()
+    assert _buttons(app) == ["export"] and not app.get("download_button")
+
+    app.button(key="export").click().run()
+    export_file = app.session_state["export_file"]["path"]
+    assert pd.read_csv(export_file)["Rows"].tolist() == list(range(1000))
+    assert len(app.get("download_button")) == 1
+
+    # Any other rerun draws the prepare button instead of reading the file again
+    app.run()
+    assert _buttons(app) == ["download_prepare"] and not app.get("download_button")
+    app.button(key="download_prepare").click().run()
+    assert len(app.get("download_button")) == 1
+    assert not app.exception
+
+
+def test_large_exports_are_not_offered(tmp_path, monkeypatch):
+    monkeypatch.setattr(ex, "EXPORT_MAX_DOWNLOAD_BYTES", 100)
+    app = AppTest.from_string(SCRIPT.format(export_dir=str(tmp_path)), default_timeout=60).run()
+    app.button(key="export").click().run()
+    assert not app.get("download_button") and "download_prepare" not in _buttons(app)
+    assert "download limit" in app.warning[0].value
+
+
+def test_sessions_keep_their_export_alive(tmp_path):
+    app = AppTest.from_string(SCRIPT.format(export_dir=str(tmp_path)), default_timeout=60).run()
+    app.button(key="export").click().run()
+    export_file = app.session_state["export_file"]["path"]
+    abandoned = ex.new_export_path("Parquet", str(tmp_path))
+    stale = time.time() - ex.EXPORT_MAX_AGE_SECONDS - 1
+    for filepath in (export_file, abandoned):
+        os.utime(filepath, (stale, stale))
+
+    # The session shows its export again, restarting its age
+    app.run()
+    ex.prune_exports(export_dir=str(tmp_path))
+    assert os.path.exists(export_file)
+    assert not os.path.exists(abandoned)
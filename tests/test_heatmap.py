@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+import pandas as pd
+from modules import chart_functions as cf
+from modules.count_cube import build_count_cube
+from modules.date_time_functions import DAY_NAMES, day_hour_components, day_hour_matrix, hour_label
+
+
+@pytest.fixture
+def consultations():
+    rng = np.random.default_rng(3)
+    dates = pd.Timestamp("2019-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, size=2000), unit="min")
+    frame = pd.DataFrame(
+        {
+            "Consult_date": dates,
+            "Species": rng.choice(["cat", "dog"], size=2000),
+            "SAVSNET MPC": rng.choice(["vaccination", "trauma"], size=2000),
+        }
+    )
+    frame.loc[::97, "Consult_date"] = pd.NaT
+    return frame
+
+
+def _groupby_matrix(frame, start_hour, end_hour):
+    dates = frame["Consult_date"].dropna()
+    dates = dates[(dates.dt.hour >= start_hour) & (dates.dt.hour <= end_hour)]
+    counts = dates.groupby([dates.dt.day_name(), dates.dt.hour]).size().unstack(fill_value=0)
+    counts = counts.reindex(index=DAY_NAMES, columns=range(start_hour, end_hour + 1), fill_value=0)
+    counts.columns = [hour_label(hour) for hour in counts.columns]
+    return counts
+
+
+@pytest.mark.parametrize("start_hour, end_hour", [(8, 20), (0, 23), (13, 13)])
+def test_day_hour_matrix_matches_groupby(consultations, start_hour, end_hour):
+    weekdays, hours = day_hour_components(consultations["Consult_date"])
+    matrix = day_hour_matrix(weekdays, hours, start_hour=start_hour, end_hour=end_hour)
+    expected = _groupby_matrix(consultations, start_hour, end_hour)
+    np.testing.assert_array_equal(matrix.to_numpy(), expected.to_numpy())
+    assert matrix.index.tolist() == DAY_NAMES
+    assert matrix.columns.tolist() == expected.columns.tolist()
+
+
+def test_heatmap_does_not_mutate_its_input(consultations):
+    before = consultations.copy()
+    cf.plot_consultation_heatmap(consultations)
+    pd.testing.assert_frame_equal(consultations, before)
+
+    cube = build_count_cube(consultations.dropna())
+    before = cube.copy()
+    figure, _ = cf.plot_consultation_heatmap(cube, count_column="Counts")
+    pd.testing.assert_frame_equal(cube, before)
+    # The cube path counts the same consultations as the row path
+    np.testing.assert_array_equal(np.asarray(figure.data[0].z), _groupby_matrix(consultations, 8, 20).to_numpy())
+
+
+@pytest.mark.parametrize("start_hour, end_hour", [(20, 8), (-1, 10), (8, 24), (8.5, 20), (None, 20)])
+def test_invalid_hour_windows_raise(consultations, start_hour, end_hour):
+    weekdays, hours = day_hour_components(consultations["Consult_date"])
+    with pytest.raises(ValueError):
+        day_hour_matrix(weekdays, hours, start_hour=start_hour, end_hour=end_hour)
+    with pytest.raises(ValueError):
+        cf.plot_consultation_heatmap(consultations, start_hour=start_hour, end_hour=end_hour)
@@ -0,0 +1,116 @@
+import os
+import pytest
+import pandas as pd
+from modules.columnar_store import CONSULTATION_STORE, read_consultation_store
+from modules.count_cube import COUNT_CUBE_FILE, DAILY_COUNTS_FILE, read_count_cube
+from modules.manifest import MANIFEST_FILE, read_manifest
+from benchmarks.synthetic_data import generate_consultations
+from etl import data_cleaning
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Rows of the extract the first, full run sees; the incremental run gets the whole extract
+PREFIX_ROWS = 1200
+
+
+@pytest.fixture(scope="module")
+def extract():
+    raw = generate_consultations(
+        2000, seed=11, abbreviations_file=os.path.join(REPO_DIR, "data", "raw", "commonly_used_terms.json")
+    )
+    # New rows on the last date of the prefix, with higher ids: they sit right after the watermark
+    raw.loc[PREFIX_ROWS : PREFIX_ROWS + 4, "Consult_date"] = raw.loc[PREFIX_ROWS - 1, "Consult_date"]
+    # Ids seen in the prefix again, later and with another narrative; the first row seen is kept
+    repeated = raw.iloc[[5, 600, PREFIX_ROWS - 1]].assign(
+        Consult_date=raw["Consult_date"].iloc[-1], Narrative="seen again"
+    )
+    # And an id repeated within the new rows
+    repeated_new = raw.iloc[[PREFIX_ROWS + 10]].assign(Narrative="seen again")
+    return raw.iloc[:PREFIX_ROWS], pd.concat([raw, repeated, repeated_new], ignore_index=True)
+
+
+def _dirs(root):
+    output_dir, store_dir = str(root / "cleaned"), str(root / "store")
+    os.makedirs(output_dir)
+    return output_dir, store_dir
+
+
+def _sorted(frame, columns):
+    frame = frame.astype({column: str for column in frame.columns if str(frame[column].dtype) == "category"})
+    return frame.sort_values(columns).reset_index(drop=True)
+
+
+def assert_same_outputs(expected_dirs, actual_dirs):
+    (expected_output, expected_store), (actual_output, actual_store) = expected_dirs, actual_dirs
+    for filename in data_cleaning.SPECIES_OUTPUTS.values():
+        expected = pd.read_csv(os.path.join(expected_output, filename))
+        actual = pd.read_csv(os.path.join(actual_output, filename))
+        pd.testing.assert_frame_equal(
+            _sorted(expected, ["SAVSNET_consult_id"]), _sorted(actual, ["SAVSNET_consult_id"]), obj=filename
+        )
+
+    def store_file(store_dir, default_path):
+        return data_cleaning.store_path(store_dir, default_path)
+
+    expected = read_consultation_store(store_file(expected_store, CONSULTATION_STORE))
+    actual = read_consultation_store(store_file(actual_store, CONSULTATION_STORE))
+    pd.testing.assert_frame_equal(
+        _sorted(expected, ["SAVSNET_consult_id"]), _sorted(actual, ["SAVSNET_consult_id"]), check_dtype=False
+    )
+    for cube_file in (COUNT_CUBE_FILE, DAILY_COUNTS_FILE):
+        expected = read_count_cube(store_file(expected_store, cube_file))
+        actual = read_count_cube(store_file(actual_store, cube_file))
+        dimensions = [column for column in expected.columns if column != "Counts"]
+        pd.testing.assert_frame_equal(
+            _sorted(expected, dimensions), _sorted(actual, dimensions), check_dtype=False, obj=cube_file
+        )
+
+    expected = read_manifest(store_file(expected_store, MANIFEST_FILE))
+    actual = read_manifest(store_file(actual_store, MANIFEST_FILE))
+    for species in data_cleaning.SPECIES_OUTPUTS:
+        # The content hash of an appended dataset is chained, so it differs from a rebuild's by design
+        expected[species].pop("content_hash")
+        actual[species].pop("content_hash")
+        assert expected[species] == actual[species], species
+    assert data_cleaning.read_watermark(
+        store_file(expected_store, data_cleaning.WATERMARK_FILE)
+    ) == data_cleaning.read_watermark(store_file(actual_store, data_cleaning.WATERMARK_FILE))
+
+
+def test_incremental_update_matches_full_rebuild(extract, tmp_path):
+    prefix, whole = extract
+    expected_dirs = _dirs(tmp_path / "full")
+    data_cleaning.full_rebuild(data_cleaning.clean_data(whole), *expected_dirs)
+
+    actual_dirs = _dirs(tmp_path / "incremental")
+    data_cleaning.full_rebuild(data_cleaning.clean_data(prefix), *actual_dirs)
+    appended = data_cleaning.incremental_update(data_cleaning.clean_data(whole), *actual_dirs)
+    assert sum(len(rows) for rows in appended.values()) == len(data_cleaning.clean_data(whole)) - PREFIX_ROWS
+    assert_same_outputs(expected_dirs, actual_dirs)
+
+    # Running again on the same extract appends nothing
+    appended = data_cleaning.incremental_update(data_cleaning.clean_data(whole), *actual_dirs)
+    assert sum(len(rows) for rows in appended.values()) == 0
+    assert_same_outputs(expected_dirs, actual_dirs)
+
+
+def test_incremental_update_recovers_from_an_interrupted_run(extract, tmp_path, monkeypatch):
+    prefix, whole = extract
+    expected_dirs = _dirs(tmp_path / "full")
+    data_cleaning.full_rebuild(data_cleaning.clean_data(whole), *expected_dirs)
+
+    actual_dirs = _dirs(tmp_path / "incremental")
+    data_cleaning.full_rebuild(data_cleaning.clean_data(prefix), *actual_dirs)
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    # Stops the run after the CSVs were appended, before the store and the watermark were updated
+    with monkeypatch.context() as patch:
+        patch.setattr(data_cleaning, "append_consultation_store", crash)
+        with pytest.raises(OSError):
+            data_cleaning.incremental_update(data_cleaning.clean_data(whole), *actual_dirs)
+
+    data_cleaning.incremental_update(data_cleaning.clean_data(whole), *actual_dirs)
+    assert_same_outputs(expected_dirs, actual_dirs)
+    assert not os.path.exists(data_cleaning.store_path(actual_dirs[1], data_cleaning.PENDING_FILE))
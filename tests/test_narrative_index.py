@@ -0,0 +1,131 @@
+import os
+import math
+import numpy as np
+import pytest
+import pandas as pd
+from modules import narrative_index as ni
+from modules.row_index import build_row_index
+
+# Lengths in tokens: 4, 3, 3, 3, 6, 4
+NARRATIVES = [
+    "Lame right fore limb",
+    "lame lame lame",
+    "vomiting since monday",
+    "RF swollen, lame",
+    "meloxicam given for lameness and stiffness",
+    "right fore lame, meloxicam",
+]
+
+SYNONYMS = ni.synonyms_from_abbreviations({"RF": "Right fore", "V+": "Vomiting (acute)"})
+
+
+def _write(csv_path, narratives, first_id=0, mode="w"):
+    frame = pd.DataFrame(
+        {
+            "SAVSNET_consult_id": first_id + np.arange(len(narratives)),
+            "Narrative": narratives,
+            "SAVSNET MPC": "trauma",
+        }
+    )
+    frame.to_csv(csv_path, mode=mode, header=mode == "w", index=False)
+
+
+def _build(csv_path, tmp_path, **kwargs):
+    row_index_dir, index_dir = str(tmp_path / "row_index"), str(tmp_path / "narrative_index")
+    build_row_index(csv_path, index_dir=row_index_dir)
+    ni.build_narrative_index(csv_path, index_dir=index_dir, row_index_dir=row_index_dir, **kwargs)
+    return index_dir
+
+
+@pytest.fixture
+def indexed_csv(tmp_path):
+    csv_path = str(tmp_path / "consultations.csv")
+    _write(csv_path, NARRATIVES)
+    return csv_path, _build(csv_path, tmp_path)
+
+
+@pytest.fixture
+def index(indexed_csv):
+    return ni.NarrativeIndex(indexed_csv[0], SYNONYMS, indexed_csv[1])
+
+
+def _ranked(index, query):
+    return index.search(query)[0].tolist()
+
+
+def test_bm25_ranks_by_term_count_then_length(index):
+    # Three occurrences beat one; among single occurrences the shortest row wins, ties in file order
+    assert _ranked(index, "lame") == [1, 3, 0, 5]
+    _, scores = index.search("LAME")
+    assert np.all(np.diff(scores) <= 0)
+
+    average_length = sum(len(ni.tokenize_narrative(text)) for text in NARRATIVES) / len(NARRATIVES)
+    idf = math.log(1 + (6 - 4 + 0.5) / (4 + 0.5))
+    norm = 1 - ni.BM25_B + ni.BM25_B * 3 / average_length
+    assert scores[0] == pytest.approx(idf * 3 * (ni.BM25_K1 + 1) / (3 + ni.BM25_K1 * norm))
+
+
+def test_phrases_and_synonyms(indexed_csv, index):
+    # "RF" and "right fore" match each other, quoted or not; the three-token row ranks first
+    assert _ranked(index, '"right fore"') == [3, 0, 5]
+    assert _ranked(index, "right fore") == [3, 0, 5]
+    assert _ranked(index, "rf") == [3, 0, 5]
+    # Without synonyms a phrase needs its words adjacent and in order
+    plain = ni.NarrativeIndex(indexed_csv[0], index_dir=indexed_csv[1])
+    assert _ranked(plain, '"right fore"') == [0, 5]
+    assert _ranked(plain, '"fore right"') == []
+    # Parenthesized words of a meaning are left out of its synonym
+    assert _ranked(index, "v+") == [2]
+
+
+def test_prefix_queries(index):
+    # Same count, so the shorter row comes first
+    assert _ranked(index, "melox*") == [5, 4]
+    # A bare word without an exact match falls back to a prefix
+    assert _ranked(index, "lamen") == [4]
+    assert _ranked(index, "lame*")[0] == 1 and sorted(_ranked(index, "lame*")) == [0, 1, 3, 4, 5]
+    # Every clause must match
+    assert _ranked(index, "lame melox*") == [5]
+    assert _ranked(index, "lame zebra") == []
+
+
+def test_queries_without_words(index):
+    assert index.search("") is None
+    assert index.search('!! "" *') is None
+
+
+def test_appended_segment_ranks_like_a_rebuild(tmp_path):
+    csv_path = str(tmp_path / "consultations.csv")
+    _write(csv_path, NARRATIVES[:3])
+    _build(csv_path, tmp_path)
+    _write(csv_path, NARRATIVES[3:], first_id=3, mode="a")
+    index_dir = _build(csv_path, tmp_path)
+    appended = ni.NarrativeIndex(csv_path, SYNONYMS, index_dir)
+    assert len(appended.segments) == 2
+
+    rebuilt_dir = str(tmp_path / "rebuilt")
+    ni.build_narrative_index(csv_path, index_dir=rebuilt_dir, row_index_dir=str(tmp_path / "row_index"))
+    rebuilt = ni.NarrativeIndex(csv_path, SYNONYMS, rebuilt_dir)
+    for query in ["lame", '"right fore"', "melox*", "lame melox*"]:
+        for left, right in zip(appended.search(query), rebuilt.search(query)):
+            np.testing.assert_allclose(left, right)
+
+
+def test_retired_segments_are_swept_on_load(tmp_path, monkeypatch):
+    csv_path = str(tmp_path / "consultations.csv")
+    _write(csv_path, NARRATIVES[:3])
+    _build(csv_path, tmp_path)
+    _write(csv_path, NARRATIVES[3:], first_id=3, mode="a")
+    _build(csv_path, tmp_path)
+    index_dir = _build(csv_path, tmp_path, rebuild=True)
+    directory = os.path.join(index_dir, "consultations")
+    meta = ni._read_meta(directory)
+    assert len(meta["segments"]) == 1 and len(meta["retired"]) == 2
+    # Still in their grace period: a reader of the previous meta.json can open them
+    ni.NarrativeIndex(csv_path, SYNONYMS, index_dir)
+    assert all(os.path.isdir(os.path.join(directory, name)) for name in meta["retired"])
+
+    monkeypatch.setattr(ni, "SEGMENT_GRACE_SECONDS", 0)
+    index = ni.NarrativeIndex(csv_path, SYNONYMS, index_dir)
+    assert not any(os.path.exists(os.path.join(directory, name)) for name in meta["retired"])
+    assert _ranked(index, "lame") == [1, 3, 0, 5]
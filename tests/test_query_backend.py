@@ -0,0 +1,151 @@
+import os
+import importlib
+import pytest
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+from modules import data_access as da
+from modules import query_backend as qb
+from modules.count_cube import GRANULARITIES
+from modules.snapshots import Snapshot, pin_snapshot
+from modules.view_store import VIEWS
+from benchmarks.synthetic_data import generate_consultations
+from etl import data_cleaning
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SPECIES = [None, "Cats", "Dogs", "Other Species"]
+
+ENGINES = [
+    "sqlite",
+    pytest.param("duckdb", marks=pytest.mark.skipif(qb.duckdb is None, reason="duckdb is not installed")),
+]
+
+
+@pytest.fixture(scope="module")
+def snapshot(tmp_path_factory):
+    # A small snapshot of synthetic consultations, written by the ETL's full rebuild
+    root = tmp_path_factory.mktemp("snapshot")
+    data_dir, store_dir = str(root / "cleaned"), str(root / "store")
+    os.makedirs(data_dir)
+    consultations = generate_consultations(
+        3000, seed=7, abbreviations_file=os.path.join(REPO_DIR, "data", "raw", "commonly_used_terms.json")
+    )
+    data = data_cleaning.clean_data(consultations)
+    data_cleaning.full_rebuild(data, output_dir=data_dir, store_dir=store_dir)
+    return Snapshot("fixture", data_dir, store_dir), data
+
+
+def _filters(data):
+    years = sorted(data["Consult_date"].dt.year.unique().tolist())
+    mpc_types = sorted(data["SAVSNET MPC"].dropna().astype(str).unique().tolist())
+    year_choices = [None, years[-1:], years[:2], []]
+    mpc_choices = [None, mpc_types[:1], mpc_types[1:4], []]
+    return [
+        (species, years, mpc)
+        for species in SPECIES
+        for years in year_choices
+        for mpc in mpc_choices
+    ]
+
+
+def _normalized(frame):
+    # Same rows in the same order, whatever the categorical or integer widths of either path
+    integers = [column for column in ["Consult_year", "Weekday", "Hour", "Counts"] if column in frame.columns]
+    frame = frame.astype({"Species": str, "SAVSNET MPC": str, **{column: "int64" for column in integers}})
+    dimensions = [column for column in frame.columns if column != "Counts"]
+    return frame.sort_values(dimensions).reset_index(drop=True)
+
+
+def _key(values):
+    return None if values is None else tuple(values)
+
+
+def _load_rollups(data):
+    return {
+        (granularity, species, _key(years), _key(mpc)): da.load_count_rollup(granularity, species, years, mpc)
+        for granularity in GRANULARITIES
+        for species, years, mpc in _filters(data)
+    }
+
+
+def _load_cubes(data):
+    return {
+        (species, _key(years), _key(mpc)): da.load_count_cube(species, years, mpc)
+        for species, years, mpc in _filters(data)
+    }
+
+
+def _load_with_both_backends(snapshot, engine, monkeypatch, load):
+    # Loads every selection through the pandas path, then through the SQL backend
+    fixture, data = snapshot
+    pin_snapshot(fixture)
+    VIEWS.clear()
+    try:
+        monkeypatch.delenv("DASHBOARD_QUERY_BACKEND", raising=False)
+        importlib.reload(qb)
+        assert qb.QUERY_BACKEND == "pandas"
+        expected = load(data)
+
+        monkeypatch.setenv("DASHBOARD_QUERY_BACKEND", "sql")
+        importlib.reload(qb)
+        monkeypatch.setattr(qb, "SQL_ENGINE", engine)
+        monkeypatch.setattr(qb, "SQL_DATABASE_FILE", os.path.join(qb.STORE_DIR, f"consultations.{engine}"))
+        assert qb.QUERY_BACKEND == "sql"
+        actual = load(data)
+    finally:
+        monkeypatch.delenv("DASHBOARD_QUERY_BACKEND", raising=False)
+        importlib.reload(qb)
+        pin_snapshot()
+        VIEWS.clear()
+    return expected, actual
+
+
+def assert_same_counts(expected, actual):
+    assert expected.keys() == actual.keys()
+    for selection, frame in expected.items():
+        assert list(frame.columns) == list(actual[selection].columns), selection
+        pd.testing.assert_frame_equal(_normalized(frame), _normalized(actual[selection]), obj=str(selection))
+    # The fixture must exercise real data, not only empty selections
+    assert sum(frame["Counts"].sum() for frame in expected.values()) > 0
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_count_rollup_matches_between_backends(snapshot, engine, monkeypatch):
+    assert_same_counts(*_load_with_both_backends(snapshot, engine, monkeypatch, _load_rollups))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_count_cube_matches_between_backends(snapshot, engine, monkeypatch):
+    assert_same_counts(*_load_with_both_backends(snapshot, engine, monkeypatch, _load_cubes))
+
+
+def test_sql_database_follows_the_backend_settings(snapshot, monkeypatch):
+    fixture, _ = snapshot
+    # st.cache_resource only caches inside a running app
+    script = f"""
+import os
+import streamlit as st
+from modules import data_access as da
+from modules import query_backend as qb
+from modules.snapshots import Snapshot, pin_snapshot
+
+pin_snapshot(Snapshot(*{tuple(fixture)!r}))
+qb.SQL_ENGINE = "sqlite"
+qb.SQL_DATABASE_FILE = os.path.join(qb.STORE_DIR, "consultations.sqlite")
+_, first = da.load_query_backend()
+# Another database file within the same process must not be served from the cache
+qb.SQL_DATABASE_FILE = os.path.join(qb.STORE_DIR, "renamed.sqlite")
+backend, second = da.load_query_backend()
+st.text(first)
+st.text(second)
+st.text(backend.filepath)
+"""
+    # Restored once the test is done, whatever the script sets them to
+    monkeypatch.setattr(qb, "SQL_ENGINE", qb.SQL_ENGINE)
+    monkeypatch.setattr(qb, "SQL_DATABASE_FILE", qb.SQL_DATABASE_FILE)
+    app = AppTest.from_string(script, default_timeout=60).run()
+    assert not app.exception
+    first, second, filepath = [element.value for element in app.text]
+    assert first != second
+    assert filepath == os.path.join(fixture.store_dir, "renamed.sqlite")
+    assert os.path.exists(filepath)
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from modules.snapshots import SNAPSHOT_META, current_snapshot, swap_current
+
+# refresh.py imports its sibling ETL scripts by module name, as when run from src/etl
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "etl"))
+import refresh  # noqa: E402
+
+
+class StopWatching(Exception):
+    pass
+
+
+@pytest.fixture
+def snapshots(tmp_path, monkeypatch):
+    root = str(tmp_path / "snapshots")
+    for directory in ("cleaned", "store"):
+        os.makedirs(os.path.join(root, "base", directory))
+    with open(os.path.join(root, "base", "cleaned", "products.csv"), "w") as file:
+        file.write("Name\nold\n")
+    with open(os.path.join(root, "base", SNAPSHOT_META), "w") as meta_file:
+        json.dump({"sources": {}}, meta_file)
+    swap_current("base", root)
+
+    raw_file = str(tmp_path / "raw.xlsx")
+    with open(raw_file, "wb") as file:
+        file.write(b"not a workbook")
+    monkeypatch.setattr(refresh, "RAW_FILES", {"consultations": raw_file})
+
+    # Every build fails while reading the workbook, after the staging directory was created
+    reads = []
+
+    def read_workbook(*args, **kwargs):
+        reads.append(args)
+        raise ValueError("bad workbook")
+
+    monkeypatch.setattr(refresh, "read_workbook", read_workbook)
+    return root, raw_file, reads
+
+
+def _entries(root):
+    return sorted(entry for entry in os.listdir(root) if os.path.isdir(os.path.join(root, entry)))
+
+
+def test_failed_build_removes_its_staging_directory(snapshots):
+    root, _, reads = snapshots
+    changed = refresh.changed_sources({"consultations": [0, 0]}, {})
+    with pytest.raises(ValueError):
+        refresh.build_snapshot(changed, root)
+    assert len(reads) == 1
+    assert _entries(root) == ["base"]
+
+
+def test_watch_survives_failed_refreshes(snapshots, monkeypatch, capsys):
+    root, raw_file, reads = snapshots
+    # Left behind by a worker process that died mid-build
+    os.makedirs(os.path.join(root, "20240101T000000000000.tmp", "cleaned"))
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 4:
+            with open(raw_file, "ab") as file:
+                file.write(b", fixed")
+        if len(sleeps) == 7:
+            raise StopWatching
+
+    monkeypatch.setattr(refresh.time, "sleep", sleep)
+    with pytest.raises(StopWatching):
+        refresh.watch(interval=0, root=root, make_executor=lambda: ThreadPoolExecutor(max_workers=1))
+
+    # Polls 2 and 6 see stable files; the failed files are not built again on polls 3 and 4
+    assert len(reads) == 2
+    assert _entries(root) == ["base"]
+    assert current_snapshot(root).name == "base"
+    assert "refresh failed" in capsys.readouterr().err
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+import pandas as pd
+from modules.row_index import (
+    RowOffsetReader,
+    build_row_index,
+    read_rows_from,
+    row_index_is_current,
+    row_prefix_state,
+)
+
+# Narratives with the quoting a CSV writer produces: embedded newlines, doubled quotes,
+# separators inside quotes, and a quote right before a newline
+TRICKY_NARRATIVES = [
+    "plain narrative",
+    'owner said "eating well"\nno vomiting',
+    "line one\nline two\n\nline four",
+    '"quoted at both ends"',
+    'comma, inside, quotes and a "quote"\n',
+    "\n",
+    '""',
+    "",
+    "trailing backslash \\",
+]
+
+
+def _frame(n_rows, first_id=0, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "SAVSNET_consult_id": first_id + np.arange(n_rows),
+            "Narrative": [TRICKY_NARRATIVES[i] for i in rng.integers(0, len(TRICKY_NARRATIVES), size=n_rows)],
+            "SAVSNET MPC": rng.choice(["vaccination", "trauma", "post_op"], size=n_rows),
+        }
+    )
+
+
+def _expected(csv_path):
+    return pd.read_csv(csv_path, dtype={"Narrative": str})
+
+
+@pytest.fixture
+def indexed_csv(tmp_path):
+    csv_path = str(tmp_path / "consultations.csv")
+    _frame(300).to_csv(csv_path, index=False)
+    index_dir = str(tmp_path / "row_index")
+    build_row_index(csv_path, index_dir=index_dir)
+    return csv_path, index_dir
+
+
+def test_read_rows_matches_read_csv(indexed_csv):
+    csv_path, index_dir = indexed_csv
+    expected = _expected(csv_path)
+    reader = RowOffsetReader(csv_path, index_dir=index_dir)
+    assert len(reader) == len(expected)
+
+    positions = np.random.default_rng(1).permutation(len(expected))[:120]
+    pd.testing.assert_frame_equal(reader.read_rows(positions), expected.iloc[positions].reset_index(drop=True))
+    pd.testing.assert_frame_equal(reader.read_rows(np.arange(len(expected))), expected)
+
+
+def test_read_rows_from_matches_read_csv(indexed_csv):
+    csv_path, index_dir = indexed_csv
+    expected = _expected(csv_path)
+    for first_row in (0, 1, 157, len(expected) - 1):
+        # Typed as the narrative index reads them, so a slice of only empty narratives stays text
+        rows = read_rows_from(
+            csv_path, first_row, ["SAVSNET_consult_id", "Narrative"], index_dir=index_dir, dtype={"Narrative": str}
+        )
+        pd.testing.assert_frame_equal(
+            rows, expected.iloc[first_row:][["SAVSNET_consult_id", "Narrative"]].reset_index(drop=True)
+        )
+    assert read_rows_from(csv_path, len(expected), ["Narrative"], index_dir=index_dir).empty
+
+
+def test_positions_by_category(indexed_csv):
+    csv_path, index_dir = indexed_csv
+    expected = _expected(csv_path)
+    reader = RowOffsetReader(csv_path, index_dir=index_dir)
+    np.testing.assert_array_equal(
+        reader.positions(["trauma", "post_op"]),
+        np.flatnonzero(expected["SAVSNET MPC"].isin(["trauma", "post_op"]).to_numpy()),
+    )
+
+
+def test_append_extends_the_index(indexed_csv, tmp_path):
+    csv_path, index_dir = indexed_csv
+    before = row_prefix_state(csv_path, index_dir=index_dir)
+    _frame(80, first_id=300, seed=2).to_csv(csv_path, mode="a", header=False, index=False)
+    assert not row_index_is_current(csv_path, index_dir=index_dir)
+
+    build_row_index(csv_path, index_dir=index_dir)
+    assert row_index_is_current(csv_path, index_dir=index_dir)
+    rebuilt_dir = str(tmp_path / "rebuilt")
+    build_row_index(csv_path, index_dir=rebuilt_dir, rebuild=True)
+    appended = RowOffsetReader(csv_path, index_dir=index_dir)
+    rebuilt = RowOffsetReader(csv_path, index_dir=rebuilt_dir)
+    np.testing.assert_array_equal(appended.offsets, rebuilt.offsets)
+    np.testing.assert_array_equal(
+        np.asarray(appended.categories, dtype=object)[appended.codes],
+        np.asarray(rebuilt.categories, dtype=object)[rebuilt.codes],
+    )
+
+    # The rows indexed before the append are described exactly as they were then
+    assert row_prefix_state(csv_path, before["rows"], index_dir=index_dir) == before
+    after = row_prefix_state(csv_path, index_dir=index_dir)
+    assert after["rows"] == before["rows"] + 80 and after["size"] > before["size"]
+    assert row_prefix_state(csv_path, after["rows"] + 1, index_dir=index_dir) is None
+
+    expected = _expected(csv_path)
+    pd.testing.assert_frame_equal(appended.read_rows(np.arange(len(expected))), expected)
+    rows = read_rows_from(csv_path, before["rows"], ["SAVSNET_consult_id"], index_dir=index_dir)
+    assert rows["SAVSNET_consult_id"].tolist() == list(range(300, 380))
+
+
+def test_rewritten_file_is_reindexed(indexed_csv):
+    csv_path, index_dir = indexed_csv
+    # Same size or larger, but the last indexed row changed: not an append
+    _frame(310, seed=9).to_csv(csv_path, index=False)
+    build_row_index(csv_path, index_dir=index_dir)
+    expected = _expected(csv_path)
+    reader = RowOffsetReader(csv_path, index_dir=index_dir)
+    pd.testing.assert_frame_equal(reader.read_rows(np.arange(len(expected))), expected)
+
+
+def test_file_without_trailing_newline(tmp_path):
+    csv_path = str(tmp_path / "consultations.csv")
+    text = _frame(40).to_csv(index=False)
+    with open(csv_path, "w", newline="") as file:
+        file.write(text.rstrip("\n"))
+    index_dir = str(tmp_path / "row_index")
+    build_row_index(csv_path, index_dir=index_dir)
+    expected = _expected(csv_path)
+    reader = RowOffsetReader(csv_path, index_dir=index_dir)
+    pd.testing.assert_frame_equal(
+        reader.read_rows(np.arange(len(expected))[::-1]), expected.iloc[::-1].reset_index(drop=True)
+    )
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import pandas as pd
+from modules.search_index import DENSE_TOKEN_SHARE, SearchIndex, tokenize
+from benchmarks.synthetic_data import generate_products
+
+COLUMNS = ["Name", "ActiveSubstances", "TargetSpecies"]
+
+
+@pytest.fixture(scope="module")
+def products():
+    return next(iter(generate_products(3000, seed=5).values())).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def index(products):
+    return SearchIndex(products, COLUMNS)
+
+
+def _contains_every_word(products, column, query):
+    # The page's former filter, applied to each word of the query
+    rows = np.ones(len(products), dtype=bool)
+    for word in tokenize(query):
+        rows &= products[column].str.contains(word, case=False, na=False, regex=False).to_numpy()
+    return rows
+
+
+@pytest.mark.parametrize(
+    "column, query",
+    [
+        ("ActiveSubstances", "meloxicam"),
+        ("ActiveSubstances", "cillin"),
+        ("ActiveSubstances", "Amoxicillin, Clavulanic"),
+        ("Name", "tab"),
+        ("Name", "injection"),
+        ("TargetSpecies", "dogs cats"),
+        ("TargetSpecies", "CATTLE"),
+        ("TargetSpecies", "zebra"),
+    ],
+)
+def test_match_finds_words_anywhere_in_a_token(products, index, column, query):
+    expected = _contains_every_word(products, column, query)
+    np.testing.assert_array_equal(index.match(column, query), expected)
+
+
+def test_search_intersects_fields(products, index):
+    queries = {"Name": "tab", "ActiveSubstances": "melox", "TargetSpecies": "dogs"}
+    expected = np.ones(len(products), dtype=bool)
+    for column, query in queries.items():
+        expected &= _contains_every_word(products, column, query)
+    np.testing.assert_array_equal(index.search(queries), np.flatnonzero(expected))
+    assert len(index.search(queries)) > 0
+
+
+def test_blank_and_punctuation_queries(products, index):
+    assert len(index.search({"Name": "", "TargetSpecies": "   "})) == len(products)
+    assert len(index.search({"Name": "!!"})) == 0
+    assert not index.match("Name", "-/-").any()
+    assert not index.match("NotIndexed", "dogs").any()
+
+
+def test_frequent_tokens_are_stored_as_bitmaps(index):
+    for column in COLUMNS:
+        for token, posting in index.postings[column].items():
+            frequent = index.frequencies[column][token] >= max(1, int(index.size * DENSE_TOKEN_SHARE))
+            if frequent:
+                assert posting.dtype == np.uint8 and len(posting) == (index.size + 7) // 8
+            else:
+                assert posting.dtype == np.int32 and np.all(np.diff(posting) > 0)
+
+    small = SearchIndex(pd.DataFrame({"Name": ["rare dog"] + ["dog"] * 99}), ["Name"])
+    assert small.postings["Name"]["rare"].dtype == np.int32
+    assert small.postings["Name"]["dog"].dtype == np.uint8
+    np.testing.assert_array_equal(small.search({"Name": "dog"}), np.arange(100))
+    np.testing.assert_array_equal(small.search({"Name": "are do"}), [0])
+
+
+def test_suggest_ranks_by_frequency(index):
+    suggestions = index.suggest("ActiveSubstances", "m")
+    assert suggestions
+    counts = [index.frequencies["ActiveSubstances"][token] for token in suggestions]
+    assert counts == sorted(counts, reverse=True)
+    assert all(token.startswith("m") for token in suggestions)
+    assert index.suggest("ActiveSubstances", "...") == []
+
+
+def test_empty_frame():
+    index = SearchIndex(pd.DataFrame({"Name": pd.Series([], dtype=object)}), ["Name"])
+    assert len(index.search({"Name": "dog"})) == 0